@@ -4,6 +4,9 @@ if (!window.mcpAgentInjected) {
   const EXTENSION_UI_ID = "mcp-ui";
   const SHOULD_RENDER_UI = (window.top === window.self) && (window.innerWidth >= 320 && window.innerHeight >= 220);
   const MAX_STEPS = 10;
+  // 액션 묶음: 후속 액션 사이 대기 / 가드 조건 확인 대기 (ms)
+  const ACTION_CHAIN_DELAY_MS = 400;
+  const GUARD_WAIT_MS = 1500;
   
   // 와이어프레임 설정 관리
   async function getWireframeSettings() {
@@ -294,6 +297,8 @@ if (!window.mcpAgentInjected) {
         step: this.step,
         plan: this.currentPlan,
         lastAction: this.actionHistory[this.actionHistory.length - 1] || null,
+        url: window.location.href,
+        viewport: { top: Math.round(window.scrollY), height: window.innerHeight || 0 },
         conversationHistory: this.conversationHistory.slice(-5), // 최근 5개만
         totalActions: this.actionHistory.length
       };
@@ -325,9 +330,155 @@ if (!window.mcpAgentInjected) {
   }
 
   let ws = null;
+
+  // === DOM 델타 동기화 ===
+  // 서버가 확인(dom_ack)한 버전 기준으로 추가/삭제/변경된 요소만 전송
+  const domSync = {
+    version: 0,        // 마지막으로 보낸 버전
+    ackedVersion: null, // 서버가 보관 중인 버전
+    acked: null,       // 서버가 보관 중인 DOM (key → element)
+    pending: {}        // 전송 후 ack 대기 중인 DOM (version → Map)
+  };
+
+  function resetDomSync() {
+    domSync.ackedVersion = null;
+    domSync.acked = null;
+    domSync.pending = {};
+  }
+
+  // 요소 키: "<selector>::<같은 selector 등장 순번>" (server/dom_delta.py 와 동일 규칙)
+  function keyDom(dom) {
+    const seen = {};
+    const keyed = new Map();
+    for (const el of dom) {
+      const selector = el.selector || el.tag || 'unknown';
+      const n = seen[selector] || 0;
+      seen[selector] = n + 1;
+      keyed.set(`${selector}::${n}`, el);
+    }
+    return keyed;
+  }
+
+  function buildDomPayload(dom) {
+    const version = ++domSync.version;
+    const keyed = keyDom(dom);
+    domSync.pending[version] = keyed;
+
+    if (domSync.acked && domSync.ackedVersion !== null) {
+      const added = [];
+      const changed = [];
+      const removed = [];
+      let index = 0;
+      for (const [key, el] of keyed) {
+        if (!domSync.acked.has(key)) {
+          added.push({ key, index, el });
+        } else if (JSON.stringify(domSync.acked.get(key)) !== JSON.stringify(el)) {
+          changed.push({ key, el });
+        }
+        index++;
+      }
+      for (const key of domSync.acked.keys()) {
+        if (!keyed.has(key)) removed.push(key);
+      }
+      // 델타가 전체의 절반을 넘으면 전체 전송이 더 작음
+      if (added.length + changed.length < dom.length / 2) {
+        console.log(`🧩 DOM 델타 전송: v${domSync.ackedVersion} → v${version} (+${added.length} -${removed.length} ~${changed.length})`);
+        return {
+          dom_delta: { base_version: domSync.ackedVersion, version, count: dom.length, added, removed, changed }
+        };
+      }
+    }
+    return { dom, domVersion: version };
+  }
+
+  function handleDomAck(version) {
+    const keyed = domSync.pending[version];
+    if (!keyed) return;
+    domSync.ackedVersion = version;
+    domSync.acked = keyed;
+    for (const v of Object.keys(domSync.pending)) {
+      if (Number(v) <= version) delete domSync.pending[v];
+    }
+  }
   
+  // === 바이너리 프레임 프로토콜 (server/ws_protocol.py) ===
+  // 연결마다 hello 로 협상, hello_ack 전이나 서버가 거절하면 JSON 텍스트
+  const BINARY_PROTOCOL = "binary-v1";
+  let wsProtocol = "json";
+
+  function dataUrlToBytes(dataUrl) {
+    const binary = atob(dataUrl.slice(dataUrl.indexOf(',') + 1));
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes;
+  }
+
+  async function deflateBytes(bytes) {
+    const stream = new Blob([bytes]).stream().pipeThrough(new CompressionStream('deflate'));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+  }
+
+  // "MB" | version | flags | header_len(u32) | header(JSON, deflate) | [len(u32) | 첨부]...
+  async function encodeFrame(payload) {
+    const { dom, image, ...header } = payload;
+    const attachments = [];
+    if (Array.isArray(dom)) {
+      // 요소 목록은 열 이름 + 행 배열로 (키 이름 반복 제거)
+      const columns = [];
+      for (const el of dom) {
+        for (const key of Object.keys(el)) {
+          if (!columns.includes(key)) columns.push(key);
+        }
+      }
+      header.dom_columns = columns;
+      header.dom_rows = dom.map(el => columns.map(c => (el[c] === undefined ? null : el[c])));
+    }
+    if (image) {
+      header.attachments = ["image"];
+      attachments.push(dataUrlToBytes(image));
+    }
+    let body = new TextEncoder().encode(JSON.stringify(header));
+    let flags = 0;
+    if (typeof CompressionStream !== 'undefined') {
+      body = await deflateBytes(body);
+      flags |= 0x01;
+    }
+    const size = 8 + body.length + attachments.reduce((n, a) => n + 4 + a.length, 0);
+    const frame = new Uint8Array(size);
+    const view = new DataView(frame.buffer);
+    frame.set([0x4d, 0x42, 1, flags], 0);
+    view.setUint32(4, body.length);
+    frame.set(body, 8);
+    let offset = 8 + body.length;
+    for (const a of attachments) {
+      view.setUint32(offset, a.length);
+      frame.set(a, offset + 4);
+      offset += 4 + a.length;
+    }
+    return frame.buffer;
+  }
+
+  // DOM 메시지 전송 - 바이너리 협상이 됐으면 프레임, 아니면(또는 인코딩 실패 시) JSON
+  async function sendPayload(payload) {
+    if (wsProtocol === BINARY_PROTOCOL) {
+      try {
+        const frame = await encodeFrame(payload);
+        ws.send(frame);
+        console.log(`📦 바이너리 프레임 전송: ${frame.byteLength} bytes`);
+        return;
+      } catch (e) {
+        console.warn("⚠️ 바이너리 인코딩 실패 - JSON 으로 전송:", e);
+      }
+    }
+    ws.send(JSON.stringify(payload));
+  }
+
   function handleWsOpen() {
     console.log("✅ WebSocket 연결됨");
+    // 서버의 DOM 상태는 연결 단위 - 새 연결은 전체 DOM부터
+    resetDomSync();
+    wsProtocol = "json";
+    try { ws.send(JSON.stringify({ type: "hello", protocols: [BINARY_PROTOCOL] })); } catch (e) {}
     // UI 로그는 UI 생성 이후에만 수행 (초기 로딩 시 TDZ 회피)
     try { typeof log !== 'undefined' && log && logMessage && logMessage("🔌 서버 연결 성공"); } catch (e) {}
     chrome.runtime.sendMessage({type: 'connection_status', connected: true});
@@ -653,6 +804,28 @@ if (!window.mcpAgentInjected) {
       setTimeout(() => {
         sendDom();
       }, 1000);
+    } else if (data.type === "hello_ack") {
+      wsProtocol = data.protocol === BINARY_PROTOCOL ? BINARY_PROTOCOL : "json";
+      console.log("🤝 WebSocket 프로토콜:", wsProtocol);
+    } else if (data.type === "dom_ack") {
+      handleDomAck(data.version);
+    } else if (data.type === "dom_resync") {
+      // 서버가 델타 기준 DOM을 갖고 있지 않음 → 전체 DOM 재전송
+      console.log("🔁 서버 요청으로 전체 DOM 재전송");
+      resetDomSync();
+      if (data.evaluationMode) {
+        sendDomForEvaluation();
+      } else {
+        sendDom();
+      }
+    } else if (data.type === "request_screenshot") {
+      // 텍스트 전용 분석의 신뢰도가 낮음 → 이번 단계만 스크린샷 포함 재전송
+      logMessage("🖼️ 텍스트만으로 판단 어려움 - 화면 포함 재전송");
+      if (data.evaluationMode) {
+        sendDomForEvaluation(true);
+      } else {
+        sendDom(true);
+      }
     } else if (data.type === "page_analysis") {
       // === 새로운 기능: 페이지 분석 결과 표시 ===
       displayPageAnalysis(data);
@@ -691,17 +864,7 @@ if (!window.mcpAgentInjected) {
       console.log("🔍 action.url 존재 여부:", !!data.action.url);
       console.log("🔍 action.value 존재 여부:", !!data.action.value);
 
-      if (actionHistory.length > MAX_STEPS) {
-        const cont = confirm("10단계 이상 수행 중입니다. 계속 진행할까요?");
-        if (!cont) {
-          logMessage("⛔ 사용자 중단");
-          localStorage.removeItem("mcp-goal");
-          actionHistory = [];
-          currentPlan = null;
-          return;
-        }
-        actionHistory = [];
-      }
+      if (!confirmStepLimit()) return;
 
       console.log("🔍 executeMcp 호출 전 액션:", data.action);
       console.log("🔍 action.url 값:", data.action.url);
@@ -724,6 +887,10 @@ if (!window.mcpAgentInjected) {
         }
       }, 3000);
 
+    } else if (data.type === "actions") {
+      // 액션 묶음: 가드를 확인하며 로컬에서 연속 실행, 어긋나거나 페이지가 바뀔 때만 서버로 복귀
+      await runActionChain(data.actions || []);
+
     } else if (data.type === "end") {
       logMessage("🎯 완료됨");
       localStorage.removeItem("mcp-goal");
@@ -970,7 +1137,8 @@ if (!window.mcpAgentInjected) {
   }
 
   // === DOM 전송 (상황 평가용) ===
-  async function sendDomForEvaluation() {
+  // forceImage: 서버가 텍스트 전용 분석의 신뢰도가 낮다고 스크린샷을 요청한 경우
+  async function sendDomForEvaluation(forceImage = false) {
     console.log("📊 sendDomForEvaluation() 호출됨 - 상황 평가 모드");
     console.log("🔍 context 상태:", {
       goal: context.currentGoal,
@@ -990,9 +1158,10 @@ if (!window.mcpAgentInjected) {
     
     // 와이어프레임 설정 확인
     const wireframeSettings = await getWireframeSettings();
+    const withImage = wireframeSettings.enabled || forceImage;
     let image = null;
     
-    if (wireframeSettings.enabled) {
+    if (withImage) {
       image = await captureScreen();
     }
     
@@ -1003,9 +1172,9 @@ if (!window.mcpAgentInjected) {
     context.lastDomSnapshot = snapshotDom();
     
     const payload = {
-      type: wireframeSettings.enabled ? "dom_with_image_evaluation" : "dom_evaluation",
+      type: withImage ? "dom_with_image_evaluation" : "dom_evaluation",
       message: context.currentGoal,
-      dom,
+      ...buildDomPayload(dom),
       image: image,
       context: context.getContextForServer(),
       evaluationMode: true,
@@ -1015,13 +1184,13 @@ if (!window.mcpAgentInjected) {
     logMessage(`📊 상황 평가 요청 (단계: ${context.step})`);
     console.log("📊 평가용 컨텍스트:", context.getContextForServer());
     console.log("📤 평가용 DOM 전송:", payload.type);
-    ws.send(JSON.stringify(payload));
+    await sendPayload(payload);
     
     await context.save();
   }
 
   // === DOM 전송 ===
-  async function sendDom() {
+  async function sendDom(forceImage = false) {
     console.log("🔍 sendDom() 호출됨");
     console.log("🔍 context.currentGoal:", context.currentGoal);
     console.log("🔍 context 전체 상태:", {
@@ -1044,9 +1213,10 @@ if (!window.mcpAgentInjected) {
     
     // 와이어프레임 설정 확인 후 이미지 캡처
     const wireframeSettings = await getWireframeSettings();
+    const withImage = wireframeSettings.enabled || forceImage;
     let image = null;
     
-    if (wireframeSettings.enabled) {
+    if (withImage) {
       image = await captureScreen();
       console.log("📸 와이어프레임 이미지 캡처:", {
         imageExists: !!image,
@@ -1060,18 +1230,18 @@ if (!window.mcpAgentInjected) {
     context.lastDomSnapshot = snapshotDom();
     
     const payload = {
-      type: wireframeSettings.enabled ? "dom_with_image" : "dom_only",
+      type: withImage ? "dom_with_image" : "dom_only",
       message: context.currentGoal,
-      dom,
+      ...buildDomPayload(dom),
       image: image,
       context: context.getContextForServer(),
       wireframeEnabled: wireframeSettings.enabled
     };
     
-    logMessage(`📤 DOM ${wireframeSettings.enabled ? '+ 이미지' : '(텍스트만)'} 전송 (단계: ${context.step})`);
+    logMessage(`📤 DOM ${withImage ? '+ 이미지' : '(텍스트만)'} 전송 (단계: ${context.step})`);
     console.log("📤 전송할 컨텍스트:", context.getContextForServer());
     console.log("📤 와이어프레임 모드:", wireframeSettings.enabled);
-    ws.send(JSON.stringify(payload));
+    await sendPayload(payload);
     
     await context.save();
   }
@@ -1450,6 +1620,10 @@ if (!window.mcpAgentInjected) {
           // 스코어링 (선택)
           item.clickable = isInteractive(el);
           item.inViewport = true;
+          // 문서 기준 요소 중심 y(px, 10px 단위) - 스크롤해도 바뀌지 않아 델타 비교를 흔들지 않음.
+          // 현재 화면 범위는 context.viewport 로 따로 보내고 서버가 화면 내 위치로 환산 (청크 우선순위용)
+          const vr = el.getBoundingClientRect();
+          item.py = Math.round((vr.top + window.scrollY + vr.height / 2) / 10) * 10;
           item.score = computeScore(el, item.text || '');
 
           results.push(item);
@@ -1531,7 +1705,8 @@ if (!window.mcpAgentInjected) {
     return false;
   }
 
-  async function executeMcp(actions) {
+  // options.submit === false: 액션 묶음 중간의 fill - 전송 버튼이 없어도 Enter 를 누르지 않음
+  async function executeMcp(actions, options = {}) {
     for (const action of actions) {
       console.log("🚀 Executing MCP action:", action);
       console.log("🔍 액션 타입:", typeof action);
@@ -1702,6 +1877,8 @@ if (!window.mcpAgentInjected) {
               const submitButton = findSubmitButton(fillEl);
               if (submitButton) {
                 logMessage(`🔍 전송 버튼 발견: ${submitButton.tagName}${submitButton.type ? `[${submitButton.type}]` : ''}`);
+              } else if (options.submit === false) {
+                logMessage(`⏭️ 묶음 중간 입력 → Enter 생략`);
               } else {
                 // 전송 버튼이 없으면 Enter 키 입력
                 logMessage(`🎯 전송 버튼 없음 → Enter 키 입력`);
@@ -1771,6 +1948,98 @@ if (!window.mcpAgentInjected) {
     }
   }
 
+  // 가드 조건: selector 요소 존재 / 페이지 텍스트 포함 / URL 포함 - 잠시 기다려도 맞지 않으면 false
+  async function checkGuard(guard) {
+    if (!guard) return true;
+    const matches = () => {
+      if (guard.selector) {
+        try {
+          if (!document.querySelector(guard.selector)) return false;
+        } catch (e) {
+          return false;
+        }
+      }
+      if (guard.text && !(document.body.innerText || "").includes(guard.text)) return false;
+      if (guard.url && !location.href.includes(guard.url)) return false;
+      return true;
+    };
+    const deadline = Date.now() + GUARD_WAIT_MS;
+    while (!matches()) {
+      if (Date.now() > deadline) return false;
+      await new Promise(resolve => setTimeout(resolve, 100));
+    }
+    return true;
+  }
+
+  // MAX_STEPS 를 넘으면 계속 진행할지 확인 (단일 액션 / 액션 묶음 공용) - 거절하면 목표를 멈추고 false
+  function confirmStepLimit() {
+    if (actionHistory.length <= MAX_STEPS) return true;
+    const cont = confirm("10단계 이상 수행 중입니다. 계속 진행할까요?");
+    if (!cont) {
+      logMessage("⛔ 사용자 중단");
+      localStorage.removeItem("mcp-goal");
+      actionHistory = [];
+      currentPlan = null;
+      return false;
+    }
+    actionHistory = [];
+    return true;
+  }
+
+  async function runActionChain(actions) {
+    if (actions.length === 0) return;
+    logMessage(`🔗 액션 묶음(${actions.length}): ${actions.map(a => a.action).join(" → ")}`, "ACTION_RECEIVED");
+    await context.setStatus("executing", { actionType: actions[0].action, expectedPageChange: false });
+    let executed = 0;
+    for (let i = 0; i < actions.length; i++) {
+      const action = actions[i];
+      if (!(await checkGuard(action.guard))) {
+        logMessage(`🛑 가드 불일치 → 묶음 중단 (${executed}/${actions.length} 실행)`);
+        sendLogToServer("ACTION_CHAIN_ABORTED", `가드 불일치: ${action.action}`, { index: i, guard: action.guard, action });
+        break;
+      }
+      actionHistory = context.actionHistory;
+      if (!confirmStepLimit()) {
+        sendLogToServer("ACTION_CHAIN_ABORTED", `사용자 중단: ${action.action}`, { index: i, executed, action });
+        return;
+      }
+      const navigates = action.action === "goto" || action.action === "google_search";
+      if (navigates) {
+        await context.setStatus("executing", { actionType: action.action, expectedPageChange: true, waitingForEvaluation: true });
+      }
+      await context.addAction(action);
+      actionHistory = context.actionHistory;
+      await saveContext();
+      await executeMcp([action], { submit: i === actions.length - 1 });
+      executed++;
+      if (navigates) {
+        logMessage("🌐 페이지 이동 중... 새 페이지에서 자동 재개됨");
+        return;
+      }
+      if (i < actions.length - 1) {
+        await new Promise(resolve => setTimeout(resolve, ACTION_CHAIN_DELAY_MS));
+      }
+    }
+    sendLogToServer("ACTION_CHAIN_DONE", `액션 묶음 ${executed}/${actions.length} 실행`, { executed, total: actions.length, step: context.step });
+    if (context.currentPlan && context.currentPlan.length > 0) {
+      showPlanProgress();
+    }
+    if (executed < actions.length) {
+      // 예상과 다른 화면 → 바로 현재 DOM 으로 서버 판단 요청
+      sendDom();
+      return;
+    }
+    setTimeout(() => {
+      const current = snapshotDom();
+      if (current !== lastDomSnapshot) {
+        logMessage("🔄 DOM 변화 감지 → 재전송");
+        sendDom();
+      } else {
+        logMessage("⏳ DOM 변화 없음 → 대기");
+      }
+    }, 3000);
+  }
+
   function findElement(selector, text) {
     if (!selector) return null;
     
@@ -1,13 +1,40 @@
 from fastapi import FastAPI, WebSocket
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import BadRequestError, RateLimitError
 from starlette.websockets import WebSocketDisconnect
-import os, json, re, logging, base64, random
+import os, json, re, logging
 from datetime import datetime
 import asyncio
+import time
 from urllib.parse import quote
 
+from llm_client import llm_pool, env_float, env_int
+from rate_limiter import llm_scheduler, estimate_prompt_tokens
+from relevance import rank_dom
+from dom_codec import format_dom, assign_element_ids, resolve_element_ids
+from dom_delta import DomDeltaMismatch, describe_dom_changes
+from dom_chunker import chunk_budget, pack_chunks
+from chunk_scheduler import ChunkSchedule, schedule_chunks
+from page_features import KeywordMatcher, PageFeatures, extract_page_features
+from response_cache import response_cache, dom_fingerprint, dom_state_fingerprint
+from imaging import IMAGE_DEDUP, PreparedImage, prepare_image
+from workflows import workflow_recorder
+from artifacts import artifact_writer
+from json_stream import JsonStreamScanner, scan_top_level_json
+from dispatcher import ConnectionDispatcher
+from ws_protocol import BINARY_PROTOCOL, WS_BINARY_PROTOCOL, FrameError, decode_frame
+from sessions import GoalLogger, Session, SessionLimitExceeded, session_manager
+from recordings import session_recorder
+from structured_output import mark_unsupported, parse_structured, response_format
+from model_cascade import model_cascade
+from site_directory import site_directory
+from metrics import (
+    metrics, goal_scope, observe_phase, record_step, record_sent, record_llm_call, record_tokens,
+    record_retry, record_cache, record_chunks, record_chunk_call, record_text_only,
+)
+
 load_dotenv()
 logger = logging.getLogger("uvicorn.error")
 logging.basicConfig(level=logging.INFO)
@@ -17,71 +44,14 @@ os.makedirs("debug_images", exist_ok=True)
 os.makedirs("logs", exist_ok=True)
 
 # ============================
-# Goal-scoped logger
+# Known site mapping (site_directory.py, data/sites.tsv)
 # ============================
-class GoalLogger:
-    def __init__(self):
-        self.current_goal = None
-        self.log_file_path = None
-        self.session_start_time = None
-
-    def start_new_goal(self, goal: str):
-        self.current_goal = goal
-        self.session_start_time = datetime.now()
-        timestamp = self.session_start_time.strftime("%Y%m%d_%H%M%S")
-        safe_goal = re.sub(r'[^\w\s-]', '', goal)[:20]
-        safe_goal = re.sub(r'[-\s]+', '_', safe_goal)
-        filename = f"{timestamp}-{safe_goal}.log"
-        self.log_file_path = os.path.join("logs", filename)
-        self.log("SERVER", "GOAL_START", f"새로운 목표 시작: {goal}")
-        logger.info(f"📝 목표별 로그 시작: {self.log_file_path}")
-
-    def log(self, source: str, event_type: str, message: str, extra_data: dict | None = None):
-        if not self.log_file_path:
-            return
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        entry = {
-            "timestamp": timestamp,
-            "source": source,
-            "event_type": event_type,
-            "message": message,
-            "extra_data": extra_data or {},
-        }
-        try:
-            with open(self.log_file_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-        except Exception as e:
-            logger.error(f"로그 저장 실패: {e}")
-
-    def log_server_event(self, event_type: str, message: str, extra_data: dict | None = None):
-        self.log("SERVER", event_type, message, extra_data)
-
-    def log_client_event(self, event_type: str, message: str, extra_data: dict | None = None):
-        self.log("CLIENT", event_type, message, extra_data)
-
-# 전역 로거
-goal_logger = GoalLogger()
-
-# ============================
-# Known site mapping (private/managed only)
-# ============================
-SITE_MAPPING = {
-    "국가교통정보센터": "https://www.its.go.kr",
-    "정부24": "https://www.gov.kr",
-    "국세청": "https://www.nts.go.kr",
-    "건강보험공단": "https://www.nhis.or.kr",
-    "한국은행": "https://www.bok.or.kr",
-    # 주요 서비스 (특별 케이스)
-    "네이버": "https://naver.com",
-    "다음": "https://daum.net",
-}
-
 def find_site_url(query: str) -> str | None:
-    q = (query or '').lower().strip()
-    for name, url in SITE_MAPPING.items():
-        if name.lower() in q or q in name.lower():
-            logger.info(f"사이트 매핑 발견: {query} -> {url}")
-            return url
+    """목표 속 사이트 이름 → URL (조사/띄어쓰기/오타 허용, 기준 점수 미만이면 None)"""
+    match = site_directory.resolve(query)
+    if match:
+        logger.info(f"사이트 매핑 발견: {query} -> {match.url} ({match.name}, {match.kind} {match.score:.2f})")
+        return match.url
     logger.info(f"매핑에 없는 사이트: {query}")
     return None
 
@@ -96,107 +66,120 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def on_startup():
+    llm_scheduler.configure_from_env()
+    model_cascade.configure_budgets(llm_scheduler)
+    await llm_pool.start()
+    await artifact_writer.start()
+    await session_manager.start()
+    await asyncio.to_thread(site_directory.current)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await session_manager.stop()
+    await llm_pool.close()
+    await artifact_writer.stop()
+    await workflow_recorder.store.wait_flushed()
+    await response_cache.wait_writes()
+
+@app.get("/sessions")
+async def sessions_status():
+    """활성 세션 수와 세션별 요약"""
+    return {**session_manager.stats(), "sessions": [s.summary() for s in session_manager.sessions.values()]}
+
+metrics.gauge("mcp_active_sessions", "활성 WebSocket 세션 수", lambda: session_manager.active_count)
+metrics.gauge("mcp_artifact_queue_depth", "산출물 기록 대기 항목 수", lambda: artifact_writer.stats()["queue_depth"])
+metrics.gauge("mcp_artifact_dropped_total", "큐 초과로 버린 산출물 수", lambda: artifact_writer.dropped)
+
+@app.get("/cascade")
+async def cascade_status():
+    """모델 캐스케이드 단계 구성과 단계별 채택률"""
+    return {"text_tiers": model_cascade.text_tiers, "vision_tiers": model_cascade.vision_tiers,
+            "min_confidence": model_cascade.min_confidence, "tiers": model_cascade.stats()}
+
+@app.get("/sites")
+async def sites_status(q: str = "", limit: int = 5):
+    """사이트 디렉토리 상태, q 가 있으면 순위별 후보"""
+    matches = [m.to_dict() for m in site_directory.lookup(q, limit)] if q else []
+    return {**site_directory.stats(), "matches": matches}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 텍스트 형식 계측 (단계/구간 지연, LLM 호출/토큰/재시도, 캐시, 청크, 메시지 크기)"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ============================
 # ============================
 # 요구사항 → 웹페이지 가이드 변환
 # ============================
+# 일반적인 패턴들
+REQUIREMENT_PATTERNS = {
+    "로그인": {
+        "guide": "로그인 폼의 아이디/비밀번호 입력 후 로그인 버튼 클릭",
+        "selectors": ["input[type='email']", "input[type='password']", "button[type='submit']"]
+    },
+    "검색": {
+        "guide": "검색창에 키워드 입력 후 검색 버튼 클릭 또는 엔터",
+        "selectors": ["input[type='search']", "input[placeholder*='검색']", "button[type='submit']"]
+    }
+}
+REQUIREMENT_MATCHER = KeywordMatcher({keyword: [keyword] for keyword in REQUIREMENT_PATTERNS})
+
+def requirement_keywords(user_message: str) -> list:
+    """요구사항에 나타난 패턴 키워드 (REQUIREMENT_PATTERNS 순서)"""
+    return REQUIREMENT_MATCHER.names(REQUIREMENT_MATCHER.match((user_message or "").lower()))
+
 def translate_requirement_to_web_guide(user_message: str, page_type: str = None) -> str:
     """일반적인 요구사항을 웹페이지 구체적 가이드로 변환"""
     logger.info(f"🔄 요구사항 변환 시작: {user_message}")
     
-    # 일반적인 패턴들
-    patterns = {
-        "로그인": {
-            "guide": "로그인 폼의 아이디/비밀번호 입력 후 로그인 버튼 클릭",
-            "selectors": ["input[type='email']", "input[type='password']", "button[type='submit']"]
-        },
-        "검색": {
-            "guide": "검색창에 키워드 입력 후 검색 버튼 클릭 또는 엔터",
-            "selectors": ["input[type='search']", "input[placeholder*='검색']", "button[type='submit']"]
-        }
-    }
-    
     # 키워드 매칭
-    for keyword, info in patterns.items():
-        if keyword in user_message:
-            logger.info(f"✅ 패턴 매칭: {keyword} → {info['guide']}")
-            return info['guide']
+    for keyword in requirement_keywords(user_message)[:1]:
+        info = REQUIREMENT_PATTERNS[keyword]
+        logger.info(f"✅ 패턴 매칭: {keyword} → {info['guide']}")
+        return info['guide']
     
     logger.info("❓ 특정 패턴 없음 - 원본 요구사항 유지")
     return user_message
 
+def requirement_selector_hints(user_message: str) -> list:
+    """요구사항 패턴에 연결된 selector 힌트 (DOM 사전 랭킹 질의에 추가)"""
+    return [sel for keyword in requirement_keywords(user_message) for sel in REQUIREMENT_PATTERNS[keyword]["selectors"]]
+
 # ============================
 # 페이지 이해도 분석
 # ============================
-def analyze_page_understanding(dom_summary: list) -> dict:
-    """DOM 분석은 LLM에게 위임 - 기본 정보 + 로그인 감지"""
+def analyze_page_understanding(dom_summary: list, features: PageFeatures | None = None) -> dict:
+    """DOM 분석은 LLM에게 위임 - 기본 정보 + 로그인 감지 (features: 단일 패스 특징, 없으면 여기서 추출)"""
     logger.info("📊 페이지 기본 정보 추출 (분석은 LLM이 담당)")
+    features = features or extract_page_features(dom_summary)
     
     # 로그인 페이지 감지
-    is_login_page = detect_login_page(dom_summary)
+    is_login_page = detect_login_page(dom_summary, features)
     
     return {
         "dom_elements": len(dom_summary),
         "analysis_method": "llm_delegation",
-        "is_login_page": is_login_page
+        "is_login_page": is_login_page,
+        **features.summary()
     }
 
-def detect_login_page(dom_summary: list) -> bool:
-    """로그인 페이지 여부 감지 (로그인 성공 상황 고려)"""
-    
-    # 먼저 로그인 성공 신호 확인
-    success_indicators = ["메일함", "inbox", "받은편지함", "logout", "로그아웃", "내정보", "프로필"]
-    success_signals = 0
-    
-    for element in dom_summary:
-        text = (element.get("text", "") or "").lower()
-        for indicator in success_indicators:
-            if indicator in text:
-                success_signals += 1
-                break
+def detect_login_page(dom_summary: list, features: PageFeatures | None = None) -> bool:
+    """로그인 페이지 여부 감지 (로그인 성공 상황 고려) - 신호 집계는 page_features 단일 패스 결과"""
+    signals = (features or extract_page_features(dom_summary)).login_signals
     
     # 로그인 성공 신호가 충분하면 로그인 페이지 아님
-    if success_signals >= 1:
-        logger.info(f"✅ 로그인 성공 감지: 성공신호 {success_signals}개 발견")
+    if signals["success_signals"] >= 1:
+        logger.info(f"✅ 로그인 성공 감지: 성공신호 {signals['success_signals']}개 발견")
         return False
     
-    # 기존 로그인 페이지 감지 로직
-    login_indicators = {
-        "text_keywords": ["로그인", "login", "sign in", "아이디", "비밀번호", "password", "이메일"],
-        "input_types": ["password", "email"],
-        "login_classes": ["login", "signin", "auth", "credential"]
-    }
-    
-    text_matches = 0
-    password_fields = 0
-    login_elements = 0
-    
-    for element in dom_summary:
-        # 텍스트 키워드 체크
-        text = (element.get("text", "") or "").lower()
-        for keyword in login_indicators["text_keywords"]:
-            if keyword in text:
-                text_matches += 1
-                break
-        
-        # 비밀번호 필드 체크
-        if element.get("type") == "password":
-            password_fields += 1
-        
-        # 로그인 관련 클래스/ID 체크
-        element_class = (element.get("class", "") or "").lower()
-        element_id = (element.get("id", "") or "").lower()
-        for login_class in login_indicators["login_classes"]:
-            if login_class in element_class or login_class in element_id:
-                login_elements += 1
-                break
-    
-    # 더 엄격한 로그인 페이지 판정 (성공 신호가 없는 경우에만)
+    # 더 엄격한 로그인 페이지 판정: 비밀번호 필드 + 로그인 텍스트 + 로그인 클래스/ID 모두 있을 때만
     is_login = (
-        password_fields > 0 and text_matches >= 1 and login_elements >= 1  # 모든 조건 만족 시에만
+        signals["password_fields"] > 0 and signals["text_matches"] >= 1 and signals["login_elements"] >= 1
     )
     
-    logger.info(f"🔐 로그인 페이지 감지: {is_login} (성공신호: {success_signals}, 비밀번호필드: {password_fields}, 텍스트매칭: {text_matches}, 로그인요소: {login_elements})")
+    logger.info(f"🔐 로그인 페이지 감지: {is_login} (성공신호: {signals['success_signals']}, 비밀번호필드: {signals['password_fields']}, 텍스트매칭: {signals['text_matches']}, 로그인요소: {signals['login_elements']})")
     
     return is_login
 
@@ -236,78 +219,182 @@ def analyze_prompt_needs_dom(user_message: str) -> bool:
     return True
 
 # ============================
-# LLM helpers (rate-limit aware)
+# LLM helpers (per-deployment token budget)
 # ============================
-LLM_SEMAPHORE = asyncio.Semaphore(1)
+# 스트리밍: 최상위 JSON 이 닫히는 즉시 나머지 생성을 끊고 반환 (LLM_STREAMING=0 이면 전체 응답 대기)
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") != "0"
 
-async def call_llm(prompt: str, max_tokens: int = 400):
-    async with LLM_SEMAPHORE:
-        for attempt in range(5):
-            try:
-                client = AzureOpenAI(
-                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                    api_version="2024-02-15-preview",
-                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                )
-                res = client.chat.completions.create(
-                    model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1-mini"),
-                    messages=[{"role": "user", "content": prompt}],
+async def _read_stream(stream, label: str) -> str:
+    """스트림 토큰을 증분 파서에 넣다가 JSON 이 완성되면 스트림을 닫고 그 JSON 반환"""
+    scanner = JsonStreamScanner()
+    started = time.perf_counter()
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            found = scanner.feed(delta)
+            if found:
+                logger.info(f"⚡ {label}: JSON 완성 {(time.perf_counter() - started) * 1000:.0f}ms - 나머지 생성 취소")
+                return found
+    finally:
+        await stream.close()
+    return scanner.text
+
+async def _chat_completion(deployment: str, messages: list, max_tokens: int, est_tokens: int, label: str,
+                           stream: bool | None = None, schema: str | None = None):
+    """배포 예산 슬롯을 받아 호출하고, 429는 서버 헤더 기준으로 대기 후 재시도
+
+    schema 를 주면 해당 응답 스키마를 response_format 으로 요청 (거절하는 배포는 이후 형식 없이 호출)
+    """
+    stream = LLM_STREAMING if stream is None else stream
+    attempt = 0
+    while attempt < 5:
+        fmt = response_format(schema, deployment)
+        extra = {"response_format": fmt} if fmt else {}
+        queued = time.perf_counter()
+        started = None
+        try:
+            async with llm_scheduler.slot(deployment, est_tokens) as slot:
+                started = time.perf_counter()
+                client = await llm_pool.get_client()
+                raw = await client.chat.completions.with_raw_response.create(
+                    model=deployment,
+                    messages=messages,
                     max_tokens=max_tokens,
                     temperature=0.1,
+                    stream=stream,
+                    **extra,
                 )
-                return res.choices[0].message.content
-            except Exception as e:
-                message = str(e)
-                if "429" in message or "Too Many Requests" in message:
-                    backoff = min(20, (2 ** attempt)) + random.uniform(0, 0.5)
-                    logger.info(f"⏳ 429 감지 - {backoff:.1f}s 대기 후 재시도 ({attempt+1}/5)")
-                    await asyncio.sleep(backoff)
-                    continue
-                logger.error(f"LLM 호출 실패: {e}")
-                return None
-        logger.error("LLM 호출 실패: 재시도 한도 초과")
-        return None
+                if stream:
+                    # 스트림에는 usage 가 없으므로 헤더만 반영 (추정치 유지)
+                    slot.record(raw.headers)
+                    text = await _read_stream(raw.parse(), label)
+                    record_llm_call(deployment, "ok", time.perf_counter() - started, started - queued)
+                    record_tokens(deployment, est_tokens - max_tokens, estimate_prompt_tokens(text), source="estimate")
+                    return text
+                res = raw.parse()
+                slot.record(raw.headers, res.usage)
+            record_llm_call(deployment, "ok", time.perf_counter() - started, started - queued)
+            if res.usage is not None:
+                record_tokens(deployment, res.usage.prompt_tokens, res.usage.completion_tokens)
+            return res.choices[0].message.content
+        except RateLimitError as e:
+            wait = llm_scheduler.on_rate_limited(deployment, e.response.headers, attempt)
+            record_llm_call(deployment, "rate_limited", time.perf_counter() - started, started - queued)
+            record_retry(deployment, wait)
+            logger.info(f"⏳ 429 감지 - {wait:.1f}s 대기 후 재시도 ({attempt+1}/5)")
+            attempt += 1
+            continue
+        except BadRequestError as e:
+            if fmt and "response_format" in str(e):
+                mark_unsupported(deployment, e)
+                continue
+            record_llm_call(deployment, "error")
+            logger.error(f"{label} 실패: {e}")
+            return None
+        except Exception as e:
+            record_llm_call(deployment, "error")
+            logger.error(f"{label} 실패: {e}")
+            return None
+    record_llm_call(deployment, "exhausted")
+    logger.error(f"{label} 실패: 재시도 한도 초과")
+    return None
 
-async def call_llm_with_image(prompt: str, image_data: str, max_tokens: int = 400):
-    async with LLM_SEMAPHORE:
-        for attempt in range(5):
-            try:
-                client = AzureOpenAI(
-                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                    api_version="2024-02-15-preview",
-                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                )
-                if image_data.startswith('data:image'):
-                    image_data = image_data.split(',')[1]
-                res = client.chat.completions.create(
-                    model=os.getenv("AZURE_OPENAI_VISION_DEPLOYMENT_NAME", "gpt-4.1-mini"),
-                    messages=[{
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_data}"}},
-                        ],
-                    }],
-                    max_tokens=max_tokens,
-                    temperature=0.1,
-                )
-                return res.choices[0].message.content
-            except Exception as e:
-                message = str(e)
-                if "429" in message or "Too Many Requests" in message:
-                    backoff = min(20, (2 ** attempt)) + random.uniform(0, 0.5)
-                    logger.info(f"⏳ 429 감지 - {backoff:.1f}s 대기 후 재시도 ({attempt+1}/5)")
-                    await asyncio.sleep(backoff)
-                    continue
-                logger.error(f"Vision API 호출 실패: {e}")
-                return None
-        logger.error("Vision API 호출 실패: 재시도 한도 초과")
-        return None
+async def _cascade_completion(vision: bool, messages: list, max_tokens: int, est_tokens: int, label: str,
+                              stream: bool | None, schema: str | None):
+    """작은 배포부터 호출 - 스키마 검증 실패나 낮은 confidence 면 다음 단계 배포로 (model_cascade.py)"""
+    tiers = model_cascade.tiers(vision, schema)
+    text = None
+    for i, deployment in enumerate(tiers):
+        text = await _chat_completion(deployment, messages, max_tokens, est_tokens, label, stream, schema)
+        if i == len(tiers) - 1:
+            break
+        accepted, why = model_cascade.accept(schema, text)
+        model_cascade.record(vision, deployment, accepted)
+        if accepted:
+            return text
+        logger.info(f"🪜 {deployment} 응답 미채택({why}) → {tiers[i + 1]} 로 재호출")
+    if len(tiers) > 1:
+        model_cascade.record(vision, tiers[-1], True)
+    return text
+
+async def call_llm(prompt: str, max_tokens: int = 400, stream: bool | None = None, schema: str | None = None):
+    est_tokens = estimate_prompt_tokens(prompt) + max_tokens
+    messages = [{"role": "user", "content": prompt}]
+    return await _cascade_completion(False, messages, max_tokens, est_tokens, "LLM 호출", stream, schema)
+
+async def call_llm_with_image(prompt: str, image: PreparedImage | str, max_tokens: int = 400, stream: bool | None = None,
+                              schema: str | None = None):
+    if isinstance(image, str):
+        image = prepare_image(image, dedup="off")
+    est_tokens = estimate_prompt_tokens(prompt) + image.tokens + max_tokens
+    messages = [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": image.data_url(), "detail": image.detail}},
+        ],
+    }]
+    return await _cascade_completion(True, messages, max_tokens, est_tokens, "Vision API 호출", stream, schema)
+
+# ============================
+# 응답 캐시 (같은 목표 + 같은 페이지 → LLM 생략)
+# ============================
+def build_cache_key(kind: str, goal: str, dom_fp: str | None, image_hash: str | None, has_image: bool, extra=None) -> str | None:
+    if dom_fp is None:
+        return None  # 요청 단위 캐시 우회
+    deployment = ",".join(model_cascade.tiers(has_image, kind))
+    return response_cache.make_key(kind, goal, dom_fp, image_hash, deployment, extra)
+
+async def call_llm_cached(prompt: str, image: PreparedImage | None, cache_key: str | None, goal_log: GoalLogger | None = None,
+                          schema: str | None = None):
+    """캐시 적중 시 저장된 응답 반환, 아니면 호출 후 JSON이 추출되는 응답만 저장"""
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        record_cache("response", cached is not None)
+        if cached is not None:
+            logger.info(f"⚡ 응답 캐시 적중 ({response_cache.stats()['hit_rate']*100:.0f}% hit rate)")
+            if goal_log:
+                goal_log.log_server_event("CACHE_HIT", "캐시된 LLM 응답 사용", response_cache.stats())
+            return cached
+    response = await (call_llm_with_image(prompt, image, schema=schema) if image else call_llm(prompt, schema=schema))
+    if cache_key and response and extract_top_level_json(response):
+        response_cache.put(cache_key, response)
+    return response
+
+async def send_step_message(websocket: WebSocket, session_id: str | None, message: dict, replayed: bool = False,
+                            goal_log: GoalLogger | None = None):
+    """단계 결과(plan/action/end/completed/replan) 전송 + 워크플로우 기록, 목표가 끝나면 목표 요약 기록"""
+    text = json.dumps(message)
+    await websocket.send_text(text)
+    record_sent(message.get("type"), len(text))
+    workflow_recorder.sent(session_id, message, replayed)
+    if goal_log and message.get("type") in ("completed", "end"):
+        goal_log.finish_goal(message["type"])
 
 # ============================
 # Prompt builders (short & crisp)
 # ============================
 
+# 액션 묶음: 한 번의 호출로 짧은 체인(예: fill → fill → click)을 받아 extension 이 로컬에서 연속 실행
+ACTION_BATCH = os.getenv("ACTION_BATCH", "1") != "0"
+ACTION_BATCH_MAX = env_int("ACTION_BATCH_MAX", 4)
+BATCH_ACTIONS = {"click", "fill", "hover", "waitUntil"}
+NAVIGATION_ACTIONS = {"goto", "google_search"}
+
+def action_batch_hint() -> str:
+    if not ACTION_BATCH or ACTION_BATCH_MAX < 2:
+        return ""
+    return f"""
+Optional "next_actions": up to {ACTION_BATCH_MAX - 1} more actions to run right after this one on the SAME page
+(e.g. fill id → fill password → click login). Give each a "guard": {{"selector":"<css|eid>"}} (or "text"/"url")
+that must hold before it runs. Only include steps you are certain of; nothing may follow goto/google_search
+or a click that loads a new page.
+"""
+
 def build_planning_prompt_with_image(goal: str, dom_summary: list, context: dict | None = None) -> str:
     ctx = context or {}
     return f"""
@@ -335,12 +422,12 @@ Goal: "{goal}"
 Current step: {ctx.get('step', 0)}
 
 DOM Elements (analyze in phases):
-{json.dumps(dom_summary, ensure_ascii=False, indent=2)}
+{format_dom(dom_summary)}
 
 Perform the 3-phase analysis and create a plan. Return ONLY the JSON array:
 
 [{{"step": <int>, "action": "goto|click|fill|hover|waitUntil|google_search|end", 
-  "selector": "<css>", "text":"<opt>", "value":"<opt>", "url":"<opt>", "reason":"<phase_based_analysis>"}}]
+  "selector": "<css|eid>", "text":"<opt>", "value":"<opt>", "url":"<opt>", "reason":"<phase_based_analysis>"}}]
 """
 
 def build_execution_prompt_with_image(goal: str, plan: list, current_step: int, dom_summary: list, context: dict | None = None) -> str:
@@ -377,15 +464,17 @@ Execute the next action toward the goal using DOM analysis.
 
 Goal: "{goal}"
 Current Step: {current_step}
+{ctx.get('dom_changes', '')}
 
 Current DOM State:
-{json.dumps(dom_summary, ensure_ascii=False, indent=2)}
+{format_dom(dom_summary)}
 
-Analyze the situation and return ONLY the JSON action:
+Analyze the situation and return ONLY the JSON action.
+Set "confidence" (0-1) honestly: how sure you are that this element/action is right (low when guessing).
 
-{{"action":"click|fill|goto|google_search|hover|waitUntil|end", "selector":"<css>", 
-  "text":"<opt>", "value":"<opt>", "url":"<opt>", "timeout":1000}}
-"""
+{{"action":"click|fill|goto|google_search|hover|waitUntil|end", "selector":"<css|eid>", 
+  "text":"<opt>", "value":"<opt>", "url":"<opt>", "timeout":1000, "confidence":<0-1>}}
+{action_batch_hint()}"""
 
 def build_evaluation_prompt_with_image(goal: str, dom_summary: list, context: dict | None = None) -> str:
     ctx = context or {}
@@ -413,16 +502,18 @@ Finally, decide what should happen next:
 Goal: "{goal}"
 Step: {ctx.get('step', 0)}
 Last action: {json.dumps(ctx.get('lastAction'), ensure_ascii=False) if ctx.get('lastAction') else 'None'}
+{ctx.get('dom_changes', '')}
 
 Current DOM State:
-{json.dumps(dom_summary, ensure_ascii=False, indent=2)}
+{format_dom(dom_summary)}
 
-Perform the 3-step evaluation. Return ONLY ONE JSON object:
+Perform the 3-step evaluation. Return ONLY ONE JSON object.
+Set "confidence" (0-1) honestly: how sure you are of the status (low when the evidence is unclear).
 
-For COMPLETED: {{"status":"completed","reason":"<step_by_step_analysis>","evidence":"<specific_dom_evidence>"}}
-For REPLAN: {{"status":"replan","reason":"<why_approach_failed>","new_plan_needed":true}}
-For CONTINUE: {{"status":"continue","action":"click|fill|goto|hover|waitUntil","selector":"<css>","value":"<opt>","url":"<opt>","reason":"<next_step_analysis>"}}
-"""
+For COMPLETED: {{"status":"completed","reason":"<step_by_step_analysis>","evidence":"<specific_dom_evidence>","confidence":<0-1>}}
+For REPLAN: {{"status":"replan","reason":"<why_approach_failed>","new_plan_needed":true,"confidence":<0-1>}}
+For CONTINUE: {{"status":"continue","action":"click|fill|goto|hover|waitUntil","selector":"<css|eid>","value":"<opt>","url":"<opt>","reason":"<next_step_analysis>","confidence":<0-1>}}
+{action_batch_hint()}"""
 
 # Legacy single-step builder kept for fallback
 
@@ -431,17 +522,82 @@ def build_prompt_with_image(goal: str, dom_summary: list, step: int, context: di
     return f"""
 You are a browser control agent (MCP) with visual understanding.
 Return ONLY one JSON action. Prefer direct visible elements. Return {{"action":"end"}} if done.
+Set "confidence" (0-1) honestly: how sure you are that this element/action is right (low when guessing).
 
 Goal: "{goal}"
 Step: {step}
+{ctx.get('dom_changes', '')}
 DOM:
-{json.dumps(dom_summary, ensure_ascii=False, indent=2)}
+{format_dom(dom_summary)}
 
 Schema:
-{{"action":"click|fill|goto|google_search|hover|waitUntil|end","selector":"<css>","text":"<opt>",
-  "value":"<opt>","url":"<for goto/google_search>","query":"<for google_search>","condition":"<opt>","timeout":1000}}
+{{"action":"click|fill|goto|google_search|hover|waitUntil|end","selector":"<css|eid>","text":"<opt>",
+  "value":"<opt>","url":"<for goto/google_search>","query":"<for google_search>","condition":"<opt>","timeout":1000,
+  "confidence":<0-1>}}
+{action_batch_hint()}"""
+
+# ============================
+# Text-only builders (dom_only / dom_evaluation)
+# ============================
+
+def build_text_planning_prompt(goal: str, dom_summary: list, context: dict | None = None) -> str:
+    ctx = context or {}
+    return f"""
+You are a browser automation planner. You see the page ONLY as a DOM element list (no screenshot).
+Use the element text, tags and attributes to plan; prefer short, stable steps.
+
+Goal: "{goal}"
+Current step: {ctx.get('step', 0)}
+
+DOM Elements:
+{format_dom(dom_summary)}
+
+Return ONLY the JSON array:
+[{{"step": <int>, "action": "goto|click|fill|hover|waitUntil|google_search|end",
+  "selector": "<css|eid>", "text":"<opt>", "value":"<opt>", "url":"<opt>", "reason":"<short>"}}]
 """
 
+def build_text_execution_prompt(goal: str, plan: list, current_step: int, dom_summary: list, context: dict | None = None) -> str:
+    ctx = context or {}
+    planned = current_plan_step(plan, current_step)
+    return f"""
+Execute the next browser action from the DOM element list only (no screenshot).
+Set "confidence" (0-1) honestly: below 0.6 if the right element cannot be identified from text/attributes alone
+(e.g. icon-only buttons, canvas, layout-dependent choices) - a screenshot will then be requested.
+
+Goal: "{goal}"
+Current Step: {current_step}/{len(plan) if plan else '?'}
+Planned Action: {json.dumps(planned, ensure_ascii=False) if planned else 'None'}
+{ctx.get('dom_changes', '')}
+
+DOM:
+{format_dom(dom_summary)}
+
+Return ONLY the JSON action:
+{{"action":"click|fill|goto|google_search|hover|waitUntil|end", "selector":"<css|eid>",
+  "text":"<opt>", "value":"<opt>", "url":"<opt>", "timeout":1000, "confidence":<0-1>, "reason":"<short>"}}
+{action_batch_hint()}"""
+
+def build_text_evaluation_prompt(goal: str, dom_summary: list, context: dict | None = None) -> str:
+    ctx = context or {}
+    return f"""
+Evaluate progress toward the goal from the DOM element list only (no screenshot).
+Set "confidence" (0-1): below 0.6 if completion depends on visual state the DOM text does not show.
+
+Goal: "{goal}"
+Step: {ctx.get('step', 0)}
+Last action: {json.dumps(ctx.get('lastAction'), ensure_ascii=False) if ctx.get('lastAction') else 'None'}
+{ctx.get('dom_changes', '')}
+
+DOM:
+{format_dom(dom_summary)}
+
+Return ONLY ONE JSON object:
+For COMPLETED: {{"status":"completed","reason":"<short>","evidence":"<dom_evidence>","confidence":<0-1>}}
+For REPLAN: {{"status":"replan","reason":"<why>","new_plan_needed":true,"confidence":<0-1>}}
+For CONTINUE: {{"status":"continue","action":"click|fill|goto|hover|waitUntil","selector":"<css|eid>","value":"<opt>","url":"<opt>","reason":"<short>","confidence":<0-1>}}
+{action_batch_hint()}"""
+
 # ============================
 # Small utilities
 # ============================
@@ -475,26 +631,170 @@ def compress_dom(dom: list) -> list:
     return result  # 모든 요소 포함
 
 
+# DOM 사전 랭킹 (DOM_PRERANK=0 이면 비활성화)
+DOM_PRERANK = os.getenv("DOM_PRERANK", "1") != "0"
+
+def current_plan_step(plan: list, step: int) -> dict | None:
+    """실행 프롬프트와 같은 기준(1부터 시작)으로 현재 계획 단계 반환"""
+    if not plan:
+        return None
+    idx = step - 1 if step >= 1 else 0
+    if idx < len(plan) and isinstance(plan[idx], dict):
+        return plan[idx]
+    return None
+
+def build_prompt_dom(raw_dom: list, dom_summary: list, goal: str, plan: list, step: int) -> list:
+    """프롬프트에 넣을 DOM - 목표/계획 단계 기준 상위 K개 + 구조 랜드마크만 유지"""
+    if not DOM_PRERANK:
+        return dom_summary
+    ranked = rank_dom(raw_dom, goal, current_plan_step(plan, step), hints=requirement_selector_hints(goal))
+    if len(ranked) == len(raw_dom):
+        return dom_summary
+    return compress_dom(ranked)
+
+
 # ============================
 # DOM 청킹 시스템
 # ============================
 
-def chunk_dom(dom_summary: list, chunk_size: int = 1000) -> list:
-    """DOM을 지정된 크기로 청크 분할"""
-    chunks = []
-    for i in range(0, len(dom_summary), chunk_size):
-        chunk = dom_summary[i:i+chunk_size]
-        chunks.append(chunk)
-    
-    logger.info(f"📦 DOM 청킹: {len(dom_summary)}개 요소 → {len(chunks)}개 청크 (청크당 최대 {chunk_size}개)")
+# 청크 호출 출력 상한 (call_llm 기본값) / 순차 모드 누적 컨텍스트 요약 여유분
+CHUNK_OUTPUT_TOKENS = 400
+CHUNK_CONTEXT_RESERVE = 200
+
+def chunk_token_budget(goal: str, image: PreparedImage | None, current_step: int, plan: list) -> int:
+    """청크 하나에 넣을 DOM 토큰 - 청크 호출이 거칠 캐스케이드 배포 중 가장 작은 컨텍스트 창/TPM 기준"""
+    deployments = model_cascade.tiers(image is not None, "chunk")
+    fixed = estimate_prompt_tokens(build_chunk_execution_prompt(goal, [], 1, 1, current_step, plan))
+    fixed += CHUNK_CONTEXT_RESERVE + CHUNK_OUTPUT_TOKENS + (image.tokens if image else 0)
+    tpm = {d: llm_scheduler.budget(d).tokens.capacity for d in deployments}
+    return chunk_budget.for_call(deployments, fixed, tpm)
+
+def chunk_dom(dom_summary: list, budget: int) -> list:
+    """DOM을 토큰 예산에 맞춰 영역 경계 우선으로 청크 분할 (dom_chunker.py)"""
+    chunks = pack_chunks(dom_summary, budget)
+    if len(chunks) > 1:
+        logger.info(f"📦 DOM 청킹: {len(dom_summary)}개 요소 → {len(chunks)}개 청크 "
+                    f"(청크당 최대 {budget} 토큰, 요소 수 {[len(c) for c in chunks]})")
     return chunks
 
 
-async def analyze_dom_chunks(goal: str, dom_summary: list, image_data: str, current_step: int, plan: list) -> dict:
-    """DOM 청크를 순차적으로 분석하여 최적 액션 찾기 (컨텍스트 유지)"""
+# 청크 분석 모드: parallel(동시 호출 + 조기 취소) / sequential(누적 컨텍스트 유지)
+CHUNK_ANALYSIS_MODE = os.getenv("CHUNK_ANALYSIS_MODE", "parallel")
+EARLY_STOP_CONFIDENCE = 0.92
+# parallel 모드에서 한 번에 띄우는 청크 호출 수 (0 = 전부 동시)
+CHUNK_PARALLELISM = env_int("CHUNK_PARALLELISM", 2)
+
+
+async def analyze_single_chunk(chunk: list, chunk_index: int, prompt: str, image: PreparedImage | None) -> tuple[dict | None, str | None]:
+    """청크 하나를 LLM에 보내고 (후보, 원본 응답) 반환 - 적합한 액션이 없으면 후보는 None"""
+    response = await (call_llm_with_image(prompt, image, schema="chunk") if image else call_llm(prompt, schema="chunk"))
+    parsed_action = parse_structured(response, "chunk").value
+    if parsed_action is None:
+        record_chunk_call("invalid")
+        return None, response
+
+    if parsed_action.get("action") in ["none", "no_action"]:
+        logger.info(f"⏭️ 청크 {chunk_index+1}에서 적합한 액션 없음")
+        record_chunk_call("none")
+        return {"action": parsed_action, "skip": True}, response
+
+    record_chunk_call("action")
+    # 스키마 없는 배포는 confidence 를 문자열/null 로 줄 수 있음 → 숫자로 맞춰 둬야 조기 종료 비교·정렬이 안전
+    try:
+        confidence = float(parsed_action.get("confidence", 0.5))
+    except (TypeError, ValueError):
+        confidence = 0.5
+    parsed_action["confidence"] = confidence
+    logger.info(f"✅ 청크 {chunk_index+1}에서 액션 발견: {parsed_action.get('action')} (신뢰도: {parsed_action.get('confidence', 'N/A')})")
+    return {
+        "chunk_index": chunk_index,
+        "action": parsed_action,
+        "elements_count": len(chunk),
+        "confidence": confidence,
+        "context_aware": False,
+    }, response
+
+
+async def analyze_dom_chunks(goal: str, chunks: list, image: PreparedImage | None, current_step: int, plan: list,
+                             mode: str | None = None, raw_dom: list | None = None,
+                             features: PageFeatures | None = None, viewport: dict | None = None) -> dict:
+    """DOM 청크를 분석하여 최적 액션 찾기 (parallel: 동시 호출, sequential: 컨텍스트 유지)
+
+    청크는 chunk_scheduler 가 매긴 우선순위 순서로 부르고, 고신뢰 후보가 나오거나
+    남은 청크의 기대 이득이 작으면 나머지를 생략한다.
+    features: 청크를 이어 붙인 DOM 의 page_features 결과 (없으면 여기서 한 번 추출)
+    viewport: extension context.viewport (스크롤 위치/화면 높이 - 청크 화면 위치 점수용)
+    """
+    features = features or extract_page_features([el for chunk in chunks for el in chunk], goal)
+    schedule = schedule_chunks(chunks, goal, current_plan_step(plan, current_step), raw_dom,
+                               requirement_selector_hints(goal), EARLY_STOP_CONFIDENCE, features=features,
+                               viewport=viewport)
+    mode = mode or CHUNK_ANALYSIS_MODE
+    if mode == "sequential":
+        candidate_actions, visited = await analyze_chunks_sequential(goal, chunks, image, current_step, plan, schedule,
+                                                                     features)
+    else:
+        candidate_actions, visited = await analyze_chunks_parallel(goal, chunks, image, current_step, plan, schedule)
+    record_chunks(len(chunks), visited)
+    logger.info(f"📊 청크 호출 {visited}/{len(chunks)}개")
     
-    # DOM을 1000개씩 분할 (요청 반영)
-    chunks = chunk_dom(dom_summary, chunk_size=1000)
+    # 후보 액션들 중 최선 선택
+    if candidate_actions:
+        logger.info(f"🎯 총 {len(candidate_actions)}개 후보 액션 발견")
+        return select_best_action(candidate_actions, goal)
+    else:
+        logger.info("❌ 모든 청크에서 적합한 액션을 찾지 못함")
+        return {"action": "end", "reason": "No suitable action found in any DOM chunk", "confidence": 0.0}
+
+
+def _best_confidence(candidate_actions: list) -> float | None:
+    return max((c["confidence"] for c in candidate_actions), default=None)
+
+
+async def analyze_chunks_parallel(goal: str, chunks: list, image: PreparedImage | None, current_step: int, plan: list,
+                                  schedule: ChunkSchedule) -> tuple[list, int]:
+    """우선순위 순서로 CHUNK_PARALLELISM 개씩 동시 호출 (속도 제한은 스케줄러가 담당), 종료 조건이면 나머지 취소"""
+    window = CHUNK_PARALLELISM or len(chunks)
+    logger.info(f"⚡ 병렬 청크 분석: {len(chunks)}개 청크, 동시 {min(window, len(chunks))}개씩")
+    queue = list(schedule.order)
+    tasks = {}
+    candidate_actions = []
+    unvisited = set(queue)
+    pending = set()
+    try:
+        while queue or pending:
+            while queue and len(pending) < window:
+                i = queue.pop(0)
+                prompt = build_chunk_execution_prompt(goal, chunks[i], i+1, len(chunks), current_step, plan)
+                task = asyncio.create_task(analyze_single_chunk(chunks[i], i, prompt, image))
+                tasks[task] = i
+                pending.add(task)
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = tasks[task]
+                unvisited.discard(i)
+                try:
+                    candidate, _ = task.result()
+                except Exception as e:
+                    logger.error(f"❌ 청크 {i+1} 분석 실패: {e}")
+                    continue
+                if candidate and not candidate.get("skip"):
+                    candidate_actions.append(candidate)
+            stop, why = schedule.should_stop(_best_confidence(candidate_actions), unvisited)
+            if stop:
+                logger.info(f"🛑 청크 분석 조기 종료: {why} - 진행 중 {len(pending)}개 취소, 미호출 {len(queue)}개 생략")
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    return candidate_actions, len(tasks)
+
+
+async def analyze_chunks_sequential(goal: str, chunks: list, image: PreparedImage | None, current_step: int, plan: list,
+                                    schedule: ChunkSchedule, features: PageFeatures) -> tuple[list, int]:
+    """청크를 우선순위 순서로 분석하며 이전 청크의 발견 사항을 다음 프롬프트에 누적"""
     candidate_actions = []
     accumulated_context = {
         "page_structure": [],
@@ -504,61 +804,50 @@ async def analyze_dom_chunks(goal: str, dom_summary: list, image_data: str, curr
         "main_content_area": None,
         "action_candidates_count": 0
     }
-    best_confidence = 0.0
-    
-    for i, chunk in enumerate(chunks):
-        logger.info(f"🔍 청크 {i+1}/{len(chunks)} 분석 중... ({len(chunk)}개 요소)")
+    unvisited = set(schedule.order)
+    visited = 0
+    # 청크 i 가 이어 붙인 DOM 에서 시작하는 위치 (features 구간 조회용)
+    offsets = [0]
+    for chunk in chunks:
+        offsets.append(offsets[-1] + len(chunk))
+
+    for n, i in enumerate(schedule.order):
+        chunk = chunks[i]
+        logger.info(f"🔍 청크 {i+1}/{len(chunks)} 분석 중... ({n+1}번째, {len(chunk)}개 요소)")
         
-        # 이전 컨텍스트를 포함한 청크별 실행 프롬프트 생성
+        # 이전 컨텍스트를 포함한 청크별 실행 프롬프트 생성 (첫 호출이 첫 청크가 아닐 수 있으므로 방문 순번 기준)
         prompt = build_chunk_execution_prompt_with_context(
-            goal, chunk, i+1, len(chunks), current_step, plan, accumulated_context
+            goal, chunk, n+1, len(chunks), current_step, plan, accumulated_context
         )
+        visited += 1
+        unvisited.discard(i)
         
         try:
-            # 청크 간 딜레이 추가 (429 에러 방지)
-            if i > 0:  # 첫 번째 청크가 아니면 딜레이
-                await asyncio.sleep(1.5)  # 1.5초 대기
-                logger.info(f"⏳ 청크 간 딜레이 (1.5초) - 429 에러 방지")
+            # 호출 간격은 rate_limiter 스케줄러가 배포 예산에 맞춰 조절
+            candidate, response = await analyze_single_chunk(chunk, i, prompt, image)
+            if not candidate:
+                continue
             
-            response = await call_llm_with_image(prompt, image_data)
-            action_json = extract_top_level_json(response)
+            # 컨텍스트 정보 업데이트
+            update_accumulated_context(accumulated_context, chunk, candidate["action"], response,
+                                       features.chunk_context(offsets[i], offsets[i] + len(chunk)))
             
-            if action_json:
-                parsed_action = json.loads(action_json)
-                
-                # 컨텍스트 정보 업데이트
-                update_accumulated_context(accumulated_context, chunk, parsed_action, response)
-                
-                if parsed_action.get("action") not in ["none", "no_action"]:
-                    confidence = parsed_action.get("confidence", 0.5)
-                    candidate_actions.append({
-                        "chunk_index": i,
-                        "action": parsed_action,
-                        "elements_count": len(chunk),
-                        "confidence": confidence,
-                        "context_aware": True
-                    })
-                    accumulated_context["action_candidates_count"] += 1
-                    best_confidence = max(best_confidence, confidence)
-                    logger.info(f"✅ 청크 {i+1}에서 액션 발견: {parsed_action.get('action')} (신뢰도: {parsed_action.get('confidence', 'N/A')})")
-                    # 높은 신뢰도 후보 발견 시 조기 종료 → 호출 수 절감
-                    if best_confidence >= 0.92:
-                        logger.info("🛑 높은 신뢰도(>=0.92) 후보 발견으로 청크 분석 조기 종료")
-                        break
-                else:
-                    logger.info(f"⏭️ 청크 {i+1}에서 적합한 액션 없음")
+            if not candidate.get("skip"):
+                candidate["context_aware"] = True
+                candidate_actions.append(candidate)
+                accumulated_context["action_candidates_count"] += 1
         
         except Exception as e:
             logger.error(f"❌ 청크 {i+1} 분석 실패: {e}")
             continue
+
+        # 고신뢰 후보 또는 남은 청크의 기대 이득이 작으면 종료 → 호출 수 절감
+        stop, why = schedule.should_stop(_best_confidence(candidate_actions), unvisited)
+        if stop:
+            logger.info(f"🛑 청크 분석 조기 종료: {why} - 남은 {len(unvisited)}개 생략")
+            break
     
-    # 후보 액션들 중 최선 선택
-    if candidate_actions:
-        logger.info(f"🎯 총 {len(candidate_actions)}개 후보 액션 발견")
-        return select_best_action(candidate_actions, goal)
-    else:
-        logger.info("❌ 모든 청크에서 적합한 액션을 찾지 못함")
-        return {"action": "end", "reason": "No suitable action found in any DOM chunk"}
+    return candidate_actions, visited
 
 
 def select_best_action(candidate_actions: list, goal: str) -> dict:
@@ -597,7 +886,7 @@ def build_chunk_execution_prompt(goal: str, chunk: list, chunk_num: int, total_c
 **분석 범위:** 청크 {chunk_num}/{total_chunks} ({len(chunk)}개 요소){plan_context}
 
 **이 청크의 DOM 요소들:**
-{json.dumps(chunk, ensure_ascii=False, indent=2)}
+{format_dom(chunk)}
 
 **분석 지침:**
 1. 🎯 **목표 달성을 위한 최적 액션 찾기**
@@ -611,7 +900,7 @@ def build_chunk_execution_prompt(goal: str, chunk: list, chunk_num: int, total_c
 
 **출력 형식:**
 적합한 액션이 있으면:
-{{"action":"click|fill|goto|google_search|hover|waitUntil", "selector":"<css>", 
+{{"action":"click|fill|goto|google_search|hover|waitUntil", "selector":"<css|eid>", 
   "text":"<optional>", "value":"<optional>", "url":"<optional>", "timeout":1000,
   "confidence": 0.8, "reason": "why this action is suitable"}}
 
@@ -643,14 +932,14 @@ def build_chunk_execution_prompt_with_context(goal: str, chunk: list, chunk_num:
 {context_summary}
 
 **현재 청크의 DOM 요소들:**
-{json.dumps(chunk, ensure_ascii=False, indent=2)}
+{format_dom(chunk)}
 
 **분석 지침:**
 1. 🧠 **이전 분석 결과를 고려하여** 목표 달성을 위한 최적 액션 찾기
 2. 🔍 **이 청크 내에서만 액션 가능한 요소 탐색**
 3. 📊 **신뢰도 점수 부여 (0.0~1.0)**
 4. 🔗 **이전 청크에서 발견된 정보와의 연관성 고려**
-5. 🚦 "none" 규칙: 이 청크가 메인 콘텐츠(아이템 영역)에 속하고 신뢰도 ≥ 0.9의 명확한 대상이 있을 때만 액션을 제안하세요. 그렇지 않으면 반드시 {"action":"none"}을 반환하세요. 이전 청크에서 이미 후보가 있다면, 그보다 명백히 더 좋은 경우에만 제안하세요.
+5. 🚦 "none" 규칙: 이 청크가 메인 콘텐츠(아이템 영역)에 속하고 신뢰도 ≥ 0.9의 명확한 대상이 있을 때만 액션을 제안하세요. 그렇지 않으면 반드시 {{"action":"none"}}을 반환하세요. 이전 청크에서 이미 후보가 있다면, 그보다 명백히 더 좋은 경우에만 제안하세요.
 
 **액션 우선순위 (컨텍스트 기반):**
 - 🎯 목표와 직접 관련되고 이전 맥락과 일치하는 요소 (최고 신뢰도)
@@ -659,7 +948,7 @@ def build_chunk_execution_prompt_with_context(goal: str, chunk: list, chunk_num:
 
 **출력 형식:**
 적합한 액션이 있으면(위 규칙을 만족하는 경우에만 하나의 후보):
-{{"action":"click|fill|goto|google_search|hover|waitUntil", "selector":"<css>", 
+{{"action":"click|fill|goto|google_search|hover|waitUntil", "selector":"<css|eid>", 
   "text":"<optional>", "value":"<optional>", "url":"<optional>", "timeout":1000,
   "confidence": 0.8, "reason": "why this action is suitable with context"}}
 
@@ -712,85 +1001,36 @@ def build_context_summary(accumulated_context: dict, current_chunk: int, total_c
     return "**🧠 이전 청크 분석 결과:**\n" + "\n".join(f"   - {part}" for part in summary_parts)
 
 
-def update_accumulated_context(context: dict, chunk: list, parsed_action: dict, response: str):
-    """청크 분석 결과를 누적 컨텍스트에 업데이트"""
-    
-    # 페이지 구조 요소 탐지
-    structural_elements = []
-    for element in chunk:
-        tag = element.get("tag", "").lower()
-        if tag in ["nav", "header", "main", "section", "aside", "footer"]:
-            structural_elements.append(tag)
-        elif "nav" in element.get("class", "").lower():
-            structural_elements.append("navigation")
-        elif "menu" in element.get("class", "").lower():
-            structural_elements.append("menu")
-    
-    if structural_elements:
-        context["page_structure"].extend(structural_elements)
-        context["page_structure"] = list(set(context["page_structure"]))  # 중복 제거
-    
-    # 주요 영역 탐지
-    key_areas = []
-    for element in chunk:
-        text = element.get("text", "").lower()
-        class_name = element.get("class", "").lower()
-        if any(keyword in text for keyword in ["메일", "mail", "inbox", "받은편지함"]):
-            key_areas.append("메일 영역")
-        elif any(keyword in class_name for keyword in ["content", "main", "list"]):
-            key_areas.append("콘텐츠 영역")
-        elif element.get("tag") == "form":
-            key_areas.append("폼 영역")
-    
-    if key_areas:
-        context["key_areas"].extend(key_areas)
-        context["key_areas"] = list(set(context["key_areas"]))  # 중복 제거
+def update_accumulated_context(context: dict, chunk: list, parsed_action: dict, response: str,
+                               chunk_features: dict | None = None):
+    """청크 분석 결과를 누적 컨텍스트에 업데이트 (chunk_features: PageFeatures.chunk_context 구간 요약)"""
+    found = chunk_features or extract_page_features(chunk).chunk_context(0, len(chunk))
     
-    # 인터랙티브 요소 탐지
-    interactive_types = []
-    for element in chunk:
-        tag = element.get("tag", "").lower()
-        if tag in ["button", "input", "a", "select", "textarea"]:
-            interactive_types.append(tag)
-    
-    if interactive_types:
-        context["interactive_elements"].extend(interactive_types)
-        context["interactive_elements"] = list(set(context["interactive_elements"]))  # 중복 제거
+    # 페이지 구조 / 주요 영역 / 인터랙티브 요소 (중복 제거)
+    for key in ("page_structure", "key_areas", "interactive_elements"):
+        if found[key]:
+            context[key] = list(set(context[key]) | found[key])
     
     # 내비게이션 발견
-    if any("nav" in element.get("tag", "").lower() or "nav" in element.get("class", "").lower() 
-           for element in chunk):
+    if found["navigation_found"]:
         context["navigation_found"] = True
     
     # 메인 콘텐츠 영역 식별
-    for element in chunk:
-        if element.get("tag") == "main" or "main" in element.get("class", "").lower():
-            context["main_content_area"] = "main"
-            break
-        elif "content" in element.get("class", "").lower():
-            context["main_content_area"] = "content"
-            break
-
-
-def save_debug_image(image_data: str, step: int, goal: str | None = None) -> str | None:
-    try:
-        logger.info(f"💾 이미지 저장 시작 (스텝: {step}, 목표: {goal})")
-        original_data = image_data
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        goal_safe = ""
-        if goal:
-            goal_safe = "_" + re.sub(r"[^\w-]", "_", "_".join(goal.split()[:3]))[:20]
-        filename = f"debug_images/step_{step}{goal_safe}_{ts}.png"
-        with open(filename, 'wb') as f:
-            f.write(image_bytes)
-        logger.info(f"✅ 이미지 저장: {filename} ({len(image_bytes)} bytes)")
-        return filename
-    except Exception as e:
-        logger.error(f"❌ 이미지 저장 실패: {e}")
+    if found["main_content_area"]:
+        context["main_content_area"] = found["main_content_area"]
+
+
+def save_debug_image(image_data: str, step: int, goal: str | None = None, ext: str = "png") -> str | None:
+    """스크린샷 저장 예약 - 디코딩/쓰기는 산출물 기록기 워커 스레드에서 (샘플링/큐 초과 시 None)"""
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    goal_safe = ""
+    if goal:
+        goal_safe = "_" + re.sub(r"[^\w-]", "_", "_".join(goal.split()[:3]))[:20]
+    filename = f"debug_images/step_{step}{goal_safe}_{ts}.{ext}"
+    if not artifact_writer.write_image(filename, image_data):
         return None
+    logger.info(f"💾 이미지 저장 예약: {filename}")
+    return filename
 
 
 def clean_action(action: dict) -> dict:
@@ -802,34 +1042,60 @@ def clean_action(action: dict) -> dict:
         a.pop("attribute", None)
     return a
 
+def normalize_search(action: dict) -> dict:
+    """google_search → goto 변환 (검색어만 있고 URL 이 없을 때)
+
+    검색어가 사이트 이름 자체("국세청 홈페이지")면 검색 결과 페이지를 거치지 않고 그 사이트로 바로 이동
+    """
+    if action.get("action") == "google_search" and action.get("query") and not action.get("url"):
+        site = site_directory.resolve(action["query"], whole=True)
+        if site:
+            logger.info(f"🗂️ 검색 대신 사이트 직접 이동: {action['query']} → {site.url}")
+            action["url"] = site.url
+        else:
+            action["url"] = f"https://www.google.com/search?q={quote(action['query'])}"
+        action["action"] = "goto"
+    return action
+
+def build_action_batch(result: dict) -> list:
+    """첫 액션 + next_actions 를 안전한 체인으로 정리
+
+    같은 페이지에서 도는 액션(click/fill/hover/waitUntil)만 이어 붙이고, 페이지 이동(goto)은 마지막에만 허용.
+    selector 가 있는 후속 액션에 가드가 없으면 "그 요소가 있을 때만" 가드를 붙인다.
+    """
+    result = dict(result)
+    followups = result.pop("next_actions", None) or []
+    first = clean_action(normalize_search(result))
+    actions = [first]
+    if not ACTION_BATCH or first.get("action") not in BATCH_ACTIONS:
+        return actions
+    for item in followups[:ACTION_BATCH_MAX - 1]:
+        if not isinstance(item, dict):
+            break
+        item = normalize_search(dict(item))
+        kind = item.get("action")
+        if kind not in BATCH_ACTIONS | NAVIGATION_ACTIONS or (kind in ("click", "fill", "hover") and not item.get("selector")):
+            logger.info(f"✂️ 액션 묶음 중단: 허용되지 않는 후속 액션 {kind}")
+            break
+        if not item.get("guard") and item.get("selector"):
+            item["guard"] = {"selector": item["selector"]}
+        actions.append(clean_action(item))
+        if kind in NAVIGATION_ACTIONS:
+            break
+    return actions
+
+def action_message(step: int, actions: list) -> dict:
+    """액션 1개면 기존 action 메시지, 여러 개면 actions 묶음"""
+    if len(actions) == 1:
+        return {"type": "action", "step": step, "action": actions[0]}
+    logger.info(f"🔗 액션 묶음 {len(actions)}개 전송: {[a.get('action') for a in actions]}")
+    return {"type": "actions", "step": step, "actions": actions}
+
 # 더 견고한 JSON 추출: 중괄호 균형 파서
 
 def extract_top_level_json(s: str) -> str | None:
-    s = s.strip()
-    # 배열 우선
-    if s and s[0] == '[':
-        bal = 0
-        for i, ch in enumerate(s):
-            if ch == '[':
-                bal += 1
-            elif ch == ']':
-                bal -= 1
-                if bal == 0:
-                    return s[:i+1]
-        return None
-    # 객체
-    start = s.find('{')
-    if start == -1:
-        return None
-    bal = 0
-    for i in range(start, len(s)):
-        if s[i] == '{':
-            bal += 1
-        elif s[i] == '}':
-            bal -= 1
-            if bal == 0:
-                return s[start:i+1]
-    return None
+    # '[' / '{' 중 먼저 나오는 쪽 (코드 펜스·앞 문장 건너뜀) - 스트리밍 파서와 같은 규칙
+    return scan_top_level_json(s)
 
 # 간단해진 자연어 → 명령문 정제기
 
@@ -841,11 +1107,6 @@ async def refine_prompt_with_llm(user_message: str) -> str:
     if any(k in user_message for k in site_keywords):
         return f"Google에서 '{user_message}' 검색 후 원하는 결과 클릭"
 
-    client = AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version="2024-02-15-preview",
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    )
     prompt = f"""
 Convert the user's intent into ONE direct browser command (Korean).
 Prefer concise imperative. If it's pure navigation, output only '<URL>로 이동'.
@@ -858,13 +1119,365 @@ Prefer concise imperative. If it's pure navigation, output only '<URL>로 이동
 - "로그인 페이지로 가" → "로그인 링크 클릭"
 명령문:
 """
-    res = client.chat.completions.create(
-        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1-mini"),
-        messages=[{"role":"user","content":prompt}],
-        max_tokens=80,
-        temperature=0.1,
-    )
-    return res.choices[0].message.content.strip().replace("\n"," ")
+    res = await call_llm(prompt, max_tokens=80, stream=False)
+    if not res:
+        raise RuntimeError("프롬프트 정제 LLM 응답 없음")
+    return res.strip().replace("\n"," ")
+
+# ============================
+# WebSocket 메시지 처리 (세션 단위)
+# ============================
+async def handle_user_continue(session: Session):
+    websocket = session.websocket
+    logger.info("▶️ 사용자 진행 요청 - 자동화 재개")
+    session.login_skip_detection = True  # 로그인 감지 스킵 플래그 설정
+    await websocket.send_text(json.dumps({
+        "type": "automation_resumed", 
+        "message": "자동화가 재개됩니다.",
+        "timestamp": datetime.now().isoformat()
+    }))
+    # DOM 재요청
+    await websocket.send_text(json.dumps({
+        "type": "request_dom",
+        "message": "로그인 완료 후 페이지 정보를 다시 분석합니다."
+    }))
+
+
+async def handle_init(session: Session, payload: dict):
+    websocket = session.websocket
+    goal_logger = session.goal_logger
+    try:
+        user_goal = payload["message"]
+        logger.info(f"🆕 새 목표: {user_goal}")
+        goal_logger.start_new_goal(user_goal)
+        session_recorder.record(session, payload)
+
+        goal_logger.log_server_event("PROMPT_ANALYSIS", f"프롬프트 분석 시작: {user_goal}")
+        needs_dom = analyze_prompt_needs_dom(user_goal)
+        goal_logger.log_server_event("DOM_DECISION", f"DOM 필요 여부: {needs_dom}")
+
+        if needs_dom:
+            goal_logger.log_server_event("DOM_REQUEST", "DOM이 필요한 작업으로 판단 - DOM 요청")
+            await websocket.send_text(json.dumps({
+                "type": "request_dom",
+                "message": "현재 페이지 정보가 필요합니다.",
+            }))
+        else:
+            goal_logger.log_server_event("DIRECT_PROCESSING", "프롬프트만으로 처리")
+            refined_goal = await refine_prompt_with_llm(user_goal)
+            goal_logger.log_server_event("GOAL_REFINED", f"정제된 목표: {refined_goal}")
+            if "로 이동" in refined_goal:
+                url = refined_goal.split("로 이동")[0]
+                action = {"action": "goto", "url": url}
+                goal_logger.log_server_event("ACTION_GENERATED", f"직접 액션: {action}")
+                await websocket.send_text(json.dumps({
+                    "type": "action", "step": 1, "action": action,
+                }))
+            else:
+                goal_logger.log_server_event("RECLASSIFY_DOM", "DOM 필요로 재분류")
+                await websocket.send_text(json.dumps({
+                    "type": "request_dom",
+                    "message": "현재 페이지 정보가 필요합니다.",
+                }))
+        logger.info("✅ init 처리 완료")
+    except Exception as e:
+        logger.error(f"❌ init 처리 중 오류: {e}")
+        await websocket.send_text(json.dumps({
+            "type": "error", "detail": f"초기화 중 오류: {str(e)}",
+    }))
+
+
+# 텍스트 전용 메시지 (와이어프레임 꺼짐): 텍스트 배포로 처리하고 신뢰도가 낮을 때만 스크린샷 요청
+TEXT_ONLY_TYPES = ("dom_only", "dom_evaluation")
+EVALUATION_TYPES = ("dom_with_image_evaluation", "dom_evaluation")
+TEXT_ESCALATION = os.getenv("TEXT_ESCALATION", "1") != "0"
+TEXT_ESCALATE_CONFIDENCE = env_float("TEXT_ESCALATE_CONFIDENCE", 0.6)
+
+
+def needs_vision(session: Session, result: dict, goal: str, step: int, is_eval: bool) -> bool:
+    """텍스트 전용 결과의 신뢰도가 기준 미만이면 스크린샷 요청 (같은 단계에서는 한 번만)"""
+    if not TEXT_ESCALATION:
+        return False
+    confidence = result.get("confidence")
+    if not isinstance(confidence, (int, float)) or confidence >= TEXT_ESCALATE_CONFIDENCE:
+        return False
+    key = (goal, step, is_eval)
+    if session.vision_requested == key:
+        return False
+    session.vision_requested = key
+    return True
+
+
+async def handle_dom_message(session: Session, payload: dict, message_bytes: int):
+    websocket = session.websocket
+    goal_logger = session.goal_logger
+    is_eval = payload.get("type") in EVALUATION_TYPES or payload.get("evaluationMode", False)
+    text_only = payload.get("type") in TEXT_ONLY_TYPES
+    logger.info(("📊 DOM(텍스트 전용) 처리 시작" if text_only else "📊 DOM+이미지 처리 시작") + (" (평가 모드)" if is_eval else ""))
+
+    context = payload.get("context", {})
+    goal = context.get("goal", payload.get("message", ""))
+    step = context.get("step", 0)
+    plan = context.get("plan", [])
+
+    if not goal:
+        await websocket.send_text(json.dumps({"type": "error", "detail": "목표가 설정되지 않았습니다."}))
+        return
+    try:
+        session.update_progress(goal, plan, step)
+    except SessionLimitExceeded as e:
+        await websocket.send_text(json.dumps({"type": "error", "detail": str(e)}))
+        return
+    # 재연결된 extension 이면 같은 목표 로그 파일에 이어쓰기
+    session_manager.bind_client(session, context.get("sessionId"), goal)
+    dom_state = session.dom_state
+
+    # DOM 수신: 델타면 마지막 DOM에 적용, 전체면 교체 후 버전 확인(ack)
+    try:
+        if "dom_delta" in payload:
+            raw_dom = dom_state.apply_delta(payload["dom_delta"])
+        else:
+            raw_dom = dom_state.replace(payload.get("dom", []), payload.get("domVersion"))
+            session_manager.note_dom(session, message_bytes)
+    except DomDeltaMismatch as e:
+        logger.info(f"🔁 DOM 델타 적용 불가 - 전체 재전송 요청: {e}")
+        await websocket.send_text(json.dumps({"type": "dom_resync", "evaluationMode": is_eval}))
+        return
+    if dom_state.version is not None:
+        await websocket.send_text(json.dumps({"type": "dom_ack", "version": dom_state.version}))
+    session_recorder.record(session, payload, raw_dom)
+    dom_changes = describe_dom_changes(dom_state.last_changes)
+    if dom_changes:
+        context = {**context, "dom_changes": dom_changes}
+
+    try:
+        with observe_phase("compress_dom"):
+            dom_summary = compress_dom(raw_dom)
+        logger.info(f"📊 DOM 압축 완료: {len(dom_summary)} 요소")
+
+        # === 새로운 분석 단계들 ===
+        with observe_phase("page_analysis"):
+            # 1. 요구사항 → 웹 가이드 변환
+            web_guide = translate_requirement_to_web_guide(goal)
+            logger.info(f"🔄 요구사항 변환: {goal} → {web_guide}")
+
+            # 2. 페이지 이해도 분석 (LLM 위임 방식)
+            # 로그인 신호 / 랜드마크 / 조작 요소 / 목표 키워드를 DOM 한 번 순회로 추출 (page_features.py)
+            page_features = extract_page_features(dom_summary, goal)
+            page_analysis = analyze_page_understanding(dom_summary, page_features)
+            logger.info(f"📊 페이지 기본 정보: {page_analysis['dom_elements']}개 요소, {page_analysis['analysis_method']} 방식")
+
+            # 3. 목표 진행도 평가 (기본 계산만)
+            last_action = context.get("lastAction") if context else None
+            total_steps = len(plan) if plan else 1
+            progress_eval = evaluate_goal_progress(goal, step, total_steps, page_analysis, last_action)
+            logger.info(f"🎯 진행도: {progress_eval['progress_percentage']:.1f}% 완료 ({progress_eval['current_step']}/{progress_eval['total_steps']} 단계)")
+
+        # 분석 결과를 클라이언트에 전송
+        analysis_result = {
+            "type": "page_analysis",
+            "web_guide": web_guide,
+            "page_understanding": page_analysis,
+            "progress_evaluation": progress_eval,
+            "timestamp": datetime.now().isoformat()
+        }
+        await websocket.send_text(json.dumps(analysis_result, ensure_ascii=False))
+        logger.info("📊 페이지 분석 결과 전송 완료")
+
+        # 로그인 페이지 감지 시 대기 모드 (스킵 플래그 확인)
+        if page_analysis.get("is_login_page") and not session.login_skip_detection:
+            logger.info("🔐 로그인 페이지 감지 - 사용자 대기 모드 활성화")
+            await websocket.send_text(json.dumps({
+                "type": "login_detected",
+                "message": "로그인이 필요합니다. 로그인을 완료한 후 '진행' 버튼을 눌러주세요.",
+                "show_continue_button": True,
+                "timestamp": datetime.now().isoformat()
+            }))
+            return  # 자동화 일시 정지
+        elif session.login_skip_detection:
+            logger.info("🔓 로그인 감지 스킵 - 사용자가 진행 요청했음")
+            session.login_skip_detection = False  # 플래그 리셋
+    except Exception as e:
+        logger.error(f"❌ DOM 압축 실패: {e}")
+        return
+
+    # 기록된 워크플로우와 URL/DOM 구조가 같은 단계면 LLM 없이 재생
+    session_id = context.get("sessionId")
+    wf_kind = "plan" if not plan and step == 0 else ("evaluate" if is_eval else "execute")
+    with observe_phase("workflow_match"):
+        replay = workflow_recorder.observe(session_id, goal, wf_kind, context.get("url"), dom_summary,
+                                           allow_replay=payload.get("replay", True) is not False)
+    if workflow_recorder.enabled and session_id:
+        record_cache("workflow", replay is not None)
+    if replay is not None:
+        if replay.get("type") in ("action", "actions"):
+            replay["step"] = step
+        logger.info(f"📼 워크플로우 재생 ({wf_kind}): {replay.get('type')}")
+        goal_logger.log_server_event("WORKFLOW_REPLAY", f"기록된 {wf_kind} 단계 재생", replay)
+        await send_step_message(websocket, session_id, replay, replayed=True, goal_log=goal_logger)
+        return
+
+    # 스크린샷: 한 번 디코딩 → 축소/재인코딩. IMAGE_DEDUP 을 켜면 화면 해시와 DOM 상태가 모두 직전과 같을 때만
+    # 저해상도 재사용 또는 생략 (입력값 채움 등 해시로 안 보이는 변화는 DOM 이 잡음)
+    has_screenshot = bool(payload.get("image"))
+    with observe_phase("image_prepare"):
+        screen_fp = dom_state_fingerprint(dom_summary) if has_screenshot and IMAGE_DEDUP != "off" else None
+        image = await asyncio.to_thread(prepare_image, payload.get("image"), session.last_image_hash,
+                                        dom_unchanged=screen_fp is not None and screen_fp == session.last_image_dom_fp)
+    if image:
+        if not image.reused:
+            session.last_image_hash = image.phash
+            session.last_image_dom_fp = screen_fp
+        save_debug_image(image.data, step, goal, image.extension)
+
+    # 프롬프트용 DOM: 관련도 상위 요소 + 랜드마크 (페이지 분석은 전체 DOM 기준)
+    with observe_phase("prompt_dom"):
+        prompt_dom = build_prompt_dom(raw_dom, dom_summary, goal, plan, step)
+        # 사전 랭킹으로 줄지 않았으면 페이지 특징을 청크 분석에서 그대로 재사용 (요소 순서 동일)
+        prompt_features = page_features if prompt_dom is dom_summary else None
+        # 짧은 요소 ID(e0, e1...) 부여 - 모델이 돌려준 ID는 응답 처리 시 selector로 복원
+        prompt_dom, id_map = assign_element_ids(prompt_dom)
+
+    # 응답 캐시 키 재료 (payload "cache": false 면 이번 요청은 캐시 우회)
+    use_cache = payload.get("cache", True) is not False
+    dom_fp = dom_fingerprint(prompt_dom) if use_cache else None
+    image_hash = image.phash if use_cache and image else None
+    step_extra = {"step": step, "plan_step": current_plan_step(plan, step), "lastAction": context.get("lastAction")}
+
+    # Plan (if empty & step==0)
+    if not plan and step == 0:
+        goal_logger.log_server_event("PLANNING_START", f"이미지 기반 계획 수립 (DOM {len(dom_summary)})")
+        with observe_phase("prompt_build"):
+            if text_only:
+                prompt = build_text_planning_prompt(goal, prompt_dom, context)
+            else:
+                prompt = build_planning_prompt_with_image(goal, prompt_dom, context)
+        cache_key = build_cache_key("plan", goal, dom_fp, image_hash, bool(image))
+        plan_resp = await call_llm_cached(prompt, image, cache_key, goal_logger, schema="plan")
+        if plan_resp:
+            with observe_phase("json_extract"):
+                parsed_plan = parse_structured(plan_resp, "plan")
+            if parsed_plan.ok:
+                parsed = resolve_element_ids(parsed_plan.value, id_map)
+                goal_logger.log_server_event("PLAN_GENERATED", f"{len(parsed)} 단계 계획")
+                if text_only:
+                    record_text_only("plan", False)
+                await send_step_message(websocket, session_id, {"type": "plan", "plan": parsed}, goal_log=goal_logger)
+                return
+            goal_logger.log_server_event("ERROR", f"Planning JSON 파싱 실패: {parsed_plan.errors[:3]}")
+
+    # Execute or Evaluate
+    if is_eval:
+        with observe_phase("prompt_build"):
+            if text_only:
+                prompt = build_text_evaluation_prompt(goal, prompt_dom, context)
+            else:
+                prompt = build_evaluation_prompt_with_image(goal, prompt_dom, context)
+        cache_key = build_cache_key("evaluate", goal, dom_fp, image_hash, bool(image), step_extra)
+        response = await call_llm_cached(prompt, image, cache_key, goal_logger, schema="evaluation")
+
+        if not response:
+            await websocket.send_text(json.dumps({"type": "error", "detail": "LLM 응답 없음"}))
+            return
+
+        logger.info(f"🧠 평가 LLM 응답: {response}")
+        with observe_phase("json_extract"):
+            parsed = parse_structured(response, "evaluation")
+        if not parsed.ok:
+            logger.error(f"❌ JSON 파싱 실패 - 원본: {response}")
+            await websocket.send_text(json.dumps({"type": "error", "detail": f"JSON 파싱 실패: {response}"}))
+            return
+        result = parsed.value
+    else:
+        # 실행 모드: DOM 토큰이 한 호출 예산을 넘을 때만 청킹
+        chunks = chunk_dom(prompt_dom, chunk_token_budget(goal, image, step, plan or []))
+        if len(chunks) > 1:
+            logger.info(f"🔄 대용량 DOM 감지 ({len(prompt_dom)}개) - 청킹 모드 사용")
+            try:
+                cache_key = build_cache_key("chunks", goal, dom_fp, image_hash, bool(image), step_extra)
+                cached = response_cache.get(cache_key) if cache_key else None
+                if cache_key:
+                    record_cache("chunks", cached is not None)
+                if cached is not None:
+                    logger.info("⚡ 청킹 분석 결과 캐시 적중")
+                    result = json.loads(cached)
+                else:
+                    with observe_phase("chunk_analysis"):
+                        result = await analyze_dom_chunks(goal, chunks, image, step, plan or [], raw_dom=raw_dom,
+                                                          features=prompt_features, viewport=context.get("viewport"))
+                    if cache_key and result.get("action") != "end":
+                        response_cache.put(cache_key, json.dumps(result, ensure_ascii=False))
+            except Exception as e:
+                logger.error(f"❌ 청킹 분석 실패: {e}")
+                await websocket.send_text(json.dumps({"type": "error", "detail": f"청킹 분석 실패: {e}"}))
+                return
+        else:
+            logger.info(f"📝 일반 DOM ({len(prompt_dom)}개) - 단일 호출 모드")
+            with observe_phase("prompt_build"):
+                if has_screenshot:
+                    prompt = build_execution_prompt_with_image(goal, plan, step, prompt_dom, context) if plan else build_prompt_with_image(goal, prompt_dom, step, context)
+                else:
+                    prompt = build_text_execution_prompt(goal, plan, step, prompt_dom, context)
+            cache_key = build_cache_key("execute", goal, dom_fp, image_hash, bool(image), step_extra)
+            response = await call_llm_cached(prompt, image, cache_key, goal_logger, schema="action")
+
+            if not response:
+                await websocket.send_text(json.dumps({"type": "error", "detail": "LLM 응답 없음"}))
+                return
+
+            logger.info(f"🧠 LLM 전체 응답: {response}")
+            with observe_phase("json_extract"):
+                parsed = parse_structured(response, "action")
+            if not parsed.ok:
+                logger.error(f"❌ JSON 파싱 실패 - 원본: {response}")
+                await websocket.send_text(json.dumps({"type": "error", "detail": f"JSON 파싱 실패: {response}"}))
+                return
+            result = parsed.value
+
+    # 텍스트 전용 단계: 모델이 DOM 만으로 확신하지 못하면 스크린샷을 받아 비전 배포로 다시 처리
+    if text_only:
+        escalate = needs_vision(session, result, goal, step, is_eval)
+        record_text_only(wf_kind, escalate)
+        if escalate:
+            logger.info(f"🖼️ 텍스트 전용 신뢰도 낮음 ({result.get('confidence')}) - 스크린샷 요청")
+            goal_logger.log_server_event("VISION_ESCALATION", "텍스트 전용 신뢰도 낮음 - 스크린샷 요청",
+                                         {"confidence": result.get("confidence"), "reason": result.get("reason")})
+            await websocket.send_text(json.dumps({
+                "type": "request_screenshot",
+                "evaluationMode": is_eval,
+                "reason": result.get("reason", ""),
+            }, ensure_ascii=False))
+            return
+
+    # 공통 처리 로직 (청킹/일반 모드 모두 적용)
+    try:
+        result = resolve_element_ids(result, id_map)
+        if not is_eval:
+            actions = build_action_batch(result)
+            if actions[0].get("action") == "end":
+                await send_step_message(websocket, session_id, {"type": "end"}, goal_log=goal_logger)
+            else:
+                await send_step_message(websocket, session_id, action_message(step, actions), goal_log=goal_logger)
+        else:
+            status = result.get("status")
+            if status == "completed":
+                await send_step_message(websocket, session_id, {
+                    "type": "completed",
+                    "reason": result.get("reason", "목표가 달성되었습니다."),
+                    "evidence": result.get("evidence", ""),
+                }, goal_log=goal_logger)
+            elif status == "replan":
+                await send_step_message(websocket, session_id, {
+                    "type": "replan",
+                    "reason": result.get("reason", "계획을 다시 수립해야 합니다."),
+                    "new_plan_needed": True,
+                }, goal_log=goal_logger)
+            elif status == "continue":
+                actions = build_action_batch(result)
+                await send_step_message(websocket, session_id, action_message(step, actions), goal_log=goal_logger)
+    except json.JSONDecodeError as e:
+        await websocket.send_text(json.dumps({"type": "error", "detail": f"JSON 파싱 오류: {e}"}))
+
 
 # ============================
 # WebSocket endpoint
@@ -872,259 +1485,76 @@ Prefer concise imperative. If it's pure navigation, output only '<URL>로 이동
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    logger.info("🔌 WebSocket 연결 수락됨 (Stateless 서버)")
-    
-    # 로그인 재시도 방지 플래그
-    login_skip_detection = False
-    
+    session = session_manager.open(websocket)
+    if session is None:
+        await websocket.close(code=1013)  # 동시 세션 상한 - 잠시 후 재시도
+        return
+    logger.info(f"🔌 WebSocket 연결 수락됨 (세션 {session.id})")
+
+    async def handle_request(payload: dict, message_bytes: int):
+        msg_type = payload.get("type")
+        # 이 작업에서 기록되는 계측은 세션의 현재 목표 합계에도 더해짐
+        goal_scope.set(session.goal_logger)
+        started = time.perf_counter()
+        try:
+            with session.timed(msg_type):
+                if msg_type == "init":
+                    await handle_init(session, payload)
+                else:
+                    await handle_dom_message(session, payload, message_bytes)
+        finally:
+            record_step(msg_type, time.perf_counter() - started, message_bytes)
+
+    dispatcher = ConnectionDispatcher(session, handle_request, session_manager.queue_size)
+    session.dispatcher = dispatcher
+    dispatcher.start()
+
     try:
         while True:
-            raw = await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
             try:
-                payload = json.loads(raw)
+                if message.get("bytes") is not None:
+                    # 협상된 바이너리 프로토콜 (ws_protocol.py)
+                    message_bytes = len(message["bytes"])
+                    payload = decode_frame(message["bytes"])
+                else:
+                    message_bytes = len(message.get("text") or "")
+                    payload = json.loads(message.get("text") or "")
                 if payload.get('type') != 'client_log':
-                    logger.info(f"📨 메시지 수신: {len(raw)} chars | type={payload.get('type')}")
+                    logger.info(f"📨 메시지 수신: {message_bytes} {'bytes' if message.get('bytes') is not None else 'chars'} | type={payload.get('type')}")
+            except FrameError as e:
+                logger.error(f"❌ 바이너리 프레임 해석 실패: {e}")
+                continue
             except json.JSONDecodeError as e:
                 logger.error(f"❌ JSON 파싱 실패: {e}")
                 continue
 
-            # ---------- user_continue ----------  
-            if payload.get("type") == "user_continue":
-                logger.info("▶️ 사용자 진행 요청 - 자동화 재개")
-                login_skip_detection = True  # 로그인 감지 스킵 플래그 설정
-                await websocket.send_text(json.dumps({
-                    "type": "automation_resumed", 
-                    "message": "자동화가 재개됩니다.",
-                    "timestamp": datetime.now().isoformat()
-                }))
-                # DOM 재요청
-                await websocket.send_text(json.dumps({
-                    "type": "request_dom",
-                    "message": "로그인 완료 후 페이지 정보를 다시 분석합니다."
-                }))
-                continue
-
-                        # ---------- init ----------
-            if payload.get("type") == "init":
-                try:
-                    user_goal = payload["message"]
-                    logger.info(f"🆕 새 목표: {user_goal}")
-                    goal_logger.start_new_goal(user_goal)
-
-                    goal_logger.log_server_event("PROMPT_ANALYSIS", f"프롬프트 분석 시작: {user_goal}")
-                    needs_dom = analyze_prompt_needs_dom(user_goal)
-                    goal_logger.log_server_event("DOM_DECISION", f"DOM 필요 여부: {needs_dom}")
-
-                    if needs_dom:
-                        goal_logger.log_server_event("DOM_REQUEST", "DOM이 필요한 작업으로 판단 - DOM 요청")
-                        await websocket.send_text(json.dumps({
-                            "type": "request_dom",
-                            "message": "현재 페이지 정보가 필요합니다.",
-                        }))
-                    else:
-                        goal_logger.log_server_event("DIRECT_PROCESSING", "프롬프트만으로 처리")
-                        refined_goal = await refine_prompt_with_llm(user_goal)
-                        goal_logger.log_server_event("GOAL_REFINED", f"정제된 목표: {refined_goal}")
-                        if "로 이동" in refined_goal:
-                            url = refined_goal.split("로 이동")[0]
-                            action = {"action": "goto", "url": url}
-                            goal_logger.log_server_event("ACTION_GENERATED", f"직접 액션: {action}")
-                            await websocket.send_text(json.dumps({
-                                "type": "action", "step": 1, "action": action,
-                            }))
-                        else:
-                            goal_logger.log_server_event("RECLASSIFY_DOM", "DOM 필요로 재분류")
-                            await websocket.send_text(json.dumps({
-                                "type": "request_dom",
-                                "message": "현재 페이지 정보가 필요합니다.",
-                            }))
-                    logger.info("✅ init 처리 완료")
-                except Exception as e:
-                    logger.error(f"❌ init 처리 중 오류: {e}")
-                    await websocket.send_text(json.dumps({
-                        "type": "error", "detail": f"초기화 중 오류: {str(e)}",
-                }))
-                continue
-
-            # ---------- client_log ----------
-            if payload.get("type") == "client_log":
-                goal_logger.log_client_event(payload.get("event_type", "UNKNOWN"), payload.get("message", ""), payload.get("extra_data", {}))
+            msg_type = payload.get("type")
+            try:
+                session.touch(message_bytes)
+            except SessionLimitExceeded as e:
+                logger.error(f"🚫 세션 {session.id} 제한: {e}")
+                await websocket.send_text(json.dumps({"type": "error", "detail": str(e)}))
                 continue
 
-            # ---------- dom_with_image / evaluation ----------
-            if payload.get("type") in ["dom_with_image", "dom_with_image_evaluation"]:
-                is_eval = payload.get("type") == "dom_with_image_evaluation" or payload.get("evaluationMode", False)
-                logger.info("📊 DOM+이미지 처리 시작" + (" (평가 모드)" if is_eval else ""))
-
-                context = payload.get("context", {})
-                goal = context.get("goal", payload.get("message", ""))
-                step = context.get("step", 0)
-                plan = context.get("plan", [])
-                
-                if not goal:
-                    await websocket.send_text(json.dumps({"type": "error", "detail": "목표가 설정되지 않았습니다."}))
-                    continue
-                
-                try:
-                    dom_summary = compress_dom(payload.get("dom", []))
-                    logger.info(f"📊 DOM 압축 완료: {len(dom_summary)} 요소")
-                    
-                    # === 새로운 분석 단계들 ===
-                    
-                    # 1. 요구사항 → 웹 가이드 변환
-                    web_guide = translate_requirement_to_web_guide(goal)
-                    logger.info(f"🔄 요구사항 변환: {goal} → {web_guide}")
-                    
-                    # 2. 페이지 이해도 분석 (LLM 위임 방식)
-                    page_analysis = analyze_page_understanding(dom_summary)
-                    logger.info(f"📊 페이지 기본 정보: {page_analysis['dom_elements']}개 요소, {page_analysis['analysis_method']} 방식")
-                    
-                    # 3. 목표 진행도 평가 (기본 계산만)
-                    last_action = context.get("lastAction") if context else None
-                    total_steps = len(plan) if plan else 1
-                    progress_eval = evaluate_goal_progress(goal, step, total_steps, page_analysis, last_action)
-                    logger.info(f"🎯 진행도: {progress_eval['progress_percentage']:.1f}% 완료 ({progress_eval['current_step']}/{progress_eval['total_steps']} 단계)")
-                    
-                    # 분석 결과를 클라이언트에 전송
-                    analysis_result = {
-                        "type": "page_analysis",
-                        "web_guide": web_guide,
-                        "page_understanding": page_analysis,
-                        "progress_evaluation": progress_eval,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    await websocket.send_text(json.dumps(analysis_result, ensure_ascii=False))
-                    logger.info("📊 페이지 분석 결과 전송 완료")
-                    
-                    # 로그인 페이지 감지 시 대기 모드 (스킵 플래그 확인)
-                    if page_analysis.get("is_login_page") and not login_skip_detection:
-                        logger.info("🔐 로그인 페이지 감지 - 사용자 대기 모드 활성화")
-                        await websocket.send_text(json.dumps({
-                            "type": "login_detected",
-                            "message": "로그인이 필요합니다. 로그인을 완료한 후 '진행' 버튼을 눌러주세요.",
-                            "show_continue_button": True,
-                            "timestamp": datetime.now().isoformat()
-                        }))
-                        continue  # 자동화 일시 정지
-                    elif login_skip_detection:
-                        logger.info("🔓 로그인 감지 스킵 - 사용자가 진행 요청했음")
-                        login_skip_detection = False  # 플래그 리셋
-                except Exception as e:
-                    logger.error(f"❌ DOM 압축 실패: {e}")
-                    continue
-                
-                image_data = payload.get("image")
-                if image_data:
-                    save_debug_image(image_data, step, goal)
-                
-                # Plan (if empty & step==0)
-                if not plan and step == 0:
-                    goal_logger.log_server_event("PLANNING_START", f"이미지 기반 계획 수립 (DOM {len(dom_summary)})")
-                    prompt = build_planning_prompt_with_image(goal, dom_summary, context)
-                    plan_resp = await (call_llm_with_image(prompt, image_data) if image_data else call_llm(prompt))
-                    if plan_resp:
-                        jtxt = extract_top_level_json(plan_resp)
-                        if jtxt:
-                            try:
-                                parsed = json.loads(jtxt)
-                                goal_logger.log_server_event("PLAN_GENERATED", f"{len(parsed)} 단계 계획")
-                                await websocket.send_text(json.dumps({"type": "plan", "plan": parsed}))
-                                continue
-                            except json.JSONDecodeError as e:
-                                goal_logger.log_server_event("ERROR", f"Planning JSON 파싱 실패: {e}")
-
-                # Execute or Evaluate
-                if is_eval:
-                    prompt = build_evaluation_prompt_with_image(goal, dom_summary, context)
-                    response = await (call_llm_with_image(prompt, image_data) if image_data else call_llm(prompt))
-                    
-                    if not response:
-                        await websocket.send_text(json.dumps({"type": "error", "detail": "LLM 응답 없음"}))
-                        continue
-
-                    logger.info(f"🧠 평가 LLM 응답: {response}")
-                    jtxt = extract_top_level_json(response)
-                    logger.info(f"🔍 추출된 JSON: {jtxt}")
-                    if not jtxt:
-                        logger.error(f"❌ JSON 추출 실패 - 원본: {response}")
-                        await websocket.send_text(json.dumps({"type": "error", "detail": f"JSON 파싱 실패: {response}"}))
-                        continue
-
-                    try:
-                        result = json.loads(jtxt)
-                    except json.JSONDecodeError as e:
-                        logger.error(f"❌ 오류: JSON 파싱 실패: {jtxt}")
-                        await websocket.send_text(json.dumps({"type": "error", "detail": f"JSON 파싱 실패: {jtxt}"}))
-                        continue
-                else:
-                    # 실행 모드: DOM 크기에 따라 청킹 vs 일반 처리
-                    if len(dom_summary) > 500:
-                        logger.info(f"🔄 대용량 DOM 감지 ({len(dom_summary)}개) - 청킹 모드 사용")
-                        try:
-                            result = await analyze_dom_chunks(goal, dom_summary, image_data, step, plan or [])
-                        except Exception as e:
-                            logger.error(f"❌ 청킹 분석 실패: {e}")
-                            await websocket.send_text(json.dumps({"type": "error", "detail": f"청킹 분석 실패: {e}"}))
-                            continue
-                    else:
-                        logger.info(f"📝 일반 DOM ({len(dom_summary)}개) - 단일 호출 모드")
-                        if image_data:
-                            prompt = build_execution_prompt_with_image(goal, plan, step, dom_summary, context) if plan else build_prompt_with_image(goal, dom_summary, step, context)
-                            response = await call_llm_with_image(prompt, image_data)
-                        else:
-                            prompt = f"Goal: {goal}\nStep: {step}\nDOM: {json.dumps(dom_summary, ensure_ascii=False, indent=2)}\nReturn next action as JSON."
-                            response = await call_llm(prompt)
-
-                        if not response:
-                            await websocket.send_text(json.dumps({"type": "error", "detail": "LLM 응답 없음"}))
-                            continue
-
-                        logger.info(f"🧠 LLM 전체 응답: {response}")
-                        jtxt = extract_top_level_json(response)
-                        logger.info(f"🔍 추출된 JSON: {jtxt}")
-                        if not jtxt:
-                            logger.error(f"❌ JSON 추출 실패 - 원본: {response}")
-                            await websocket.send_text(json.dumps({"type": "error", "detail": f"JSON 파싱 실패: {response}"}))
-                            continue
-                        
-                        try:
-                            result = json.loads(jtxt)
-                        except json.JSONDecodeError as e:
-                            logger.error(f"❌ 오류: JSON 파싱 실패: {jtxt}")
-                            await websocket.send_text(json.dumps({"type": "error", "detail": f"JSON 파싱 실패: {jtxt}"}))
-                            continue
-
-                # 공통 처리 로직 (청킹/일반 모드 모두 적용)
-                try:
-                    if not is_eval:
-                        # google_search → goto 변환
-                        if result.get("action") == "google_search" and result.get("query") and not result.get("url"):
-                            result["url"] = f"https://www.google.com/search?q={quote(result['query'])}"
-                            result["action"] = "goto"
-                        action = clean_action(result)
-                        if action.get("action") == "end":
-                            await websocket.send_text(json.dumps({"type": "end"}))
-                        else:
-                            await websocket.send_text(json.dumps({"type": "action", "step": step, "action": action}))
-                    else:
-                        status = result.get("status")
-                        if status == "completed":
-                            await websocket.send_text(json.dumps({
-                                "type": "completed",
-                                "reason": result.get("reason", "목표가 달성되었습니다."),
-                                "evidence": result.get("evidence", ""),
-                            }))
-                        elif status == "replan":
-                            await websocket.send_text(json.dumps({
-                                "type": "replan",
-                                "reason": result.get("reason", "계획을 다시 수립해야 합니다."),
-                                "new_plan_needed": True,
-                            }))
-                        elif status == "continue":
-                            action = clean_action(result)
-                            await websocket.send_text(json.dumps({"type": "action", "step": step, "action": action}))
-                except json.JSONDecodeError as e:
-                    await websocket.send_text(json.dumps({"type": "error", "detail": f"JSON 파싱 오류: {e}"}))
+            # 빠른 경로: LLM 작업 뒤에 줄 세우지 않고 바로 처리
+            if msg_type == "hello":
+                protocol = BINARY_PROTOCOL if WS_BINARY_PROTOCOL and BINARY_PROTOCOL in (payload.get("protocols") or []) else "json"
+                session.protocol = protocol
+                await websocket.send_text(json.dumps({"type": "hello_ack", "protocol": protocol}))
+            elif msg_type == "client_log":
+                session.goal_logger.log_client_event(payload.get("event_type", "UNKNOWN"), payload.get("message", ""), payload.get("extra_data", {}))
+            elif msg_type == "user_continue":
+                with session.timed(msg_type):
+                    await handle_user_continue(session)
+            # 무거운 요청: 세션 큐 → 워커가 순서대로 실행, 새 목표면 이전 작업 취소
+            elif msg_type == "init":
+                dispatcher.cancel_all("새 목표 수신")
+                dispatcher.submit(payload, message_bytes)
+            elif msg_type in ["dom_with_image", "dom_with_image_evaluation", *TEXT_ONLY_TYPES]:
+                dispatcher.submit(payload, message_bytes)
 
     except WebSocketDisconnect:
         logger.info("🔌 WebSocket 연결 해제됨")
@@ -1134,6 +1564,9 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.send_text(json.dumps({"type": "error", "detail": str(e)}))
         except Exception:
             pass
+    finally:
+        await dispatcher.close()
+        session_manager.close(session)
 
 if __name__ == "__main__":
     import uvicorn
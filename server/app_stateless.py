@@ -1,11 +1,23 @@
 from fastapi import FastAPI, WebSocket
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import RateLimitError
 from starlette.websockets import WebSocketDisconnect
 import os, json, re, logging, base64
 from datetime import datetime
 import asyncio
+import socket
+import time
+
+from llm_client import llm_pool, env_float
+from shared_state import shared_backend
+from rate_limiter import SharedRateLimiter, estimate_prompt_tokens
+from response_cache import ResponseCache, SharedResponseCache, dom_fingerprint, image_fingerprint
+from json_stream import scan_top_level_json
+from metrics import (
+    metrics, SharedMetrics, record_cache, record_llm_call, record_retry, record_step, record_tokens,
+)
 
 load_dotenv()
 logger = logging.getLogger("uvicorn.error")
@@ -26,12 +38,44 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+# === 멀티 워커 공유 상태 (shared_state.py) ===
+# 워커가 여러 개면 SHARED_BACKEND(sqlite / redis)로 호출 예산, 응답 캐시, 메트릭을 같이 쓴다
+shared_limiter = SharedRateLimiter(shared_backend)
+shared_cache = SharedResponseCache.from_env(shared_backend)
+shared_metrics: SharedMetrics | None = None
+_metrics_task: asyncio.Task | None = None
+
+@app.on_event("startup")
+async def on_startup():
+    global shared_metrics, _metrics_task
+    await llm_pool.start()
+    await shared_backend.start()
+    shared_limiter.configure_from_env()
+    # 워커 프로세스마다 startup 이 따로 실행되므로 여기서 pid 를 읽는다
+    shared_metrics = SharedMetrics(shared_backend, metrics, f"{socket.gethostname()}:{os.getpid()}",
+                                   env_float("METRICS_PUBLISH_INTERVAL", 5.0))
+    _metrics_task = asyncio.create_task(shared_metrics.run())
+    logger.info(f"👷 워커 시작: pid {os.getpid()} (공유 백엔드 {shared_backend.name})")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if _metrics_task:
+        _metrics_task.cancel()
+        await shared_metrics.withdraw()
+    await llm_pool.close()
+    await shared_backend.close()
+
+@app.get("/metrics")
+async def get_metrics():
+    """모든 워커 스냅샷을 합산한 Prometheus 텍스트"""
+    return PlainTextResponse(await shared_metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "pid": os.getpid(), "backend": shared_backend.name, "cache": shared_cache.stats()}
+
 async def refine_prompt_with_llm(user_message: str) -> str:
-    client = AzureOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version="2024-02-15-preview",
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-    )
+    client = await llm_pool.get_client()
     refine_prompt = f'''
 아래 사용자의 입력을 브라우저 자동화 명령문(한 문장, 명확하고 간결하게)으로 변환해 주세요.
 명령문은 반드시 직접적이고 구체적으로 작성하세요.
@@ -45,7 +89,7 @@ async def refine_prompt_with_llm(user_message: str) -> str:
 
 명령문:
 '''
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1-mini"),
         messages=[{"role": "user", "content": refine_prompt}],
         max_tokens=100,
@@ -350,61 +394,83 @@ def save_debug_image(image_data: str, step: int, goal: str = None) -> str:
         logger.error(f"   🔍 데이터 접두사: {image_data[:50] if image_data else 'None'}...")
         return None
 
+async def _chat_completion(deployment: str, messages: list, est_tokens: int, label: str):
+    """워커 공유 예산 슬롯을 받아 호출하고, 429는 모든 워커가 같이 대기 후 재시도"""
+    for attempt in range(5):
+        queued = time.perf_counter()
+        started = None
+        try:
+            async with shared_limiter.slot(deployment, est_tokens) as slot:
+                started = time.perf_counter()
+                client = await llm_pool.get_client()
+                response = await client.chat.completions.create(
+                    model=deployment,
+                    messages=messages,
+                    max_tokens=500,
+                    temperature=0.1
+                )
+                await slot.record(usage=response.usage)
+            record_llm_call(deployment, "ok", time.perf_counter() - started, started - queued)
+            if response.usage is not None:
+                record_tokens(deployment, response.usage.prompt_tokens, response.usage.completion_tokens)
+            return response.choices[0].message.content
+        except RateLimitError as e:
+            wait = await shared_limiter.on_rate_limited(deployment, e.response.headers, attempt)
+            record_llm_call(deployment, "rate_limited", time.perf_counter() - started, started - queued)
+            record_retry(deployment, wait)
+            logger.info(f"⏳ 429 감지 - {wait:.1f}s 대기 후 재시도 ({attempt+1}/5)")
+        except Exception as e:
+            record_llm_call(deployment, "error")
+            logger.error(f"{label} 실패: {e}")
+            return None
+    record_llm_call(deployment, "exhausted")
+    logger.error(f"{label} 실패: 재시도 한도 초과")
+    return None
+
 async def call_llm_with_image(prompt: str, image_data: str):
     """이미지와 함께 LLM 호출"""
-    try:
-        client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version="2024-02-15-preview",
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
-        
-        # base64 데이터 URL에서 실제 base64 데이터 추출
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_VISION_DEPLOYMENT_NAME", "gpt-4.1-mini"),
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_data}"}}
-                    ]
-                }
-            ],
-            max_tokens=500,
-            temperature=0.1
-        )
-        
-        return response.choices[0].message.content
-    except Exception as e:
-        logger.error(f"Vision API 호출 실패: {e}")
-        return None
+    # base64 데이터 URL에서 실제 base64 데이터 추출
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_data}"}}
+            ]
+        }
+    ]
+    deployment = os.getenv("AZURE_OPENAI_VISION_DEPLOYMENT_NAME", "gpt-4.1-mini")
+    return await _chat_completion(deployment, messages, estimate_prompt_tokens(prompt, 1) + 500, "Vision API 호출")
 
 async def call_llm(prompt: str):
     """텍스트 전용 LLM 호출 (stateless)"""
-    try:
-        client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version="2024-02-15-preview",
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
-        
-        messages = [{"role": "user", "content": prompt}]
-        
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1-mini"),
-            messages=messages,
-            max_tokens=500,
-            temperature=0.1
-        )
-        
-        return response.choices[0].message.content
-    except Exception as e:
-        logger.error(f"LLM 호출 실패: {e}")
-        return None
+    messages = [{"role": "user", "content": prompt}]
+    deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1-mini")
+    return await _chat_completion(deployment, messages, estimate_prompt_tokens(prompt) + 500, "LLM 호출")
+
+async def call_llm_cached(prompt: str, image_data: str | None, kind: str, goal: str, dom_summary: list,
+                          extra=None, use_cache: bool = True):
+    """워커 공유 응답 캐시를 거쳐 LLM 호출 (payload 의 "cache": false 면 우회).
+    키에는 스크린샷 지문과 extra(단계/계획/직전 동작 - 프롬프트에 들어가는 값)가 들어가고, JSON 이 추출되는 응답만 저장"""
+    deployment = os.getenv("AZURE_OPENAI_VISION_DEPLOYMENT_NAME" if image_data else "AZURE_OPENAI_DEPLOYMENT_NAME",
+                           "gpt-4.1-mini")
+    key = ResponseCache.make_key(kind, goal, dom_fingerprint(dom_summary), image_fingerprint(image_data),
+                                 deployment, extra)
+    if use_cache and shared_cache.enabled:
+        cached = await shared_cache.get(key)
+        record_cache("response", cached is not None)
+        if cached is not None:
+            return cached
+    if image_data:
+        response = await call_llm_with_image(prompt, image_data)
+    else:
+        response = await call_llm(prompt)
+    if response and use_cache and scan_top_level_json(response):
+        await shared_cache.put(key, response)
+    return response
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -439,6 +505,8 @@ async def websocket_endpoint(websocket: WebSocket):
 
             if payload.get("type") == "dom_with_image":
                 logger.info("🔄 DOM + 이미지 처리 시작")
+                started = time.perf_counter()
+                use_cache = payload.get("cache", True) is not False
                 
                 # 컨텍스트 정보 추출
                 context = payload.get("context", {})
@@ -480,15 +548,11 @@ async def websocket_endpoint(websocket: WebSocket):
                 if not plan and step == 0:
                     logger.info("🧠 Planning 단계 시작...")
                     
-                    if image_data:
-                        plan_response = await call_llm_with_image(
-                            build_planning_prompt_with_image(goal, dom_summary, context), 
-                            image_data
-                        )
-                    else:
-                        plan_response = await call_llm(
-                            build_planning_prompt_with_image(goal, dom_summary, context)
-                        )
+                    plan_response = await call_llm_cached(
+                        build_planning_prompt_with_image(goal, dom_summary, context),
+                        image_data, "plan", goal, dom_summary,
+                        extra={"lastAction": context.get("lastAction")}, use_cache=use_cache
+                    )
                     
                     if plan_response:
                         plan_match = re.search(r'\[.*\]', plan_response, re.DOTALL)
@@ -501,6 +565,7 @@ async def websocket_endpoint(websocket: WebSocket):
                                     "type": "plan",
                                     "plan": parsed_plan
                                 }))
+                                record_step("dom_with_image", time.perf_counter() - started, len(raw))
                                 continue  # Planning만 하고 끝
                             except json.JSONDecodeError as e:
                                 logger.error(f"❌ Planning JSON 파싱 실패: {e}")
@@ -513,11 +578,16 @@ async def websocket_endpoint(websocket: WebSocket):
                         prompt = build_execution_prompt_with_image(goal, plan, step, dom_summary, context)
                     else:
                         prompt = build_prompt_with_image(goal, dom_summary, step, context)
-                    response = await call_llm_with_image(prompt, image_data)
                 else:
                     # 텍스트 전용은 간단하게 처리
                     prompt = f"Goal: {goal}\nStep: {step}\nDOM: {json.dumps(dom_summary, ensure_ascii=False, indent=2)}\nReturn next action as JSON."
-                    response = await call_llm(prompt)
+                # 캐시 키에는 프롬프트가 달라지는 값 모두 (현재 계획 단계는 실행 프롬프트와 같은 1부터 시작 기준)
+                plan_idx = step - 1 if step >= 1 else 0
+                plan_step = plan[plan_idx] if isinstance(plan, list) and plan_idx < len(plan) else None
+                response = await call_llm_cached(prompt, image_data, "execute", goal, dom_summary,
+                                                 extra={"step": step, "plan": plan, "plan_step": plan_step,
+                                                        "lastAction": context.get("lastAction")},
+                                                 use_cache=use_cache)
 
                 if not response:
                     logger.error("❌ LLM 응답 없음")
@@ -554,6 +624,7 @@ async def websocket_endpoint(websocket: WebSocket):
                             "step": step,
                             "action": action
                         }))
+                    record_step("dom_with_image", time.perf_counter() - started, len(raw))
                 except json.JSONDecodeError as e:
                     logger.error(f"❌ JSON 디코딩 오류: {e}")
                     await websocket.send_text(json.dumps({
@@ -574,5 +645,18 @@ async def websocket_endpoint(websocket: WebSocket):
             pass
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Stateless MCP 서버 (멀티 워커)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    args = parser.parse_args()
+
+    if args.workers > 1 and not os.getenv("SHARED_BACKEND"):
+        # 워커끼리 예산/캐시/메트릭을 나누도록 같은 호스트용 SQLite 백엔드를 기본으로 (워커가 환경 변수를 상속)
+        os.environ["SHARED_BACKEND"] = "sqlite:///cache/shared.db"
+        logger.info("🔗 SHARED_BACKEND 미설정 - sqlite:///cache/shared.db 사용")
+    # 워커가 여럿이면 uvicorn 이 앱을 import 문자열로 받아 프로세스마다 다시 로드한다
+    uvicorn.run("app_stateless:app" if args.workers > 1 else app, host=args.host, port=args.port, workers=args.workers)
\ No newline at end of file
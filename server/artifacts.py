@@ -0,0 +1,257 @@
+"""
+디버그 산출물(목표별 로그, 스크린샷) 비동기 기록기
+
+WebSocket 핸들러는 큐에 넣기만 하고, 백그라운드 작업이 모아서 워커 스레드에서 쓴다.
+  - 로그 줄은 배치로 묶고, 파일 핸들은 열어 둔 채 주기적으로 flush
+  - 스크린샷 base64 디코딩/저장은 워커 스레드에서 처리, 샘플링 비율 적용
+  - 보관 기간 / 디렉토리별 용량 상한 초과 시 오래된 파일부터 삭제
+    (이 기록기가 만든 파일만 - 디렉토리별 .artifacts 목록에 남긴 이름. 저장소에 들어 있는
+     debug_images/*.png 같은 기존 파일은 건드리지 않음)
+  - 큐가 가득 차면 기다리지 않고 버리고 개수만 센다 (자동화가 멈추지 않도록)
+
+환경 변수:
+  ARTIFACT_QUEUE_SIZE         큐 크기 (기본 2000)
+  ARTIFACT_BATCH_SIZE         한 번에 쓰는 최대 항목 수 (기본 200)
+  ARTIFACT_FLUSH_INTERVAL     flush 주기(초) (기본 1)
+  ARTIFACT_IMAGE_SAMPLE_RATE  스크린샷 저장 비율 0~1 (기본 1)
+  ARTIFACT_RETENTION_DAYS     보관 기간(일) (기본 0 = 기간으로 삭제 안 함)
+  ARTIFACT_IMAGE_QUOTA_MB     debug_images 용량 상한 (기본 200)
+  ARTIFACT_LOG_QUOTA_MB       logs 용량 상한 (기본 200)
+"""
+import os
+import time
+import base64
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+
+from llm_client import env_int, env_float
+
+logger = logging.getLogger("uvicorn.error")
+
+MAX_OPEN_LOGS = 32
+SWEEP_INTERVAL = 60.0
+MANIFEST_NAME = ".artifacts"
+
+
+class ArtifactWriter:
+    def __init__(self, queue_size: int = 2000, batch_size: int = 200, flush_interval: float = 1.0,
+                 image_sample_rate: float = 1.0, retention_days: float = 0.0,
+                 quotas: dict[str, int] | None = None):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.image_sample_rate = image_sample_rate
+        self.retention_seconds = retention_days * 86400
+        # 디렉토리 → 최대 바이트
+        self.quotas = quotas or {}
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+        self._handles: OrderedDict[str, object] = OrderedDict()
+        # 시작 직후 첫 배치에서 바로 정리하지 않도록 SWEEP_INTERVAL 이 지난 뒤부터
+        self._last_sweep = time.time()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.bytes_written = 0
+        self.deleted = 0
+
+    @classmethod
+    def from_env(cls) -> "ArtifactWriter":
+        return cls(
+            queue_size=env_int("ARTIFACT_QUEUE_SIZE", 2000),
+            batch_size=env_int("ARTIFACT_BATCH_SIZE", 200),
+            flush_interval=env_float("ARTIFACT_FLUSH_INTERVAL", 1.0),
+            image_sample_rate=env_float("ARTIFACT_IMAGE_SAMPLE_RATE", 1.0),
+            retention_days=env_float("ARTIFACT_RETENTION_DAYS", 0.0),
+            quotas={
+                "debug_images": env_int("ARTIFACT_IMAGE_QUOTA_MB", 200) * 1024 * 1024,
+                "logs": env_int("ARTIFACT_LOG_QUOTA_MB", 200) * 1024 * 1024,
+            },
+        )
+
+    # ---------- 수명 ----------
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🗂️ 산출물 기록기 시작 (queue={self.queue_size}, sample={self.image_sample_rate})")
+
+    async def stop(self):
+        """남은 항목을 모두 쓰고 핸들 닫기"""
+        if self._task is None:
+            return
+        self._stopping = True
+        await self._task
+        await asyncio.to_thread(self._close_handles)
+        self._task = None
+        self._stopping = False
+        self._queue = None
+        logger.info(f"🗂️ 산출물 기록기 종료: {self.stats()}")
+
+    # ---------- 큐 입력 (핸들러에서 호출, 블로킹 없음) ----------
+    def _submit(self, item: tuple) -> bool:
+        if self._queue is None:
+            # 서버 밖(스크립트 등)에서는 바로 기록
+            self._write_batch([item])
+            return True
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.error(f"🗂️ 산출물 큐 가득 참 - 버림 (누적 {self.dropped})")
+            return False
+        self.enqueued += 1
+        return True
+
+    def write_line(self, path: str, line: str) -> bool:
+        return self._submit(("line", path, line))
+
+    def write_image(self, path: str, image_data: str) -> bool:
+        """base64 이미지 저장 예약 (샘플링에서 빠지거나 큐가 차면 False)"""
+        if self.image_sample_rate < 1.0 and random.random() >= self.image_sample_rate:
+            self.sampled_out += 1
+            return False
+        return self._submit(("image", path, image_data))
+
+    # ---------- 백그라운드 ----------
+    async def _run(self):
+        while not (self._stopping and self._queue.empty()):
+            try:
+                timeout = 0 if self._stopping else self.flush_interval
+                first = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                first = None
+            batch = [first] if first is not None else []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+                await asyncio.to_thread(self._flush_handles)
+                if time.time() - self._last_sweep > SWEEP_INTERVAL:
+                    self._last_sweep = time.time()
+                    await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"🗂️ 산출물 기록 실패: {e}")
+
+    def _handle(self, path: str):
+        handle = self._handles.get(path)
+        if handle is None:
+            handle = open(path, "a", encoding="utf-8")
+            self._handles[path] = handle
+            while len(self._handles) > MAX_OPEN_LOGS:
+                _, old = self._handles.popitem(last=False)
+                old.close()
+        else:
+            self._handles.move_to_end(path)
+        return handle
+
+    def _write_batch(self, batch: list):
+        for kind, path, data in batch:
+            try:
+                if not os.path.exists(path):
+                    self._remember(path)
+                if kind == "line":
+                    self._handle(path).write(data + "\n")
+                    self.bytes_written += len(data) + 1
+                else:
+                    if data.startswith("data:image"):
+                        data = data.split(",", 1)[1]
+                    raw = base64.b64decode(data)
+                    with open(path, "wb") as f:
+                        f.write(raw)
+                    self.bytes_written += len(raw)
+                self.written += 1
+            except Exception as e:
+                logger.error(f"🗂️ 산출물 저장 실패 ({path}): {e}")
+        if self._queue is None:
+            self._flush_handles()
+
+    def _flush_handles(self):
+        for handle in self._handles.values():
+            handle.flush()
+
+    def _close_handles(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
+
+    # ---------- 정리 ----------
+    def _remember(self, path: str):
+        """정리 대상 디렉토리에 새로 만드는 파일 이름을 목록에 추가 (정리는 이 목록의 파일만)"""
+        directory = os.path.dirname(os.path.normpath(path))
+        if directory not in self.quotas:
+            return
+        with open(os.path.join(directory, MANIFEST_NAME), "a", encoding="utf-8") as f:
+            f.write(os.path.basename(path) + "\n")
+
+    @staticmethod
+    def _owned(directory: str) -> list[str]:
+        try:
+            with open(os.path.join(directory, MANIFEST_NAME), encoding="utf-8") as f:
+                return list(dict.fromkeys(line.rstrip("\n") for line in f if line.strip()))
+        except OSError:
+            return []
+
+    def sweep(self):
+        """이 기록기가 만든 파일 중 보관 기간이 지난 것 삭제 후 디렉토리별 용량 상한까지 오래된 파일부터 삭제"""
+        now = time.time()
+        open_paths = {os.path.abspath(p) for p in self._handles}
+        for directory, quota in self.quotas.items():
+            names = self._owned(directory)
+            if not names:
+                continue
+            files, kept = [], []
+            total = 0
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                is_open = os.path.abspath(path) in open_paths
+                if not is_open and self.retention_seconds > 0 and now - st.st_mtime > self.retention_seconds:
+                    self._remove(path)
+                    continue
+                kept.append(name)
+                if is_open:
+                    total += st.st_size
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+            files.sort()
+            while total > quota and files:
+                _, size, path = files.pop(0)
+                self._remove(path)
+                kept.remove(os.path.basename(path))
+                total -= size
+            # 지웠거나 사라진 파일은 목록에서도 뺌 (_write_batch 와 차례로 실행되므로 덮어쓰는 동안 추가되는 줄 없음)
+            with open(os.path.join(directory, MANIFEST_NAME), "w", encoding="utf-8") as f:
+                f.writelines(name + "\n" for name in kept)
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+            self.deleted += 1
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "deleted": self.deleted,
+            "bytes_written": self.bytes_written,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+        }
+
+
+artifact_writer = ArtifactWriter.from_env()
@@ -0,0 +1,54 @@
+"""
+프롬프트 DOM 형식 비교 벤치마크 (json indent=2 vs 표 형식)
+
+같은 DOM 으로 두 형식의 실행 프롬프트를 만들어 바이트 수와 추정 입력 토큰 수를 나란히 출력한다.
+
+사용법:
+  python bench_dom_format.py                       # 합성 페이지
+  python bench_dom_format.py --dom page.json       # 기록된 DOM (extension summarizeDom 결과)
+"""
+import argparse
+import json
+import logging
+
+import app
+from bench_relevance import synthetic_page
+from dom_codec import assign_element_ids, format_dom
+from rate_limiter import estimate_prompt_tokens
+
+
+def measure(dom_summary: list, fmt: str) -> tuple[int, int]:
+    body = format_dom(dom_summary, fmt)
+    return len(body.encode("utf-8")), estimate_prompt_tokens(body)
+
+
+def run_case(name: str, raw_dom: list, top_k: int):
+    for label, dom in (("full", app.compress_dom(raw_dom)),
+                       ("ranked", app.compress_dom(app.rank_dom(raw_dom, "네이버 메일 확인", None, top_k=top_k)))):
+        tagged, _ = assign_element_ids(dom)
+        json_bytes, json_tokens = measure(dom, "json")
+        table_bytes, table_tokens = measure(tagged, "table")
+        print(f"{name:<14} {label:<7} {len(dom):>6} | {json_bytes:>9} {json_tokens:>8} | {table_bytes:>9} {table_tokens:>8} "
+              f"| {100 * (1 - table_tokens / max(1, json_tokens)):>6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="프롬프트 DOM 형식 비교")
+    parser.add_argument("--dom", help="summarizeDom() 결과 JSON 파일")
+    parser.add_argument("--top-k", type=int, default=150)
+    args = parser.parse_args()
+
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    print(f"{'case':<14} {'dom':<7} {'elems':>6} | {'json_B':>9} {'json_tok':>8} | {'table_B':>9} {'tbl_tok':>8} | {'saved':>7}")
+    if args.dom:
+        with open(args.dom, encoding="utf-8") as f:
+            data = json.load(f)
+        run_case("recorded", data.get("dom", data) if isinstance(data, dict) else data, args.top_k)
+        return
+    for n in (100, 500, 2000):
+        run_case(f"synthetic-{n}", synthetic_page(n), args.top_k)
+
+
+if __name__ == "__main__":
+    main()
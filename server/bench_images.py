@@ -0,0 +1,124 @@
+"""
+스크린샷 전처리 벤치마크
+
+extension 이 보내는 PNG 를 그대로 보내는 경우와 imaging.prepare_image() 로 축소/재인코딩한 경우의
+업로드 바이트 수와 추정 이미지 입력 토큰 수를 나란히 출력한다.
+마지막에 같은 화면이 반복되는 단계 시퀀스에서 중복 제거(IMAGE_DEDUP) 효과도 출력한다.
+
+사용법:
+  python bench_images.py                                 # 합성 와이어프레임 / 스크린샷
+  python bench_images.py --images step_0.png step_1.png  # debug_images/ 에 저장된 실제 캡처
+"""
+import argparse
+import base64
+import io
+import logging
+import random
+import time
+
+from PIL import Image, ImageDraw
+
+from imaging import image_tokens, prepare_image
+
+CONFIGS = [
+    # (라벨, max_edge, format, quality, detail)
+    ("webp q80 1024", 1024, "webp", 80, "auto"),
+    ("webp q60 1024", 1024, "webp", 60, "auto"),
+    ("jpeg q80 1024", 1024, "jpeg", 80, "auto"),
+    ("png 1024", 1024, "png", 0, "auto"),
+    ("webp q80 768", 768, "webp", 80, "auto"),
+    ("webp q80 low", 1024, "webp", 80, "low"),
+]
+
+
+def synthetic_wireframe(width: int = 960, height: int = 540, seed: int = 0) -> bytes:
+    """extension captureScreen() 과 같은 형태 - 흰 배경 + 요소 박스 + 짧은 라벨 (50% 축소 캔버스)"""
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    styles = [("#e3f2fd", "#1976d2"), ("#f5f5f5", "#9e9e9e"), ("#fff3e0", "#ef6c00"), ("#e8f5e9", "#2e7d32")]
+    for i in range(120):
+        x, y = rnd.randint(0, width - 60), rnd.randint(0, height - 20)
+        w, h = rnd.randint(30, 200), rnd.randint(10, 40)
+        fill, outline = rnd.choice(styles)
+        draw.rectangle([x, y, x + w, y + h], fill=fill, outline=outline)
+        draw.text((x + 2, y + 2), f"item {i}", fill=outline)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def synthetic_screenshot(width: int = 1920, height: int = 1080, seed: int = 0) -> bytes:
+    """사진/배너가 섞인 실제 캡처에 가까운 이미지 (PNG 압축이 잘 안 되는 경우)"""
+    rnd = random.Random(seed)
+    img = Image.open(io.BytesIO(synthetic_wireframe(width, height, seed)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(8):
+        x, y = rnd.randint(0, width - 300), rnd.randint(0, height - 200)
+        for dy in range(0, 200, 2):
+            for dx in range(0, 300, 6):
+                draw.rectangle([x + dx, y + dy, x + dx + 5, y + dy + 1],
+                               fill=(rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255)))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def run_case(name: str, png: bytes):
+    data = base64.b64encode(png).decode("ascii")
+    with Image.open(io.BytesIO(png)) as img:
+        width, height = img.size
+    print(f"{name:<22} {'original png':<15} {width:>5}x{height:<5} {len(png):>9} {len(data):>9} "
+          f"{image_tokens(width, height, 'high'):>7} {'-':>8}")
+    for label, max_edge, fmt, quality, detail in CONFIGS:
+        start = time.perf_counter()
+        prepared = prepare_image(data, max_edge=max_edge, fmt=fmt, quality=quality or None, detail=detail, dedup="off")
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{'':<22} {label:<15} {prepared.width:>5}x{prepared.height:<5} {prepared.size:>9} {len(prepared.data):>9} "
+              f"{prepared.tokens:>7} {elapsed:>7.1f}ms")
+
+
+def run_dedup(png_a: bytes, png_b: bytes):
+    """A A A B B 순서의 5단계 - 중복 화면 처리 방식별 총 바이트/토큰"""
+    frames = [base64.b64encode(p).decode("ascii") for p in (png_a, png_a, png_a, png_b, png_b)]
+    print(f"\n{'dedup':<8} {'bytes':>10} {'tokens':>8} {'images':>7}")
+    for mode in ("off", "low", "skip"):
+        total_bytes = total_tokens = sent = 0
+        previous = None
+        for frame in frames:
+            prepared = prepare_image(frame, previous_hash=previous, dedup=mode)
+            if prepared is None:
+                continue
+            if not prepared.reused:
+                previous = prepared.phash
+            total_bytes += prepared.size
+            total_tokens += prepared.tokens
+            sent += 1
+        print(f"{mode:<8} {total_bytes:>10} {total_tokens:>8} {sent:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="스크린샷 전처리 비교")
+    parser.add_argument("--images", nargs="*", help="캡처 이미지 파일")
+    args = parser.parse_args()
+
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    print(f"{'case':<22} {'config':<15} {'size':>11} {'bytes':>9} {'b64':>9} {'tokens':>7} {'encode':>8}")
+    if args.images:
+        pngs = []
+        for path in args.images:
+            with open(path, "rb") as f:
+                pngs.append(f.read())
+            run_case(path[-22:], pngs[-1])
+        if len(pngs) >= 2:
+            run_dedup(pngs[0], pngs[1])
+        return
+    wire_a, wire_b = synthetic_wireframe(seed=0), synthetic_wireframe(seed=1)
+    run_case("wireframe 960x540", wire_a)
+    run_case("screenshot 1920x1080", synthetic_screenshot())
+    run_dedup(wire_a, wire_b)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+DOM 사전 랭킹 벤치마크
+
+전체 DOM 을 그대로 보내는 경우와 relevance.rank_dom() 으로 상위 K개만 보내는 경우의
+스텝당 프롬프트 토큰 수와 LLM 호출 수를 비교한다.
+
+사용법:
+  python bench_relevance.py                          # 합성 페이지 (300 / 500 / 2000 / 5000 요소)
+  python bench_relevance.py --dom page.json --goal "메일 확인"   # 기록된 DOM (extension summarizeDom 결과)
+  python bench_relevance.py --goal "검색창에 날씨 입력 후 검색" --target "#query"
+  python bench_relevance.py --schedule --chunk-budget 1500      # 청크 방문 순서별 평균 호출 수
+
+--schedule 은 LLM 대신 정답 청크에서만 신뢰도 0.95 후보를 내는 오라클로
+문서 순서(document)와 우선순위 순서(priority)의 스텝당 청크 호출 수를 비교한다.
+"""
+import argparse
+import json
+import logging
+import random
+import time
+
+import app
+from rate_limiter import IMAGE_TOKEN_ESTIMATE, estimate_prompt_tokens
+from relevance import rank_dom
+from chunk_scheduler import schedule_chunks
+
+WORDS = ["뉴스", "경제", "정치", "사회", "연예", "스포츠", "날씨", "쇼핑", "블로그", "카페",
+         "지도", "증권", "부동산", "웹툰", "영화", "음악", "여행", "건강", "교육", "자동차"]
+
+
+def synthetic_page(n: int, seed: int = 0) -> list:
+    """포털 형태의 합성 DOM - 헤더/내비 + 대량의 기사 링크 + 메일/검색 요소"""
+    rnd = random.Random(seed)
+    dom = [
+        {"tag": "header", "selector": "header#top", "text": "", "score": 2.0},
+        {"tag": "nav", "selector": "nav.gnb", "text": " ".join(WORDS[:8]), "score": 1.5},
+        {"tag": "input", "selector": "#query", "id": "query", "type": "search", "text": "검색어를 입력해 주세요", "score": 1.5, "clickable": True},
+        {"tag": "button", "selector": "button.btn_search", "text": "검색", "type": "submit", "score": 1.8, "clickable": True},
+        {"tag": "main", "selector": "main#content", "score": 2.0},
+    ]
+    for i in range(n - 8):
+        a, b = rnd.sample(WORDS, 2)
+        tag = rnd.choice(["a", "a", "li", "p"])
+        dom.append({
+            "tag": tag,
+            # extension getSelector() 형식: 클래스 체인 selector
+            "selector": f"{tag}.news_item_link.nclicks_{a}_{i % 13}.type_{b}" if i % 10 else f"#item{i}",
+            "text": f"{a} {b} 관련 기사 제목 {i} " + "본문 요약 " * rnd.randint(0, 6),
+            "href": f"https://news.example.com/{a}/{i}",
+            "score": round(rnd.uniform(1.0, 2.0), 3),
+            "clickable": True,
+        })
+    dom.insert(rnd.randint(20, len(dom) - 1), {
+        "tag": "a", "selector": "a.link_mail", "text": "메일", "href": "https://mail.example.com",
+        "score": 1.9, "clickable": True,
+    })
+    dom.append({"tag": "footer", "selector": "footer#footer", "text": "회사소개 이용약관", "score": 1.0})
+    return dom[:n]
+
+
+def step_cost(goal: str, dom_summary: list) -> tuple[int, int]:
+    """(프롬프트 토큰, LLM 호출 수) - websocket_endpoint 의 실행 경로와 같은 분기"""
+    # 스크린샷 1장 분량을 뺀 청크 예산 (dom_chunker.py)
+    chunks = app.chunk_dom(dom_summary, app.chunk_token_budget(goal, None, 0, []) - IMAGE_TOKEN_ESTIMATE)
+    if len(chunks) > 1:
+        tokens = sum(
+            estimate_prompt_tokens(app.build_chunk_execution_prompt(goal, c, n+1, len(chunks), 0, []), image_count=1)
+            for n, c in enumerate(chunks)
+        )
+        return tokens, len(chunks)
+    prompt = app.build_prompt_with_image(goal, dom_summary, 0, {})
+    return estimate_prompt_tokens(prompt, image_count=1), 1
+
+
+def run_case(name: str, goal: str, raw_dom: list, top_k: int, target: str):
+    full = app.compress_dom(raw_dom)
+    t0 = time.perf_counter()
+    ranked_raw = rank_dom(raw_dom, goal, None, top_k=top_k, hints=app.requirement_selector_hints(goal))
+    rank_ms = (time.perf_counter() - t0) * 1000
+    ranked = app.compress_dom(ranked_raw)
+
+    full_tokens, full_calls = step_cost(goal, full)
+    ranked_tokens, ranked_calls = step_cost(goal, ranked)
+    kept_target = any(el.get("selector") == target for el in ranked_raw)
+    print(f"{name:<14} {len(raw_dom):>6} {full_tokens:>10} {full_calls:>6} | {len(ranked):>6} {ranked_tokens:>10} {ranked_calls:>6} "
+          f"| {100 * (1 - ranked_tokens / max(1, full_tokens)):>6.1f}% {rank_ms:>8.1f}ms {'yes' if kept_target else '-':>6}")
+
+
+def oracle_confidence(chunk: list, target: str, goal_words: list[str]) -> float | None:
+    """정답 selector 가 있으면 0.95, 목표 단어만 겹치는 요소가 있으면 0.5, 아니면 후보 없음"""
+    if any(el.get("selector") == target for el in chunk):
+        return 0.95
+    if any(word in (el.get("text") or "") for el in chunk for word in goal_words):
+        return 0.5
+    return None
+
+
+def simulate_schedule(chunks: list, goal: str, raw_dom: list, target: str, plan_step: dict | None, mode: str) -> tuple[int, bool]:
+    """analyze_chunks_sequential 과 같은 종료 규칙으로 (호출 수, 정답 선택 여부)"""
+    schedule = schedule_chunks(chunks, goal, plan_step, raw_dom, app.requirement_selector_hints(goal), mode=mode)
+    unvisited = set(schedule.order)
+    best, best_chunk, calls = None, None, 0
+    for i in schedule.order:
+        calls += 1
+        unvisited.discard(i)
+        confidence = oracle_confidence(chunks[i], target, goal.split())
+        if confidence is not None and (best is None or confidence > best):
+            best, best_chunk = confidence, i
+        if schedule.should_stop(best, unvisited)[0]:
+            break
+    found = best_chunk is not None and any(el.get("selector") == target for el in chunks[best_chunk])
+    return calls, found
+
+
+def run_schedule_case(goal: str, n: int, budget: int, target: str, seeds: int, with_plan: bool):
+    plan_step = {"step": 1, "action": "click", "target": "메일 링크", "selector": target} if with_plan else None
+    totals = {"document": [0, 0], "priority": [0, 0]}
+    chunk_count = 0
+    for seed in range(seeds):
+        raw_dom = synthetic_page(n, seed)
+        chunks = app.chunk_dom(app.compress_dom(raw_dom), budget)
+        chunk_count += len(chunks)
+        for mode in totals:
+            calls, found = simulate_schedule(chunks, goal, raw_dom, target, plan_step, mode)
+            totals[mode][0] += calls
+            totals[mode][1] += found
+    doc, pri = (totals[m][0] / seeds for m in ("document", "priority"))
+    print(f"{n:>6} {'plan' if with_plan else 'goal':>5} {chunk_count / seeds:>7.1f} | {doc:>6.2f} {totals['document'][1]:>3}/{seeds} "
+          f"| {pri:>6.2f} {totals['priority'][1]:>3}/{seeds} | {100 * (1 - pri / max(doc, 1e-9)):>6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DOM 사전 랭킹 벤치마크")
+    parser.add_argument("--dom", help="summarizeDom() 결과 JSON 파일")
+    parser.add_argument("--goal", default="네이버 메일 확인")
+    parser.add_argument("--top-k", type=int, default=150)
+    parser.add_argument("--target", default="a.link_mail", help="상위 K개에 남아야 하는 정답 selector")
+    parser.add_argument("--schedule", action="store_true", help="청크 방문 순서 비교 (오라클 LLM)")
+    parser.add_argument("--chunk-budget", type=int, default=1500, help="--schedule 의 청크 DOM 토큰 예산")
+    parser.add_argument("--seeds", type=int, default=20, help="--schedule 의 합성 페이지 수")
+    args = parser.parse_args()
+
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    if args.schedule:
+        print(f"{'elems':>6} {'step':>5} {'chunks':>7} | {'doc':>6} {'hit':>6} | {'prio':>6} {'hit':>6} | {'saved':>7}")
+        for n in (500, 2000, 5000):
+            for with_plan in (False, True):
+                run_schedule_case(args.goal, n, args.chunk_budget, args.target, args.seeds, with_plan)
+        return
+
+    print(f"{'case':<14} {'elems':>6} {'full_tok':>10} {'calls':>6} | {'kept':>6} {'rank_tok':>10} {'calls':>6} | {'saved':>7} {'rank':>10} {'target':>6}")
+    if args.dom:
+        with open(args.dom, encoding="utf-8") as f:
+            data = json.load(f)
+        run_case("recorded", args.goal, data.get("dom", data) if isinstance(data, dict) else data, args.top_k, args.target)
+        return
+    for n in (300, 500, 2000, 5000):
+        run_case(f"synthetic-{n}", args.goal, synthetic_page(n), args.top_k, args.target)
+
+
+if __name__ == "__main__":
+    main()
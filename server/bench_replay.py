@@ -0,0 +1,357 @@
+"""
+녹화 세션 리플레이 벤치마크 (오프라인)
+
+로컬 mock LLM 서버(mock_llm.py)와 서버(app.py)를 한 프로세스에서 띄우고,
+가상 클라이언트 N 개가 녹화된 init / dom_with_image / dom_with_image_evaluation 순서를 /ws 로 재생한다.
+  - 단계별 지연 p50/p95/p99 (전체 + 종류별: init / plan / execute / evaluate)
+  - 목표당 LLM 호출 수, 단계당 프롬프트 토큰, 동시 세션 N 에서의 초당 단계 수
+  - mock 응답 지연 / 토큰 속도 / 429 주입 비율 조절
+
+재생할 세션:
+  --recordings  SESSION_RECORD_DIR 로 남긴 .jsonl 파일 또는 디렉토리 (recordings.py)
+  --debug-images debug_images/ 스크린샷을 목표별 세션으로 묶고 합성 DOM 을 붙여 재생
+  (둘 다 없으면 합성 포털 페이지 + 와이어프레임 세션)
+  --text-only   와이어프레임을 끈 extension 처럼 dom_only / dom_evaluation 으로 보내고,
+                서버가 request_screenshot 을 보내면 같은 단계를 스크린샷 포함으로 재전송
+
+기본적으로 메시지마다 "cache": false, "replay": false 를 붙여 응답 캐시 / 워크플로우 재생을 우회한다
+(반복 재생이 캐시 적중으로 바뀌지 않도록). 캐시 효과를 보려면 --cache.
+
+사용법:
+  python bench_replay.py --sessions 8 --repeat 4
+  python bench_replay.py --sessions 32 --latency 0.8 --tps 40 --rate-limit 0.05 --json before.json
+  python bench_replay.py --recordings recordings/ --binary --stream
+"""
+import os
+import sys
+import copy
+import json
+import math
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+
+TERMINAL_TYPES = {
+    "init": {"request_dom", "action", "error"},
+    "dom": {"plan", "action", "actions", "completed", "replan", "end", "error", "login_detected", "dom_resync"},
+}
+TEXT_ONLY_TYPES = {"dom_with_image": "dom_only", "dom_with_image_evaluation": "dom_evaluation"}
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def step_kind(payload: dict) -> str:
+    if payload.get("type") == "init":
+        return "init"
+    context = payload.get("context") or {}
+    if payload.get("type") in ("dom_with_image_evaluation", "dom_evaluation") or payload.get("evaluationMode"):
+        return "evaluate"
+    if not context.get("plan") and not context.get("step"):
+        return "plan"
+    return "execute"
+
+
+# ============================
+# 재생할 세션
+# ============================
+def synthetic_sessions() -> list[list[dict]]:
+    """녹화가 없을 때 - 포털형 합성 DOM + 와이어프레임으로 계획 → 실행 → 평가"""
+    import base64
+    from bench_images import synthetic_wireframe
+    from bench_relevance import synthetic_page
+
+    sessions = []
+    for seed, (goal, size) in enumerate([("네이버 메일 확인", 400), ("뉴스 검색 후 첫 기사 열기", 900),
+                                         ("로그인 버튼 클릭", 150)]):
+        image = "data:image/png;base64," + base64.b64encode(synthetic_wireframe(seed=seed)).decode("ascii")
+        dom = synthetic_page(size, seed=seed)
+        plan = [{"step": 1, "action": "click"}, {"step": 2, "action": "waitUntil"}]
+        base = {"message": goal, "dom": dom, "image": image, "wireframeEnabled": True}
+        sessions.append([
+            {"type": "init", "message": goal},
+            {**base, "type": "dom_with_image", "context": {"goal": goal, "step": 0, "plan": []}},
+            {**base, "type": "dom_with_image", "context": {"goal": goal, "step": 1, "plan": plan}},
+            {**base, "type": "dom_with_image_evaluation", "evaluationMode": True,
+             "context": {"goal": goal, "step": 2, "plan": plan}},
+        ])
+    return sessions
+
+
+def load_sessions(args) -> list[list[dict]]:
+    from recordings import load_recording, recordings_from_debug_images
+
+    sessions = []
+    for path in args.recordings or []:
+        files = [os.path.join(path, n) for n in sorted(os.listdir(path)) if n.endswith(".jsonl")] \
+            if os.path.isdir(path) else [path]
+        sessions.extend(s for s in (load_recording(f) for f in files) if s)
+    if args.debug_images:
+        from bench_relevance import synthetic_page
+        sessions.extend(recordings_from_debug_images(args.debug_images, lambda step: synthetic_page(300, seed=step)))
+    return sessions or synthetic_sessions()
+
+
+# ============================
+# 서버 (백그라운드 스레드의 이벤트 루프)
+# ============================
+class BackgroundServers:
+    def __init__(self, apps: list[tuple[object, int]]):
+        import uvicorn
+        self.servers = [
+            uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws="websockets"))
+            for app, port in apps
+        ]
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True)
+
+    async def _serve(self):
+        await asyncio.gather(*(server.serve() for server in self.servers))
+
+    def __enter__(self):
+        self.thread.start()
+        while not all(server.started for server in self.servers):
+            if not self.thread.is_alive():
+                raise RuntimeError("서버 시작 실패")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        for server in self.servers:
+            server.should_exit = True
+        self.thread.join(10)
+
+
+# ============================
+# 가상 클라이언트
+# ============================
+class ReplayClient:
+    def __init__(self, url: str, binary: bool, cache: bool, timeout: float, think_time: float,
+                 text_only: bool = False):
+        self.url = url
+        self.text_only = text_only
+        self.binary = binary
+        self.cache = cache
+        self.timeout = timeout
+        self.think_time = think_time
+
+    def _prepare(self, payload: dict, client_id: str) -> dict:
+        payload = copy.copy(payload)
+        if payload.get("type") != "init":
+            payload["context"] = {**(payload.get("context") or {}), "sessionId": client_id}
+            if not self.cache:
+                payload["cache"] = False
+                payload["replay"] = False
+        return payload
+
+    async def _send(self, ws, payload: dict, binary: bool):
+        from ws_protocol import encode_frame
+        from imaging import decode_image_bytes
+
+        if binary and payload.get("type") != "init":
+            frame = dict(payload)
+            if isinstance(frame.get("image"), str):
+                frame["image"] = decode_image_bytes(frame["image"])
+            await ws.send(encode_frame(frame))
+        else:
+            await ws.send(json.dumps(payload, ensure_ascii=False))
+
+    async def run(self, messages: list[dict], client_id: str) -> list[dict]:
+        import websockets
+
+        results = []
+        binary = self.binary
+        async with websockets.connect(self.url, max_size=None) as ws:
+            if binary:
+                await ws.send(json.dumps({"type": "hello", "protocols": ["binary-v1"]}))
+                ack = json.loads(await asyncio.wait_for(ws.recv(), self.timeout))
+                binary = ack.get("protocol") == "binary-v1"
+            for payload in messages:
+                kind = step_kind(payload)
+                terminal = TERMINAL_TYPES["init" if kind == "init" else "dom"]
+                started = time.perf_counter()
+                outcome = "timeout"
+                prepared = self._prepare(payload, client_id)
+                escalated = False
+                if self.text_only and prepared.get("type") in TEXT_ONLY_TYPES:
+                    await self._send(ws, {**prepared, "type": TEXT_ONLY_TYPES[prepared["type"]], "image": None}, binary)
+                else:
+                    await self._send(ws, prepared, binary)
+                try:
+                    while True:
+                        reply = json.loads(await asyncio.wait_for(ws.recv(), self.timeout))
+                        if reply.get("type") == "request_screenshot":
+                            # extension 과 같이 이번 단계만 스크린샷 포함 재전송
+                            escalated = True
+                            await self._send(ws, prepared, binary)
+                            continue
+                        if reply.get("type") in terminal:
+                            outcome = reply["type"]
+                            break
+                except asyncio.TimeoutError:
+                    pass
+                results.append({"kind": kind, "seconds": time.perf_counter() - started, "outcome": outcome,
+                                "escalated": escalated})
+                if outcome in ("timeout", "error"):
+                    break
+                if self.think_time:
+                    await asyncio.sleep(self.think_time)
+        return results
+
+
+async def drive(client: ReplayClient, sessions: list[list[dict]], total: int, concurrency: int) -> tuple[list, int, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    steps: list[dict] = []
+    failed = 0
+
+    async def one(i: int):
+        nonlocal failed
+        async with semaphore:
+            try:
+                steps.extend(await client.run(sessions[i % len(sessions)], f"bench-{i}"))
+            except Exception as e:
+                failed += 1
+                logging.getLogger("bench").error(f"세션 {i} 실패: {e}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return steps, failed, time.perf_counter() - started
+
+
+# ============================
+# 보고
+# ============================
+def summarize(steps: list[dict], failed: int, wall: float, goals: int, mock_stats: dict) -> dict:
+    dom_steps = [s for s in steps if s["kind"] != "init"]
+    by_kind = {}
+    for kind in ("all", "init", "plan", "execute", "evaluate"):
+        values = [s["seconds"] for s in steps if kind == "all" or s["kind"] == kind]
+        if values:
+            by_kind[kind] = {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95),
+                             "p99": percentile(values, 99), "max": max(values)}
+    outcomes: dict[str, int] = {}
+    for s in steps:
+        outcomes[s["outcome"]] = outcomes.get(s["outcome"], 0) + 1
+    return {
+        "goals": goals,
+        "failed_sessions": failed,
+        "steps": len(steps),
+        "wall_s": wall,
+        "steps_per_sec": len(steps) / wall if wall else 0.0,
+        "latency_s": by_kind,
+        "outcomes": outcomes,
+        "vision_escalations": sum(1 for s in steps if s.get("escalated")),
+        "llm_calls": mock_stats["completed"],
+        "llm_requests": mock_stats["requests"],
+        "llm_rate_limited": mock_stats["rate_limited"],
+        "llm_calls_per_goal": mock_stats["completed"] / goals if goals else 0.0,
+        "prompt_tokens_per_step": mock_stats["prompt_tokens"] / len(dom_steps) if dom_steps else 0.0,
+        "completion_tokens_per_step": mock_stats["completion_tokens"] / len(dom_steps) if dom_steps else 0.0,
+    }
+
+
+def print_report(summary: dict, args):
+    print(f"\nsessions={args.sessions} concurrency={args.concurrency or args.sessions} goals={summary['goals']} "
+          f"(failed {summary['failed_sessions']}) mock latency={args.latency}s tps={args.tps} 429={args.rate_limit:.0%} "
+          f"stream={'on' if args.stream else 'off'} binary={'on' if args.binary else 'off'} "
+          f"text-only={'on' if args.text_only else 'off'}")
+    print(f"\n{'step':<10} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for kind, row in summary["latency_s"].items():
+        print(f"{kind:<10} {row['count']:>6} {row['p50'] * 1000:>6.0f}ms {row['p95'] * 1000:>6.0f}ms "
+              f"{row['p99'] * 1000:>6.0f}ms {row['max'] * 1000:>6.0f}ms")
+    print(f"\nsteps/sec               {summary['steps_per_sec']:.2f} ({summary['steps']} steps in {summary['wall_s']:.1f}s)")
+    print(f"LLM calls / goal        {summary['llm_calls_per_goal']:.2f} "
+          f"({summary['llm_calls']} calls, {summary['llm_rate_limited']} x 429)")
+    print(f"prompt tokens / step    {summary['prompt_tokens_per_step']:.0f}")
+    print(f"completion tokens/step  {summary['completion_tokens_per_step']:.0f}")
+    print(f"outcomes                {summary['outcomes']}")
+    if args.text_only:
+        print(f"vision escalations      {summary['vision_escalations']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="녹화 세션 /ws 리플레이 벤치마크 (mock LLM)")
+    parser.add_argument("--recordings", nargs="*", help="녹화 .jsonl 파일 또는 디렉토리")
+    parser.add_argument("--debug-images", help="debug_images 디렉토리 (스크린샷 + 합성 DOM)")
+    parser.add_argument("--sessions", type=int, default=4, help="동시 가상 클라이언트 수 N")
+    parser.add_argument("--concurrency", type=int, default=0, help="동시 실행 상한 (기본 = --sessions)")
+    parser.add_argument("--repeat", type=int, default=1, help="클라이언트당 세션 재생 횟수")
+    parser.add_argument("--latency", type=float, default=0.3, help="mock 첫 토큰 지연(초)")
+    parser.add_argument("--tps", type=float, default=80.0, help="mock 출력 토큰/초")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="mock 429 주입 비율 (0~1)")
+    parser.add_argument("--retry-after-ms", type=int, default=500)
+    parser.add_argument("--reason-tokens", type=int, default=40, help="mock 응답의 JSON 뒤 설명 분량")
+    parser.add_argument("--rpm", type=int, default=100000, help="서버 배포 예산 RPM (기본은 사실상 무제한)")
+    parser.add_argument("--tpm", type=int, default=100000000, help="서버 배포 예산 TPM")
+    parser.add_argument("--stream", action="store_true", help="LLM 스트리밍 사용 (LLM_STREAMING=1)")
+    parser.add_argument("--binary", action="store_true", help="binary-v1 프레임으로 전송")
+    parser.add_argument("--cache", action="store_true", help="응답 캐시 / 워크플로우 재생 허용")
+    parser.add_argument("--text-only", action="store_true", help="dom_only / dom_evaluation 으로 전송 (스크린샷은 요청 시만)")
+    parser.add_argument("--low-confidence", type=float, default=0.0,
+                        help="mock 이 이미지 없는 호출에 낮은 신뢰도를 돌려주는 비율 (0~1)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="단계 사이 클라이언트 대기(초)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="단계당 응답 대기 상한(초)")
+    parser.add_argument("--url", help="이미 떠 있는 서버의 /ws 주소 (mock 도 직접 띄워 연결해야 함)")
+    parser.add_argument("--json", help="결과를 JSON 으로 저장 (변경 전후 비교용)")
+    parser.add_argument("--verbose", action="store_true", help="서버 로그 출력")
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    # app 을 import 하기 전에 환경 설정 (배포 예산, 엔드포인트, 스트리밍은 import/시작 시점에 읽음)
+    os.environ["AZURE_OPENAI_ENDPOINT"] = f"http://127.0.0.1:{mock_port}"
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "mock")
+    os.environ["AZURE_OPENAI_RPM"] = os.environ["AZURE_OPENAI_VISION_RPM"] = str(args.rpm)
+    os.environ["AZURE_OPENAI_TPM"] = os.environ["AZURE_OPENAI_VISION_TPM"] = str(args.tpm)
+    os.environ["LLM_STREAMING"] = "1" if args.stream else "0"
+    os.environ.setdefault("SESSION_MAX_ACTIVE", str(max(1000, args.sessions * 2)))
+    os.environ.setdefault("ARTIFACT_IMAGE_SAMPLE_RATE", "0")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not args.verbose:
+        for name in ("uvicorn.error", "httpx", "uvicorn.access"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    from mock_llm import MockLLMConfig, create_mock_app
+    mock_app = create_mock_app(MockLLMConfig(args.latency, args.tps, args.rate_limit, args.retry_after_ms,
+                                             args.reason_tokens, low_confidence_ratio=args.low_confidence))
+    sessions = load_sessions(args)
+    total = args.sessions * args.repeat
+    concurrency = args.concurrency or args.sessions
+    print(f"🎬 재생할 세션 {len(sessions)}종 ({sum(len(s) for s in sessions)} 메시지) × {total}회, 동시 {concurrency}")
+
+    if args.url:
+        apps = [(mock_app, mock_port)]
+        url = args.url
+        print(f"⚠️ 외부 서버 사용 - 서버의 AZURE_OPENAI_ENDPOINT 를 http://127.0.0.1:{mock_port} 로 지정해야 함")
+    else:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import app as server_app
+        app_port = free_port()
+        apps = [(mock_app, mock_port), (server_app.app, app_port)]
+        url = f"ws://127.0.0.1:{app_port}/ws"
+
+    client = ReplayClient(url, args.binary, args.cache, args.timeout, args.think_time, args.text_only)
+    with BackgroundServers(apps):
+        steps, failed, wall = asyncio.run(drive(client, sessions, total, concurrency))
+    summary = summarize(steps, failed, wall, total - failed, mock_app.state.stats.as_dict())
+    print_report(summary, args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), **summary}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 결과 저장: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
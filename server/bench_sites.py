@@ -0,0 +1,164 @@
+"""
+사이트 디렉토리 조회 벤치마크 (site_directory.py)
+
+합성 사이트 N개(지역 + 이름 + 기관 종류, 예: "부산 한빛 도서관")와 data/sites.tsv 를 합쳐 색인하고,
+목표 문장 형태의 질의로 조회 지연과 정답률을 잰다.
+  - 질의 종류: exact("X 들어가줘"), particle("X로 이동"), spaced("부산 한빛도서관 홈페이지"),
+    typo(글자 하나의 모음 오타), miss(디렉토리에 없는 목표 → None 이어야 정답)
+  - 비교 기준: 기존 find_site_url 의 선형 부분 문자열 검사 (name in q or q in name)
+  - 색인 시간, 파일 수정 후 핫 리로드가 새 색인으로 바뀌기까지의 시간
+
+사용법:
+  python bench_sites.py                       # 1만 / 5만 건
+  python bench_sites.py --sizes 100000 --queries 2000
+  python bench_sites.py --directory my_sites.tsv --queries 500   # 실제 데이터 파일
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import logging
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from site_directory import DEFAULT_PATH, SiteDirectory, load_entries  # noqa: E402
+
+REGIONS = ["서울", "부산", "대구", "인천", "광주", "대전", "울산", "세종", "경기", "강원", "충북", "충남",
+           "전북", "전남", "경북", "경남", "제주", "수원", "성남", "고양", "용인", "창원", "청주", "전주"]
+KINDS = ["대학교", "병원", "시청", "구청", "도서관", "공사", "센터", "재단", "협회", "쇼핑몰", "마트",
+         "은행", "신문", "방송", "박물관", "미술관", "체육관", "복지관", "연구원", "학원"]
+# 상호에 흔한 음절 (실제 기관/상호 이름처럼 음절 다양성이 있어야 3-gram 분포가 현실적)
+SYLLABLES = ("가나다라마바사아자차카타파하한빛솔누리새별온담결미래푸른하늘바다숲들꽃길샘마루"
+             "강경고공관광교구국권금기길김남노농대도동라로류리명모목문미민박방배백범보복봉부비빈산삼상서석선성세소송수순승시신심안양엄여연영예오옥온완용우운원월위유윤은을음이인일임자장재전정제조종주준지진차창채천철청초최춘충태택평포표풍학한해행향허현형혜호홍화환황효훈휘희")
+MISS_GOALS = ["오늘 날씨 알려줘", "점심 메뉴 추천해줘", "환율 계산기 열어", "주말 영화 상영 시간표",
+              "택배 조회하기", "회의록 정리", "다음주에 회의 잡아줘", "엑셀 함수 사용법"]
+
+
+def synthetic_entries(n: int, seed: int = 0) -> list[tuple[str, list[str], str, float]]:
+    rnd = random.Random(seed)
+    seen, entries = set(), []
+    while len(entries) < n:
+        region, kind = rnd.choice(REGIONS), rnd.choice(KINDS)
+        core = "".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 3)))
+        name = f"{region} {core} {kind}"
+        if name in seen:
+            continue
+        seen.add(name)
+        entries.append((name, [f"{core}{kind}"], f"https://www.s{len(entries)}.example.kr", rnd.uniform(1, 10)))
+    return entries
+
+
+def write_tsv(path: str, entries: list):
+    with open(path, "w", encoding="utf-8") as f:
+        for name, aliases, url, weight in entries:
+            f.write(f"{name}\t{','.join(aliases)}\t{url}\t{weight:.1f}\n")
+
+
+def typo(text: str, rnd: random.Random) -> str:
+    """한글 한 글자의 모음을 바꿈 (받침/초성 유지)"""
+    positions = [i for i, ch in enumerate(text) if 0 <= ord(ch) - 0xAC00 < 11172]
+    i = rnd.choice(positions)
+    code = ord(text[i]) - 0xAC00
+    cho, jung, jong = code // 588, (code % 588) // 28, code % 28
+    jung = (jung + rnd.choice([1, 2, 4])) % 21
+    return text[:i] + chr(0xAC00 + cho * 588 + jung * 28 + jong) + text[i+1:]
+
+
+def build_queries(entries: list, count: int, seed: int = 1) -> list[tuple[str, str, str | None]]:
+    """(종류, 질의, 정답 URL 또는 None)"""
+    rnd = random.Random(seed)
+    queries = []
+    for i in range(count):
+        name, aliases, url, _ = rnd.choice(entries)
+        kind = ("exact", "particle", "spaced", "typo", "miss")[i % 5]
+        compact = name.replace(" ", "")
+        if kind == "exact":
+            queries.append((kind, f"{name} 들어가줘", url))
+        elif kind == "particle":
+            queries.append((kind, f"{compact}로 이동", url))
+        elif kind == "spaced":
+            parts = name.split(" ")
+            queries.append((kind, f"{parts[0]} {''.join(parts[1:])} 홈페이지" if len(parts) > 1 else f"{name} 홈페이지", url))
+        elif kind == "typo":
+            queries.append((kind, f"{typo(compact, rnd)} 사이트", url))
+        else:
+            queries.append((kind, rnd.choice(MISS_GOALS), None))
+    return queries
+
+
+def linear_scan(entries: list, query: str) -> str | None:
+    """기존 find_site_url 방식 (SITE_MAPPING 선형 부분 문자열 검사)"""
+    q = (query or "").lower().strip()
+    for name, _, url, _ in entries:
+        if name.lower() in q or q in name.lower():
+            return url
+    return None
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))] if ordered else 0.0
+
+
+def measure(label: str, resolve, queries: list) -> dict:
+    latencies, correct = [], {}
+    for kind, query, expected in queries:
+        started = time.perf_counter()
+        url = resolve(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits, total = correct.get(kind, (0, 0))
+        correct[kind] = (hits + (url == expected), total + 1)
+    accuracy = " ".join(f"{kind} {hits / total * 100:.0f}%" for kind, (hits, total) in correct.items())
+    print(f"  {label:<10} p50 {percentile(latencies, 50):7.3f}ms  p95 {percentile(latencies, 95):7.3f}ms  "
+          f"p99 {percentile(latencies, 99):7.3f}ms | 정답률 {accuracy}")
+    return {"p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95), "accuracy": correct}
+
+
+def measure_reload(directory: SiteDirectory, path: str, entries: list) -> float:
+    """파일을 바꾼 뒤 조회가 새 색인을 보기까지 걸린 시간 (그동안 조회는 이전 색인으로 응답)"""
+    before = directory.index
+    write_tsv(path, entries + [("벤치 리로드 확인", [], "https://reload.example.kr", 1.0)])
+    os.utime(path, (time.time() + 1, time.time() + 1))
+    started = time.perf_counter()
+    directory._checked_at = 0.0
+    while directory.current() is before:
+        time.sleep(0.005)
+        directory._checked_at = 0.0
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="사이트 디렉토리 조회 벤치마크")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000], help="합성 사이트 수 목록")
+    parser.add_argument("--queries", type=int, default=1000, help="질의 수 (종류별 1/5)")
+    parser.add_argument("--directory", help="합성 대신 쓸 데이터 파일 (TSV)")
+    parser.add_argument("--no-baseline", action="store_true", help="선형 검사 비교 생략")
+    args = parser.parse_args()
+
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+    seed_entries = load_entries([DEFAULT_PATH])
+    datasets = [("file", load_entries([args.directory]))] if args.directory else \
+               [(f"{n}", seed_entries + synthetic_entries(n)) for n in args.sizes]
+
+    for label, entries in datasets:
+        with tempfile.TemporaryDirectory(prefix="bench_sites_") as tmpdir:
+            path = os.path.join(tmpdir, "sites.tsv")
+            write_tsv(path, entries)
+            directory = SiteDirectory([path], reload_interval=0.01)
+            started = time.perf_counter()
+            index = directory.current()
+            build = time.perf_counter() - started
+            queries = build_queries(entries, args.queries)
+            print(f"🗂️ {label}: 사이트 {len(index)}개, 별칭 {len(index.alias_keys)}개, 3-gram {len(index.grams)}개, "
+                  f"색인 {build * 1000:.0f}ms")
+            measure("directory", lambda q: (m.url if (m := directory.resolve(q)) else None), queries)
+            if not args.no_baseline:
+                measure("linear", lambda q: linear_scan(entries, q), queries)
+            print(f"  핫 리로드 반영 {measure_reload(directory, path, entries) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+멀티 워커 처리량 벤치마크 (app_stateless.py)
+
+mock LLM(mock_llm.py)을 별도 프로세스로 띄우고, 워커 수를 바꿔 가며
+`python app_stateless.py --workers N` 을 실행한 뒤 동시 클라이언트가 정해진 시간 동안
+큰 DOM 의 dom_with_image 단계를 반복 전송한다.
+  - 워커 수별 초당 단계 수, 1 워커 대비 배율(선형이면 N 배), 단계 지연 p50/p95
+  - 공유 백엔드(--backend local|sqlite|redis)로 호출 예산 / 응답 캐시 / 메트릭이 워커 사이에 공유되는지
+    /metrics 합산값(mcp_llm_requests_total, mcp_workers)으로 확인
+  - redis 는 redis_standin.py 를 함께 띄운다 (실제 Redis 주소는 --redis-url)
+
+단계마다 "cache": false 로 응답 캐시를 우회한다 (--cache 로 공유 캐시 적중 측정).
+mock 지연이 0 에 가까우면 병목은 서버 CPU(DOM 파싱/압축/프롬프트 생성)이므로
+코어 수만큼은 워커 수에 비례해 늘어나야 한다. 코어 수보다 워커가 많으면 늘지 않는다.
+
+사용법:
+  python bench_workers.py --workers 1 2 4 --clients 32 --duration 15
+  python bench_workers.py --backend redis --dom-size 3000 --latency 0.05
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+METRICS_INTERVAL = 1.0  # 워커 메트릭 스냅샷 게시 주기 (METRICS_PUBLISH_INTERVAL)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def wait_http(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as res:
+                return res.read().decode()
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"서버 응답 없음: {url}")
+
+
+def wait_port(port: int, timeout: float = 10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"포트 열리지 않음: {port}")
+
+
+def start(args: list[str], env: dict | None = None, verbose: bool = False) -> subprocess.Popen:
+    out = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen([sys.executable, *args], cwd=HERE, env=env, stdout=out, stderr=out)
+
+
+def stop(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def metric_total(text: str, name: str) -> float:
+    return sum(float(line.rpartition(" ")[2]) for line in text.splitlines()
+               if line.startswith(name) and not line.startswith("#"))
+
+
+# ============================
+# 클라이언트
+# ============================
+def build_message(dom: list, client: int, use_cache: bool) -> str:
+    plan = [{"step": 1, "action": "click", "target": "메일 링크", "selector": "a.link_mail"}]
+    return json.dumps({
+        "type": "dom_with_image",
+        "dom": dom,
+        "cache": use_cache,
+        "context": {"goal": f"메일 확인 {client}", "step": 1, "plan": plan, "totalActions": 0},
+    }, ensure_ascii=False)
+
+
+async def run_client(url: str, message: str, deadline: float, latencies: list, errors: list):
+    import websockets
+    async with websockets.connect(url, max_size=None) as ws:
+        while time.time() < deadline:
+            started = time.perf_counter()
+            await ws.send(message)
+            reply = json.loads(await ws.recv())
+            if reply.get("type") == "error":
+                errors.append(reply.get("detail"))
+            else:
+                latencies.append(time.perf_counter() - started)
+
+
+async def drive(url: str, clients: int, duration: float, dom: list, use_cache: bool) -> tuple[list, list, float]:
+    latencies, errors = [], []
+    messages = [build_message(dom, i, use_cache) for i in range(clients)]
+    started = time.perf_counter()
+    deadline = time.time() + duration
+    await asyncio.gather(*(run_client(url, messages[i], deadline, latencies, errors) for i in range(clients)))
+    return latencies, errors, time.perf_counter() - started
+
+
+# ============================
+# 실행
+# ============================
+def run_workers(workers: int, args, base_env: dict, dom: list) -> dict:
+    port = free_port()
+    env = dict(base_env, WEB_CONCURRENCY=str(workers))
+    server = start(["app_stateless.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+                   env, args.verbose)
+    try:
+        wait_http(f"http://127.0.0.1:{port}/health")
+        time.sleep(1.0 + 0.3 * workers)  # 모든 워커가 뜰 때까지
+        url = f"ws://127.0.0.1:{port}/ws"
+        asyncio.run(drive(url, min(args.clients, 4), 1.0, dom, args.cache))  # 워밍업
+        time.sleep(METRICS_INTERVAL * 1.5)  # 다른 워커 스냅샷이 올라올 때까지
+        before = metric_total(wait_http(f"http://127.0.0.1:{port}/metrics"), "mcp_llm_requests_total")
+        latencies, errors, wall = asyncio.run(drive(url, args.clients, args.duration, dom, args.cache))
+        time.sleep(METRICS_INTERVAL * 1.5)
+        text = wait_http(f"http://127.0.0.1:{port}/metrics")
+    finally:
+        stop(server)
+    return {
+        "workers": workers,
+        "steps": len(latencies),
+        "errors": len(errors),
+        "steps_per_s": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "llm_calls": int(metric_total(text, "mcp_llm_requests_total") - before),
+        "reporting_workers": int(metric_total(text, "mcp_workers")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app_stateless 멀티 워커 처리량 벤치마크 (mock LLM)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="비교할 워커 수 목록")
+    parser.add_argument("--clients", type=int, default=32, help="동시 WebSocket 클라이언트 수")
+    parser.add_argument("--duration", type=float, default=15.0, help="워커 수별 측정 시간(초)")
+    parser.add_argument("--dom-size", type=int, default=2000, help="합성 DOM 요소 수 (클수록 서버 CPU 부하)")
+    parser.add_argument("--latency", type=float, default=0.0, help="mock 첫 토큰 지연(초)")
+    parser.add_argument("--tps", type=float, default=100000.0, help="mock 출력 토큰/초")
+    parser.add_argument("--backend", choices=("local", "sqlite", "redis"), default="sqlite", help="공유 상태 백엔드")
+    parser.add_argument("--redis-url", help="실제 Redis 주소 (없으면 redis_standin.py 실행)")
+    parser.add_argument("--cache", action="store_true", help="공유 응답 캐시 허용")
+    parser.add_argument("--json", help="결과를 JSON 으로 저장")
+    parser.add_argument("--verbose", action="store_true", help="서버 로그 출력")
+    args = parser.parse_args()
+
+    sys.path.insert(0, HERE)
+    from bench_relevance import synthetic_page
+    dom = synthetic_page(args.dom_size, seed=1)
+
+    procs = []
+    mock_port = free_port()
+    procs.append(start(["mock_llm.py", "--port", str(mock_port), "--latency", str(args.latency),
+                        "--tps", str(args.tps), "--reason-tokens", "0"], verbose=args.verbose))
+    tmpdir = tempfile.mkdtemp(prefix="bench_workers_")
+    backend = "local"
+    if args.backend == "sqlite":
+        backend = f"sqlite:///{os.path.join(tmpdir, 'shared.db')}"
+    elif args.backend == "redis":
+        backend = args.redis_url
+        if not backend:
+            redis_port = free_port()
+            procs.append(start(["redis_standin.py", "--port", str(redis_port)], verbose=args.verbose))
+            wait_port(redis_port)
+            backend = f"redis://127.0.0.1:{redis_port}/0"
+
+    base_env = dict(
+        os.environ,
+        AZURE_OPENAI_ENDPOINT=f"http://127.0.0.1:{mock_port}",
+        AZURE_OPENAI_API_KEY=os.getenv("AZURE_OPENAI_API_KEY", "mock"),
+        AZURE_OPENAI_RPM="1000000", AZURE_OPENAI_VISION_RPM="1000000",
+        AZURE_OPENAI_TPM="1000000000", AZURE_OPENAI_VISION_TPM="1000000000",
+        SHARED_BACKEND=backend,
+        METRICS_PUBLISH_INTERVAL=str(METRICS_INTERVAL),
+    )
+    print(f"🏭 워커 {args.workers}, 클라이언트 {args.clients}, DOM {args.dom_size} 요소, "
+          f"백엔드 {args.backend}, CPU {os.cpu_count()}개")
+    results = []
+    try:
+        wait_port(mock_port)
+        for workers in args.workers:
+            result = run_workers(workers, args, base_env, dom)
+            results.append(result)
+            print(f"  워커 {workers}: {result['steps_per_s']} 단계/s (p50 {result['p50_ms']}ms, "
+                  f"p95 {result['p95_ms']}ms, 오류 {result['errors']}, LLM 호출 {result['llm_calls']}, "
+                  f"메트릭 보고 워커 {result['reporting_workers']})")
+    finally:
+        for proc in procs:
+            stop(proc)
+
+    if results:
+        single = results[0]["steps_per_s"] / results[0]["workers"] or 1.0
+        print("\n📈 확장성 (워커 1개 처리량 기준, 선형이면 효율 100%)")
+        for result in results:
+            speedup = result["steps_per_s"] / single
+            print(f"  워커 {result['workers']}: ×{speedup:.2f} (효율 {speedup / result['workers'] * 100:.0f}%)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "cpus": os.cpu_count(), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 결과 저장: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
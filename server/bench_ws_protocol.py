@@ -0,0 +1,73 @@
+"""
+/ws 메시지 인코딩 벤치마크
+
+같은 DOM + 스크린샷 메시지를 기존 JSON 텍스트(base64 이미지)와 binary-v1 프레임(ws_protocol.py)으로
+인코딩했을 때의 전송 바이트 수와 서버 쪽 해석 시간(json.loads vs decode_frame)을 나란히 출력한다.
+
+사용법:
+  python bench_ws_protocol.py                    # 합성 페이지 (요소 200/800/2000개)
+  python bench_ws_protocol.py --sizes 500 --runs 50
+"""
+import argparse
+import base64
+import json
+import time
+
+from bench_images import synthetic_screenshot, synthetic_wireframe
+from bench_relevance import synthetic_page
+from ws_protocol import decode_frame, encode_frame
+
+
+def build_message(n: int, png: bytes | None) -> dict:
+    return {
+        "type": "dom_with_image",
+        "message": "네이버 메일 확인",
+        "dom": synthetic_page(n),
+        "domVersion": 1,
+        "image": png,
+        "context": {"sessionId": "bench", "step": 0, "url": "https://www.naver.com/"},
+        "wireframeEnabled": png is not None,
+    }
+
+
+def timed(fn, runs: int) -> float:
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def run_case(label: str, message: dict, runs: int):
+    as_json = dict(message)
+    if message["image"] is not None:
+        as_json["image"] = "data:image/png;base64," + base64.b64encode(message["image"]).decode("ascii")
+    text = json.dumps(as_json, ensure_ascii=False)
+    text_bytes = len(text.encode("utf-8"))
+    plain = encode_frame(message, compress=False)
+    frame = encode_frame(message)
+
+    json_ms = timed(lambda: json.loads(text), runs)
+    plain_ms = timed(lambda: decode_frame(plain), runs)
+    frame_ms = timed(lambda: decode_frame(frame), runs)
+    print(f"{label:<26} {'json text':<16} {text_bytes:>10} {'100%':>6} {json_ms:>8.2f}ms")
+    print(f"{'':<26} {'binary-v1':<16} {len(plain):>10} {len(plain) / text_bytes:>6.0%} {plain_ms:>8.2f}ms")
+    print(f"{'':<26} {'binary-v1+zlib':<16} {len(frame):>10} {len(frame) / text_bytes:>6.0%} {frame_ms:>8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/ws JSON vs 바이너리 프레임 비교")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[200, 800, 2000], help="DOM 요소 수")
+    parser.add_argument("--runs", type=int, default=20, help="해석 시간 측정 반복 횟수")
+    args = parser.parse_args()
+
+    wireframe = synthetic_wireframe()
+    screenshot = synthetic_screenshot()
+    print(f"{'case':<26} {'encoding':<16} {'bytes':>10} {'ratio':>6} {'decode':>10}")
+    for n in args.sizes:
+        run_case(f"dom {n} text only", build_message(n, None), args.runs)
+        run_case(f"dom {n} + wireframe", build_message(n, wireframe), args.runs)
+    run_case(f"dom {args.sizes[-1]} + screenshot", build_message(args.sizes[-1], screenshot), args.runs)
+
+
+if __name__ == "__main__":
+    main()
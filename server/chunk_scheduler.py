@@ -0,0 +1,128 @@
+"""
+청크 우선순위 스케줄링 + 적응형 조기 종료
+
+청크를 문서 순서(헤더 → 내비 → 본문)로 부르면 본문의 대상은 3~4번째 호출에서야 나오고,
+신뢰도 0.92 조기 종료도 그 뒤에야 걸린다. 호출 전에 청크마다 점수를 매겨
+대상이 있을 가능성이 높은 청크부터 부른다.
+  - 목표 키워드 적중: relevance.score_elements (BM25, 페이지 전체 기준 IDF) 의 청크 내 최고점
+  - 조작 가능 요소 밀도: a / button / input / select / textarea / clickable 비율
+  - 화면 위치: 요소 py(문서 기준 중심 y, px)와 context.viewport(top=scrollY, height)로 구한
+    화면 높이 대비 위치(0~1) - 가운데일수록 높음. py 는 스크롤과 무관해 DOM 델타를 흔들지 않음
+    (이전 extension 의 vy 도 받음). 위치가 없으면 직전 랜드마크 영역(main/section > header/nav > footer)으로 대신함
+  - 현재 계획 단계의 selector 를 가진 청크는 항상 먼저
+
+점수 비율을 "대상이 그 청크에 있을 확률"로 보고, 지금까지 최고 후보의 신뢰도 c 에 대해
+기대 이득 = (1 - c) × (아직 보지 않은 청크 확률 합) 이 CHUNK_MIN_GAIN 보다 작으면 멈춘다
+(c ≥ 조기 종료 신뢰도면 바로 멈춤, 후보가 하나도 없으면 끝까지 봄).
+
+환경 변수:
+  CHUNK_SCHEDULING   priority | document (문서 순서, 비교용)
+  CHUNK_MIN_GAIN     남은 청크를 생략하는 기대 이득 기준 (기본 0.05, 0 이면 고신뢰 조기 종료만)
+"""
+import os
+import logging
+
+from llm_client import env_float
+from relevance import score_elements
+from page_features import CLICKABLE, INTERACTIVE, PageFeatures, extract_page_features
+
+logger = logging.getLogger("uvicorn.error")
+
+CHUNK_SCHEDULING = os.getenv("CHUNK_SCHEDULING", "priority")
+
+# 직전 랜드마크별 본문 가능성 (화면 위치를 모를 때의 위치 신호)
+REGION_PRIOR = {"main": 1.0, "article": 1.0, "section": 0.9, "form": 0.9, "aside": 0.4,
+                "header": 0.3, "nav": 0.3, "footer": 0.1}
+DEFAULT_REGION_PRIOR = 0.7
+
+W_KEYWORD = 0.5
+W_INTERACTIVE = 0.2
+W_VIEWPORT = 0.3
+PLAN_SELECTOR_BONUS = 1.0
+MIN_PRIORITY = 0.05
+
+
+def _viewport_score(el: dict, raw: dict | None, region: str | None, viewport: dict | None = None) -> float:
+    source = raw or el
+    vy = source.get("vy")
+    py = source.get("py")
+    if viewport and isinstance(py, (int, float)):
+        top, height = viewport.get("top"), viewport.get("height")
+        if isinstance(top, (int, float)) and isinstance(height, (int, float)) and height > 0:
+            vy = (py - top) / height
+    if isinstance(vy, (int, float)):
+        return max(0.0, 1.0 - abs(float(vy) - 0.5) * 2)
+    return REGION_PRIOR.get(region, DEFAULT_REGION_PRIOR)
+
+
+class ChunkSchedule:
+    """청크 방문 순서와 청크별 확률, 적응형 종료 판단"""
+
+    def __init__(self, priorities: list[float], order: list[int], stop_confidence: float, min_gain: float):
+        total = sum(priorities) or 1.0
+        self.shares = [p / total for p in priorities]
+        self.order = order
+        self.stop_confidence = stop_confidence
+        self.min_gain = min_gain
+
+    def expected_gain(self, best_confidence: float, unvisited) -> float:
+        return (1.0 - best_confidence) * sum(self.shares[i] for i in unvisited)
+
+    def should_stop(self, best_confidence: float | None, unvisited) -> tuple[bool, str]:
+        """unvisited: 아직 결과를 받지 못한 청크 번호들"""
+        if best_confidence is None or not unvisited:
+            return False, ""
+        if best_confidence >= self.stop_confidence:
+            return True, f"신뢰도 {best_confidence} ≥ {self.stop_confidence}"
+        gain = self.expected_gain(best_confidence, unvisited)
+        if gain < self.min_gain:
+            return True, f"기대 이득 {gain:.3f} < {self.min_gain} (신뢰도 {best_confidence})"
+        return False, ""
+
+
+def schedule_chunks(chunks: list[list], goal: str, plan_step: dict | None = None, raw_dom: list | None = None,
+                    hints: list | None = None, stop_confidence: float = 0.92, mode: str | None = None,
+                    features: PageFeatures | None = None, viewport: dict | None = None) -> ChunkSchedule:
+    """
+    청크 점수 계산 → 방문 순서 (mode=document 면 문서 순서, 점수는 종료 판단에만 사용)
+    features: 청크를 이어 붙인 DOM 의 page_features 결과 (조작 가능 태그, 랜드마크 위치)
+    viewport: extension context.viewport ({"top": scrollY, "height": innerHeight}) - 요소 py 를 화면 위치로 환산
+    """
+    elements = [el for chunk in chunks for el in chunk]
+    features = features or extract_page_features(elements)
+    raw_by_selector = {el.get("selector"): el for el in raw_dom or [] if el.get("selector")}
+    plan_selector = (plan_step or {}).get("selector")
+    # 계획 selector 는 별도 보너스로 다루고, 키워드 점수에는 selector 문자열만 질의로 넣음
+    query_step = {k: v for k, v in plan_step.items() if k != "selector"} if plan_step else None
+    scores = score_elements(elements, goal, query_step, (hints or []) + ([str(plan_selector)] if plan_selector else []))
+
+    chunk_stats = []
+    pos, region = 0, None
+    for chunk in chunks:
+        best, interactive, viewport_sum, plan_hit = 0.0, 0, 0.0, False
+        for el in chunk:
+            region = features.landmark_at.get(pos, region)
+            raw = raw_by_selector.get(el.get("selector"))
+            if plan_selector and el.get("selector") == plan_selector:
+                plan_hit = True
+            best = max(best, scores[pos])
+            if features.masks[pos] & (INTERACTIVE | CLICKABLE) or (raw or {}).get("clickable"):
+                interactive += 1
+            viewport_sum += _viewport_score(el, raw, region, viewport)
+            pos += 1
+        size = max(1, len(chunk))
+        chunk_stats.append((best, interactive / size, viewport_sum / size, plan_hit))
+
+    top_keyword = max((f[0] for f in chunk_stats), default=0.0) or 1.0
+    priorities = []
+    for best, density, position, plan_hit in chunk_stats:
+        priority = W_KEYWORD * min(1.0, best / top_keyword) + W_INTERACTIVE * density + W_VIEWPORT * position
+        priorities.append(max(MIN_PRIORITY, priority + (PLAN_SELECTOR_BONUS if plan_hit else 0.0)))
+
+    if (mode or CHUNK_SCHEDULING) == "document":
+        order = list(range(len(chunks)))
+    else:
+        order = sorted(range(len(chunks)), key=lambda i: priorities[i], reverse=True)
+    schedule = ChunkSchedule(priorities, order, stop_confidence, env_float("CHUNK_MIN_GAIN", 0.05))
+    logger.info("🧭 청크 방문 순서: " + ", ".join(f"{i+1}({schedule.shares[i]:.2f})" for i in order))
+    return schedule
@@ -0,0 +1,100 @@
+"""
+연결별 메시지 디스패처
+
+수신 루프는 메시지를 기다리기만 하고 무거운 요청(init, DOM 분석)은 세션 큐에 넣는다.
+  - client_log / user_continue 는 수신 루프에서 바로 처리 (LLM 호출 뒤에 줄 서지 않음)
+  - 무거운 요청은 워커가 순서대로 하나씩 요청 ID 가 붙은 작업으로 실행
+    (DOM 델타는 이전 버전에 의존하므로 순서 유지)
+  - 새 목표(init)가 오면 대기 중인 요청은 버리고 진행 중인 작업은 취소 → 남은 LLM 호출 중단
+  - 연결이 끊기면 워커와 진행 중인 작업 모두 취소
+  - 큐가 가득 차면 가장 오래된 요청을 버린다 (더 최신 페이지 상태가 우선, 델타가 어긋나면 dom_resync 로 복구)
+"""
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class ConnectionDispatcher:
+    def __init__(self, session, handler: Callable[[dict, int], Awaitable[None]], queue_size: int = 8):
+        self.session = session
+        self.handler = handler
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.current: tuple[str, asyncio.Task] | None = None
+        self._worker: asyncio.Task | None = None
+        self._seq = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.dropped = 0
+
+    def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    def _request_id(self, payload: dict) -> str:
+        self._seq += 1
+        return str(payload.get("requestId") or f"{self.session.id}-{self._seq}")
+
+    def submit(self, payload: dict, message_bytes: int) -> str:
+        """무거운 요청 등록 - 큐가 가득 차면 가장 오래된 요청을 버림"""
+        request_id = self._request_id(payload)
+        if self.queue.full():
+            old_id, old_payload, _ = self.queue.get_nowait()
+            self.dropped += 1
+            logger.info(f"🚧 세션 {self.session.id} 대기열 초과 - 요청 {old_id}({old_payload.get('type')}) 버림")
+        self.queue.put_nowait((request_id, payload, message_bytes))
+        return request_id
+
+    def cancel_all(self, reason: str):
+        """대기 중인 요청 폐기 + 진행 중인 작업 취소"""
+        while not self.queue.empty():
+            request_id, _, _ = self.queue.get_nowait()
+            self.cancelled += 1
+            logger.info(f"🗑️ 요청 {request_id} 폐기 ({reason})")
+        if self.current and not self.current[1].done():
+            request_id, task = self.current
+            task.cancel()
+            self.cancelled += 1
+            logger.info(f"✋ 진행 중인 요청 {request_id} 취소 ({reason})")
+
+    async def _run(self):
+        while True:
+            request_id, payload, message_bytes = await self.queue.get()
+            task = asyncio.create_task(self.handler(payload, message_bytes))
+            self.current = (request_id, task)
+            try:
+                # wait 는 워커가 취소돼도 작업을 같이 취소하지 않음 → close() 에서 명시적으로 처리
+                await asyncio.wait({task})
+            finally:
+                self.current = None
+            if task.cancelled():
+                continue
+            error = task.exception()
+            if error is None:
+                self.completed += 1
+                continue
+            logger.error(f"❌ 요청 {request_id}({payload.get('type')}) 처리 오류: {error}")
+            try:
+                await self.session.websocket.send_text(json.dumps({"type": "error", "detail": str(error)}))
+            except Exception:
+                pass
+
+    async def close(self):
+        """연결 종료 - 대기/진행 중인 요청과 워커 모두 취소"""
+        self.cancel_all("연결 종료")
+        current = self.current
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        if current:
+            await asyncio.gather(current[1], return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "in_flight": self.current[0] if self.current else None,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "dropped": self.dropped,
+        }
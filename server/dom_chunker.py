@@ -0,0 +1,130 @@
+"""
+토큰 예산 기반 DOM 청킹 (페이지 영역 경계 우선)
+
+고정 1000개 단위 분할 대신 요소마다 프롬프트 토큰을 로컬에서 추정해
+배포의 컨텍스트 창(과 분당 토큰 예산)에 들어가는 만큼 청크를 채운다.
+  - 청크 수 = ceil(전체 DOM 토큰 / 청크 예산) 최소값 (한 번에 들어가면 청킹하지 않음)
+  - 청크 수가 같으면 header / nav / main / section / article / aside / footer 랜드마크 앞에서
+    자르는 분할을 우선하고, 경계만으로는 최소 개수가 안 될 때만 영역 중간에서 자른다
+
+환경 변수:
+  LLM_CONTEXT_TOKENS    배포 컨텍스트 창 기본값 (기본 128000)
+  LLM_CONTEXT_WINDOWS   배포별 컨텍스트 창, 예: gpt-4.1-mini=1047576,gpt-4o=128000
+  CHUNK_TOKEN_BUDGET    청크 하나의 DOM 토큰 상한 (0 = 컨텍스트 창 기준만)
+  CHUNK_SAFETY_MARGIN   로컬 추정 오차를 감안해 쓰는 비율 (기본 0.9)
+"""
+import os
+import bisect
+
+from llm_client import env_float, env_int
+from rate_limiter import estimate_prompt_tokens
+from dom_codec import format_element
+
+REGION_TAGS = {"header", "nav", "main", "section", "article", "aside", "footer"}
+# 표 형식 한 줄 끝의 줄바꿈 등 요소당 고정 비용
+ELEMENT_OVERHEAD_TOKENS = 1
+
+
+def element_tokens(el: dict) -> int:
+    return estimate_prompt_tokens(format_element(el)) + ELEMENT_OVERHEAD_TOKENS
+
+
+def region_starts(dom: list) -> set[int]:
+    """영역(랜드마크) 요소가 시작되는 위치 - 청크를 자르기 좋은 경계"""
+    return {i for i, el in enumerate(dom) if i and (el.get("tag") or "").lower() in REGION_TAGS}
+
+
+def pack_chunks(dom: list, budget: int, costs: list[int] | None = None) -> list[list]:
+    """
+    예산 안에서 최소 개수의 청크로 나눔. 청크 수가 같은 분할 중에서는 영역 경계가 아닌 곳에서
+    자르는 횟수가 가장 적은 분할을 고른다. 자르는 후보는 (예산 안의 영역 경계, 예산을 꽉 채운 끝) 뿐이라
+    상태 수가 적다 - 꽉 채우는 탐욕 분할이 청크 수 최소이므로 후보에 항상 최소 해가 포함된다.
+    예산보다 큰 요소 하나는 단독 청크가 된다.
+    """
+    if not dom:
+        return []
+    costs = costs or [element_tokens(el) for el in dom]
+    budget = max(1, budget)
+    prefix = [0]
+    for cost in costs:
+        prefix.append(prefix[-1] + cost)
+    if prefix[-1] <= budget:
+        return [dom]
+
+    n = len(dom)
+    boundaries = sorted(region_starts(dom))
+    # best[start] = (청크 수, 경계 아닌 절단 수, -다음 시작) - 동률이면 앞 청크를 더 채움
+    best: dict[int, tuple[int, int, int]] = {n: (0, 0, -n)}
+
+    def solve(start: int) -> tuple[int, int, int]:
+        stack = [start]
+        while stack:
+            pos = stack[-1]
+            if pos in best:
+                stack.pop()
+                continue
+            far = max(pos + 1, bisect.bisect_right(prefix, prefix[pos] + budget) - 1)
+            ends = boundaries[bisect.bisect_right(boundaries, pos):bisect.bisect_right(boundaries, far)]
+            if far not in ends:
+                ends.append(far)
+            missing = [e for e in ends if e not in best]
+            if missing:
+                stack.extend(missing)
+                continue
+            best[pos] = min(
+                (best[e][0] + 1, best[e][1] + (0 if e == n or e in boundary_set else 1), -e) for e in ends
+            )
+            stack.pop()
+        return best[start]
+
+    boundary_set = set(boundaries)
+    chunks, start = [], 0
+    while start < n:
+        end = -solve(start)[2]
+        chunks.append(dom[start:end])
+        start = end
+    return chunks
+
+
+class ChunkBudget:
+    """배포별 컨텍스트 창에서 청크 하나에 넣을 DOM 토큰 예산 계산"""
+
+    def __init__(self, default_context: int = 128_000, windows: dict[str, int] | None = None,
+                 max_chunk_tokens: int = 0, safety_margin: float = 0.9):
+        self.default_context = default_context
+        self.windows = windows or {}
+        self.max_chunk_tokens = max_chunk_tokens
+        self.safety_margin = safety_margin
+
+    @classmethod
+    def from_env(cls) -> "ChunkBudget":
+        windows = {}
+        for item in os.getenv("LLM_CONTEXT_WINDOWS", "").split(","):
+            name, _, value = item.partition("=")
+            if name.strip() and value.strip().isdigit():
+                windows[name.strip()] = int(value)
+        return cls(env_int("LLM_CONTEXT_TOKENS", 128_000), windows,
+                   env_int("CHUNK_TOKEN_BUDGET", 0), env_float("CHUNK_SAFETY_MARGIN", 0.9))
+
+    def context_window(self, deployment: str) -> int:
+        return self.windows.get(deployment, self.default_context)
+
+    def for_call(self, deployments: list[str], fixed_tokens: int, tpm: dict[str, float] | None = None) -> int:
+        """
+        deployments: 청크 호출이 거칠 수 있는 배포들 (캐스케이드 단계 전부에 들어가야 함)
+        fixed_tokens: DOM 을 뺀 프롬프트 + 이미지 + 출력 상한 토큰
+        tpm: 배포별 분당 토큰 예산 - 한 호출이 이보다 크면 영원히 대기하므로 상한으로 씀
+        """
+        limits = []
+        for deployment in deployments:
+            limit = self.context_window(deployment)
+            if tpm and deployment in tpm:
+                limit = min(limit, int(tpm[deployment]))
+            limits.append(limit)
+        budget = int((min(limits) if limits else self.default_context) * self.safety_margin) - fixed_tokens
+        if self.max_chunk_tokens:
+            budget = min(budget, self.max_chunk_tokens)
+        return max(budget, 256)
+
+
+chunk_budget = ChunkBudget.from_env()
@@ -0,0 +1,121 @@
+"""
+프롬프트용 컴팩트 DOM 직렬화
+
+json.dumps(indent=2) 는 요소마다 키 이름과 공백을 반복한다. 대신 헤더 한 줄 +
+요소당 한 줄의 표 형식으로 보내고, 긴 CSS selector 대신 짧은 요소 ID(e0, e1, ...)를
+쓰게 한다. 모델이 돌려준 ID 는 resolve_element_ids() 로 실제 selector 로 되돌린다.
+
+DOM_PROMPT_FORMAT=json 이면 기존 JSON 형식을 그대로 사용 (비교/롤백용).
+"""
+import os
+import re
+import json
+from urllib.parse import urlsplit
+
+DOM_PROMPT_FORMAT = os.getenv("DOM_PROMPT_FORMAT", "table")
+# 표 형식에서 text 열 최대 길이 (extension 은 최대 500자까지 보냄)
+DOM_TEXT_MAX = int(os.getenv("DOM_TEXT_MAX", "80"))
+
+# compress_dom() 이 남기는 속성 순서
+TABLE_COLUMNS = ["tag", "text", "id", "name", "type", "class", "href", "value"]
+
+_WS_RE = re.compile(r"\s+")
+
+
+def assign_element_ids(dom_summary: list) -> tuple[list, dict]:
+    """요소마다 짧은 ID 부여 - (eid 가 붙은 복사본, eid → selector 맵)"""
+    tagged = []
+    id_map = {}
+    for i, el in enumerate(dom_summary):
+        eid = f"e{i}"
+        entry = dict(el)
+        entry["eid"] = eid
+        tagged.append(entry)
+        id_map[eid] = el.get("selector", "")
+    return tagged, id_map
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    text = _WS_RE.sub(" ", str(value)).strip()
+    return text.replace("\\", "\\\\").replace("|", "\\|")
+
+
+def _short_href(href: str) -> str:
+    """extension 은 동일 출처 href 만 보내므로 scheme/host 를 생략하고 경로만 남김"""
+    try:
+        parts = urlsplit(href)
+    except ValueError:
+        return href
+    if not parts.netloc:
+        return href
+    path = parts.path or "/"
+    return path + (f"?{parts.query}" if parts.query else "")
+
+
+def _row_values(el: dict, columns: list) -> list:
+    values = []
+    for c in columns:
+        v = el.get(c)
+        if v and c == "text":
+            v = _WS_RE.sub(" ", str(v)).strip()
+            if len(v) > DOM_TEXT_MAX:
+                v = v[:DOM_TEXT_MAX] + "…"
+        elif v and c == "href":
+            v = _short_href(str(v))
+        values.append(_cell(v))
+    return values
+
+
+def encode_dom_table(dom_summary: list) -> str:
+    """헤더 + 요소당 한 줄 표 형식. 값이 하나도 없는 열은 생략"""
+    has_eid = bool(dom_summary) and all("eid" in el for el in dom_summary)
+    key_col = "eid" if has_eid else "selector"
+    columns = [c for c in TABLE_COLUMNS if any(el.get(c) for el in dom_summary)]
+    lines = [
+        f"(table: one element per line, '|' separated, empty = none, href = same-origin path; use the {key_col} value as \"selector\")",
+        "|".join([key_col] + columns),
+    ]
+    for el in dom_summary:
+        lines.append("|".join([_cell(el.get(key_col))] + _row_values(el, columns)))
+    return "\n".join(lines)
+
+
+def format_dom(dom_summary: list, fmt: str | None = None) -> str:
+    """프롬프트에 삽입할 DOM 문자열"""
+    if (fmt or DOM_PROMPT_FORMAT) == "json":
+        return json.dumps(dom_summary, ensure_ascii=False, indent=2)
+    return encode_dom_table(dom_summary)
+
+
+def format_element(el: dict, fmt: str | None = None) -> str:
+    """요소 하나가 프롬프트에서 차지하는 문자열 (청크 토큰 추정용, 표 형식은 빈 열 포함)"""
+    if (fmt or DOM_PROMPT_FORMAT) == "json":
+        return json.dumps(el, ensure_ascii=False, indent=2)
+    key = el.get("eid") or el.get("selector")
+    return "|".join([_cell(key)] + _row_values(el, TABLE_COLUMNS))
+
+
+def resolve_element_ids(obj, id_map: dict):
+    """LLM 응답(액션 객체 또는 계획 배열)의 요소 ID 를 실제 selector 로 치환"""
+    if not id_map:
+        return obj
+    if isinstance(obj, list):
+        return [resolve_element_ids(item, id_map) for item in obj]
+    if not isinstance(obj, dict):
+        return obj
+    eid = obj.pop("eid", None)
+    selector = obj.get("selector")
+    if isinstance(selector, str) and selector.strip() in id_map:
+        obj["selector"] = id_map[selector.strip()]
+    elif isinstance(eid, str) and eid in id_map:
+        obj["selector"] = id_map[eid]
+    condition = obj.get("condition")
+    if isinstance(condition, str) and condition.strip() in id_map:
+        obj["condition"] = id_map[condition.strip()]
+    # 액션 묶음의 후속 액션과 가드 조건
+    for key in ("next_actions", "guard"):
+        if isinstance(obj.get(key), (list, dict)):
+            obj[key] = resolve_element_ids(obj[key], id_map)
+    return obj
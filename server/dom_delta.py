@@ -0,0 +1,115 @@
+"""
+/ws DOM 델타 동기화
+
+클라이언트는 서버가 확인(dom_ack)한 버전을 기준으로 추가/삭제/변경된 요소만 보낸다.
+서버는 연결마다 마지막 DOM 을 보관하고 델타를 적용해 전체 목록을 복원한다.
+
+요소 키: "<selector>::<같은 selector 의 등장 순번>" (extension content.js 와 동일 규칙)
+
+델타 형식:
+  {"base_version": 3, "version": 4, "count": 812,
+   "added":   [{"key": "...", "index": 17, "el": {...}}],
+   "removed": ["<key>", ...],
+   "changed": [{"key": "...", "el": {...}}]}
+"""
+import logging
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class DomDeltaMismatch(Exception):
+    """기준 버전이 다르거나 델타 적용 결과가 맞지 않음 → 전체 DOM 재전송 필요"""
+
+
+def element_keys(dom: list) -> list[str]:
+    seen: dict[str, int] = {}
+    keys = []
+    for el in dom:
+        selector = el.get("selector") or el.get("tag") or "unknown"
+        n = seen.get(selector, 0)
+        seen[selector] = n + 1
+        keys.append(f"{selector}::{n}")
+    return keys
+
+
+def diff_dom(old: list, new: list) -> dict:
+    """두 DOM 목록의 추가/삭제/변경 요소 (프롬프트용 변경 요약에 사용)"""
+    old_map = dict(zip(element_keys(old), old))
+    new_keys = element_keys(new)
+    new_map = dict(zip(new_keys, new))
+    return {
+        "added": [new_map[k] for k in new_keys if k not in old_map],
+        "removed": [old_map[k] for k in old_map if k not in new_map],
+        "changed": [new_map[k] for k in new_keys if k in old_map and old_map[k] != new_map[k]],
+    }
+
+
+def describe_dom_changes(changes: dict | None, limit: int = 30) -> str:
+    """직전 단계 이후 DOM 변경 요약 텍스트"""
+    if not changes:
+        return ""
+    added, removed, changed = changes.get("added", []), changes.get("removed", []), changes.get("changed", [])
+    if not (added or removed or changed):
+        return "DOM changes since last step: none (page did not change)"
+    lines = [f"DOM changes since last step: +{len(added)} added, -{len(removed)} removed, ~{len(changed)} changed"]
+    for mark, items in (("+", added), ("~", changed), ("-", removed)):
+        for el in items[:limit]:
+            text = (el.get("text") or "")[:60]
+            lines.append(f"{mark} {el.get('tag', '')} {el.get('selector', '')} {text}".rstrip())
+        limit = max(0, limit - len(items))
+    return "\n".join(lines)
+
+
+class DomState:
+    """연결별 마지막 DOM 과 버전"""
+
+    def __init__(self):
+        self.version = None
+        self.keys: list[str] = []
+        self.elements: dict[str, dict] = {}
+        self.last_changes: dict | None = None
+
+    def full_view(self) -> list:
+        return [self.elements[k] for k in self.keys]
+
+    def replace(self, dom: list, version=None) -> list:
+        """전체 DOM 수신 - 이전 DOM 과의 차이를 계산해 두고 상태 교체"""
+        previous = self.full_view() if self.keys else None
+        self.keys = element_keys(dom)
+        self.elements = dict(zip(self.keys, dom))
+        self.version = version
+        self.last_changes = diff_dom(previous, dom) if previous is not None else None
+        return dom
+
+    def apply_delta(self, delta: dict) -> list:
+        if self.version is None or delta.get("base_version") != self.version:
+            raise DomDeltaMismatch(f"기준 버전 불일치 (서버 {self.version}, 요청 {delta.get('base_version')})")
+
+        removed = set(delta.get("removed", []))
+        keys = [k for k in self.keys if k not in removed]
+        elements = {k: self.elements[k] for k in keys}
+        removed_elements = [self.elements[k] for k in self.keys if k in removed]
+
+        changed = []
+        for item in delta.get("changed", []):
+            if item.get("key") not in elements:
+                raise DomDeltaMismatch(f"알 수 없는 변경 요소: {item.get('key')}")
+            elements[item["key"]] = item["el"]
+            changed.append(item["el"])
+
+        added = []
+        for item in sorted(delta.get("added", []), key=lambda a: a.get("index", 0)):
+            keys.insert(min(item.get("index", len(keys)), len(keys)), item["key"])
+            elements[item["key"]] = item["el"]
+            added.append(item["el"])
+
+        if "count" in delta and delta["count"] != len(keys):
+            raise DomDeltaMismatch(f"요소 수 불일치 (복원 {len(keys)}, 클라이언트 {delta['count']})")
+
+        self.keys = keys
+        self.elements = elements
+        self.version = delta.get("version")
+        self.last_changes = {"added": added, "removed": removed_elements, "changed": changed}
+        logger.info(f"🧩 DOM 델타 적용: v{delta.get('base_version')} → v{self.version} "
+                    f"(+{len(added)} -{len(removed_elements)} ~{len(changed)}, 전체 {len(keys)}개)")
+        return self.full_view()
@@ -0,0 +1,203 @@
+"""
+스크린샷 이미지 유틸리티 (Pillow)
+"""
+import base64
+import hashlib
+import io
+import math
+import os
+import logging
+
+from PIL import Image
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def strip_data_url(image_data: str) -> str:
+    """data:image/...;base64, 접두사 제거"""
+    if image_data.startswith('data:image'):
+        return image_data.split(',', 1)[1]
+    return image_data
+
+
+def decode_image_bytes(image_data: str | bytes) -> bytes:
+    """base64(data URL) 문자열 또는 바이너리 프로토콜의 원본 바이트"""
+    if isinstance(image_data, (bytes, bytearray)):
+        return bytes(image_data)
+    return base64.b64decode(strip_data_url(image_data))
+
+
+def dhash(image: Image.Image, size: int = 8) -> str:
+    """difference hash - 거의 같은 스크린샷은 같은(또는 가까운) 해시"""
+    gray = image.convert("L").resize((size + 1, size), Image.BILINEAR)
+    px = list(gray.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = px[row * (size + 1) + col]
+            right = px[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:0{size * size // 4}x}"
+
+
+def perceptual_hash(image_data: str | bytes | None) -> str | None:
+    """이미지의 perceptual hash (디코딩 실패 시 바이트 해시로 대체)"""
+    if not image_data:
+        return None
+    try:
+        raw = decode_image_bytes(image_data)
+    except Exception:
+        return hashlib.sha1(image_data.encode()).hexdigest()[:16]
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            return dhash(img)
+    except Exception:
+        return hashlib.sha1(raw).hexdigest()[:16]
+
+
+# ============================
+# Vision 호출 전 스크린샷 전처리
+# ============================
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()      # webp | jpeg | png
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "auto").lower()      # auto | low | high
+# 직전 단계와 같은 화면일 때: low(저해상도로 재사용) | skip(이미지 생략) | off.
+# 8x8 dhash 는 입력값 채움·드롭다운 펼침 같은 작은 변화를 못 잡아 평가에 필요한 화면이 저해상도가 되므로 기본은 off,
+# 켜더라도 DOM 상태(값/텍스트 포함)까지 직전과 같을 때만 적용 (prepare_image 의 dom_unchanged)
+IMAGE_DEDUP = os.getenv("IMAGE_DEDUP", "off").lower()
+IMAGE_DEDUP_DISTANCE = int(os.getenv("IMAGE_DEDUP_DISTANCE", "4"))
+
+LOW_DETAIL_EDGE = 512
+_MIME = {"webp": "image/webp", "jpeg": "image/jpeg", "jpg": "image/jpeg", "png": "image/png"}
+
+
+def hash_distance(a: str | None, b: str | None) -> int:
+    """두 dhash 의 해밍 거리 (비교 불가면 큰 값)"""
+    if not a or not b or len(a) != len(b):
+        return 1 << 16
+    try:
+        return bin(int(a, 16) ^ int(b, 16)).count("1")
+    except ValueError:
+        return 0 if a == b else 1 << 16
+
+
+def image_tokens(width: int, height: int, detail: str) -> int:
+    """OpenAI vision 입력 토큰 계산 (low=85, high=512 타일당 170 + 85)"""
+    if detail == "low":
+        return 85
+    if not width or not height:
+        return 765  # 크기를 모르는 이미지 (디코딩 실패) - high detail 평균치
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    tiles = math.ceil(w / 512) * math.ceil(h / 512)
+    return 170 * tiles + 85
+
+
+class PreparedImage:
+    """Vision API 에 보낼 형태로 재인코딩된 스크린샷"""
+
+    def __init__(self, data: str, mime_type: str, width: int, height: int, detail: str,
+                 phash: str | None, original_bytes: int, reused: bool = False):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+        self.detail = detail
+        self.phash = phash
+        self.original_bytes = original_bytes
+        self.reused = reused
+
+    @property
+    def size(self) -> int:
+        return len(self.data) * 3 // 4
+
+    @property
+    def tokens(self) -> int:
+        return image_tokens(self.width, self.height, self.detail)
+
+    @property
+    def extension(self) -> str:
+        return self.mime_type.split("/")[1]
+
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.data}"
+
+
+def encode_image(img: Image.Image, max_edge: int, fmt: str, quality: int) -> tuple[bytes, int, int]:
+    if max(img.size) > max_edge:
+        img = img.copy()
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    fmt = "jpeg" if fmt == "jpg" else fmt
+    if fmt in ("jpeg", "webp") and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, format="PNG", optimize=True)
+    elif fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue(), img.size[0], img.size[1]
+
+
+def prepare_image(image_data: str | bytes | None, previous_hash: str | None = None,
+                  max_edge: int | None = None, fmt: str | None = None,
+                  quality: int | None = None, detail: str | None = None,
+                  dedup: str | None = None, dom_unchanged: bool = True) -> PreparedImage | None:
+    """한 번 디코딩 → perceptual hash → (중복이면 생략/저해상도) → 축소 + 재인코딩
+
+    image_data 는 base64(data URL) 문자열 또는 바이너리 프로토콜로 받은 원본 바이트
+    dom_unchanged=False 면 해시가 같아도 중복으로 보지 않음 (DOM 이 바뀐 단계는 항상 원래 해상도)
+    """
+    if not image_data:
+        return None
+    max_edge = max_edge or IMAGE_MAX_EDGE
+    fmt = (fmt or IMAGE_FORMAT).lower()
+    quality = quality or IMAGE_QUALITY
+    detail = (detail or IMAGE_DETAIL).lower()
+    dedup = (dedup or IMAGE_DEDUP).lower()
+
+    try:
+        raw = decode_image_bytes(image_data)
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+    except Exception as e:
+        logger.error(f"❌ 스크린샷 디코딩 실패 - 원본 그대로 사용: {e}")
+        if isinstance(image_data, (bytes, bytearray)):
+            data = base64.b64encode(image_data).decode("ascii")
+        else:
+            data = strip_data_url(image_data)
+        return PreparedImage(data, "image/png", 0, 0, "low" if detail == "low" else "high", None, len(data) * 3 // 4)
+
+    phash = dhash(img)
+    reused = False
+    if dedup != "off" and dom_unchanged and hash_distance(phash, previous_hash) <= IMAGE_DEDUP_DISTANCE:
+        if dedup == "skip":
+            logger.info("🖼️ 직전 단계와 같은 화면 - 이미지 생략")
+            return None
+        reused = True
+        detail = "low"
+
+    if detail == "auto":
+        detail = "low" if max(img.size) <= LOW_DETAIL_EDGE else "high"
+    if detail == "low":
+        max_edge = min(max_edge, LOW_DETAIL_EDGE)
+
+    encoded, width, height = encode_image(img, max_edge, fmt, quality)
+    if len(encoded) >= len(raw) and fmt != "png":
+        # 단색 박스 위주의 와이어프레임은 손실 압축이 PNG 보다 큼 → 더 작은 쪽 사용
+        if max(img.size) <= max_edge:
+            encoded, fmt = raw, (img.format or "png").lower()
+        else:
+            png, _, _ = encode_image(img, max_edge, "png", quality)
+            if len(png) < len(encoded):
+                encoded, fmt = png, "png"
+    prepared = PreparedImage(base64.b64encode(encoded).decode("ascii"), _MIME.get(fmt, "image/png"),
+                             width, height, detail, phash, len(raw), reused)
+    logger.info(f"🖼️ 스크린샷 전처리: {img.size[0]}x{img.size[1]} {len(raw)}B → {width}x{height} "
+                f"{prepared.mime_type} {prepared.size}B, detail={detail}, ~{prepared.tokens} tokens"
+                + (" (직전 화면과 동일 - 저해상도 재사용)" if reused else ""))
+    return prepared
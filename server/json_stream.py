@@ -0,0 +1,79 @@
+"""
+스트리밍 LLM 응답용 증분 JSON 경계 검출
+
+토큰이 들어올 때마다 feed() 로 넘기면 최상위 JSON 값이 닫히는 순간 그 부분 문자열을 돌려준다.
+액션 객체는 보통 reason 설명이나 뒤따르는 문장보다 훨씬 먼저 완성되므로,
+그 시점에 스트림을 닫고 바로 액션을 보낼 수 있다.
+
+경계 규칙은 extract_top_level_json 과 같다:
+  - '[' 와 '{' 중 먼저 나오는 쪽부터 (코드 펜스 "```json" 이나 "Here is the plan:" 같은 앞 문장은 건너뜀)
+  - 단, '[' 는 바로 뒤(공백 제외)가 '{' '[' '"' ']' 일 때만 JSON 배열로 봄 - 설명 문장의 "[e12]" 같은 괄호 제외
+  - 문자열 안의 괄호와 이스케이프는 무시
+"""
+
+
+class JsonStreamScanner:
+    def __init__(self):
+        self.text = ""
+        self.result: str | None = None
+        self._pos = 0
+        self._open: str | None = None   # '[' 또는 '{'
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> str | None:
+        """조각 추가 - 최상위 JSON 이 닫혔으면 그 문자열, 아니면 None"""
+        if self.result is not None:
+            return self.result
+        self.text += chunk
+        text = self.text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._start < 0:
+                if ch == "[":
+                    nxt = _next_non_space(text, i + 1)
+                    if nxt is None:
+                        break       # '[' 뒤 글자가 아직 안 옴 - 다음 조각에서 다시 판단
+                    if nxt not in '{["]':
+                        i += 1
+                        continue
+                elif ch != "{":
+                    i += 1
+                    continue
+                self._open = ch
+                self._start = i
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = text[self._start:i + 1]
+                    return self.result
+            i += 1
+        self._pos = i
+        return None
+
+
+def _next_non_space(text: str, i: int) -> str | None:
+    while i < len(text):
+        if not text[i].isspace():
+            return text[i]
+        i += 1
+    return None
+
+
+def scan_top_level_json(text: str) -> str | None:
+    """완성된 텍스트에서 최상위 JSON 부분 문자열"""
+    return JsonStreamScanner().feed(text.strip())
@@ -0,0 +1,101 @@
+"""
+공유 LLM 클라이언트 풀
+
+호출마다 AzureOpenAI 를 새로 만들면 매번 커넥션 풀과 TLS 핸드셰이크가 생기고,
+동기 `.create()` 가 이벤트 루프를 막는다. 서버 수명 동안 하나의
+AsyncAzureOpenAI + httpx.AsyncClient 를 공유해 keep-alive 커넥션을 재사용한다.
+
+환경 변수:
+  LLM_MAX_CONNECTIONS       최대 동시 커넥션 수 (기본 20)
+  LLM_MAX_KEEPALIVE         유지할 keep-alive 커넥션 수 (기본 10)
+  LLM_KEEPALIVE_EXPIRY      유휴 커넥션 유지 시간(초) (기본 30)
+  LLM_TIMEOUT               요청 타임아웃(초) (기본 60)
+"""
+import os
+import logging
+
+import httpx
+from openai import AsyncAzureOpenAI
+
+logger = logging.getLogger("uvicorn.error")
+
+# response_format json_schema(구조화 출력)는 2024-08-01-preview 이상 필요
+AZURE_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21")
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class LLMClientPool:
+    """AsyncAzureOpenAI 클라이언트와 HTTP 커넥션 풀을 한 번만 만들어 공유"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None):
+        # transport 를 교체하면 로컬 mock 서버/ MockTransport 로 테스트 가능
+        self.transport = transport
+        self._http: httpx.AsyncClient | None = None
+        self._client: AsyncAzureOpenAI | None = None
+
+    def configure(self, transport: httpx.AsyncBaseTransport | None = None):
+        """시작 전에 transport 교체 (이미 시작된 경우 close 후 다시 start 필요)"""
+        self.transport = transport
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=env_int("LLM_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=env_int("LLM_MAX_KEEPALIVE", 10),
+            keepalive_expiry=env_float("LLM_KEEPALIVE_EXPIRY", 30.0),
+        )
+        timeout = httpx.Timeout(env_float("LLM_TIMEOUT", 60.0), connect=10.0)
+        return httpx.AsyncClient(limits=limits, timeout=timeout, transport=self.transport)
+
+    def _build_openai_client(self) -> AsyncAzureOpenAI:
+        return AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=AZURE_API_VERSION,
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            http_client=self._http,
+            max_retries=0,  # 재시도/백오프는 호출부에서 직접 처리
+        )
+
+    async def start(self):
+        if self._http is None:
+            self._http = self._build_http_client()
+        if self._client is None:
+            try:
+                self._client = self._build_openai_client()
+                logger.info("🔗 LLM 클라이언트 풀 시작")
+            except Exception as e:
+                # 환경 변수 누락 등 - 첫 호출에서 다시 시도하고 호출 단위로 실패 처리
+                logger.error(f"LLM 클라이언트 생성 실패: {e}")
+
+    async def get_client(self) -> AsyncAzureOpenAI:
+        """공유 클라이언트 반환 (시작 전이면 지연 생성)"""
+        if self._http is None:
+            self._http = self._build_http_client()
+        if self._client is None:
+            self._client = self._build_openai_client()
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        logger.info("🔌 LLM 클라이언트 풀 종료")
+
+
+# 프로세스 단위 공유 풀
+llm_pool = LLMClientPool()
@@ -0,0 +1,404 @@
+"""
+단계 지연 시간 / 카운터 계측
+
+한 단계가 어디서 시간을 쓰는지(DOM 압축, 프롬프트 생성, 배포 예산 대기, 429 백오프,
+모델 응답, JSON 추출)와 토큰 사용량, 재시도, 캐시 적중, 청크 수, 메시지 크기를 기록한다.
+  - GET /metrics : Prometheus 텍스트 형식 (대시보드 수집용)
+  - 목표 로그    : 목표가 끝나면 GOAL_SUMMARY 이벤트로 목표 단위 합계
+
+외부 의존성 없이 Counter / Histogram / Gauge(콜백) 만 구현한다.
+목표 단위 합계는 요청을 처리하는 작업에 goal_scope 로 묶인 GoalLogger 의 stats 에 더해진다
+(asyncio 작업 / to_thread 로 contextvar 가 그대로 전달됨).
+"""
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+# 초 단위 기본 버킷 (WebSocket 단계 ~ LLM 호출 범위)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in sorted(self.values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 레이블 → [버킷별 개수..., 합계, 개수]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[i] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> list[str]:
+        lines = []
+        for key, entry in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, entry):
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {round(entry[-2], 6)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {entry[-1]}")
+        return lines
+
+
+class Gauge:
+    """수집 시점에 콜백으로 값을 읽는 게이지 (활성 세션 수, 큐 길이 등)"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def collect(self) -> list[str]:
+        try:
+            return [f"{self.name} {_number(self.fn())}"]
+        except Exception:
+            return []
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = SECONDS_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, help, fn))
+
+    def render(self) -> str:
+        """Prometheus 텍스트 노출 형식 (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STEP_SECONDS = metrics.histogram(
+    "mcp_step_duration_seconds", "WebSocket 요청 하나의 처리 시간", ("type",))
+PHASE_SECONDS = metrics.histogram(
+    "mcp_phase_duration_seconds", "단계 내부 구간별 시간", ("phase",))
+LLM_REQUESTS = metrics.counter(
+    "mcp_llm_requests_total", "LLM 호출 시도 (outcome: ok|rate_limited|error|exhausted)", ("deployment", "outcome"))
+LLM_SECONDS = metrics.histogram(
+    "mcp_llm_response_seconds", "모델 응답 시간 (스트리밍은 JSON 완성까지)", ("deployment",))
+LLM_QUEUE_SECONDS = metrics.histogram(
+    "mcp_llm_queue_wait_seconds", "배포 예산 슬롯 대기 시간 (429 차단 시간 포함)", ("deployment",))
+LLM_BACKOFF_SECONDS = metrics.histogram(
+    "mcp_llm_backoff_seconds", "429 수신 후 지정된 대기 시간", ("deployment",))
+LLM_RETRIES = metrics.counter(
+    "mcp_llm_retries_total", "429 로 인한 재시도", ("deployment",))
+LLM_TOKENS = metrics.counter(
+    "mcp_llm_tokens_total", "토큰 사용량 (source: usage=API 응답, estimate=스트리밍 추정치)", ("deployment", "kind", "source"))
+CACHE_LOOKUPS = metrics.counter(
+    "mcp_cache_lookups_total", "응답 캐시 / 워크플로우 재생 조회", ("cache", "result"))
+DOM_CHUNKS = metrics.histogram(
+    "mcp_dom_chunks", "청킹 분석 한 번의 청크 수", (), COUNT_BUCKETS)
+DOM_CHUNKS_VISITED = metrics.histogram(
+    "mcp_dom_chunks_visited", "청킹 분석 한 번에 실제로 호출한 청크 수 (우선순위 순서 + 조기 종료)", (), COUNT_BUCKETS)
+CHUNK_CALLS = metrics.counter(
+    "mcp_dom_chunk_calls_total", "완료된 청크 분석 호출 (result: action|none|invalid)", ("result",))
+PAYLOAD_BYTES = metrics.histogram(
+    "mcp_payload_bytes", "WebSocket 메시지 크기", ("direction", "type"), BYTES_BUCKETS)
+TEXT_ONLY_STEPS = metrics.counter(
+    "mcp_text_only_steps_total", "텍스트 전용 단계 (result: text|escalated=스크린샷 요청)", ("kind", "result"))
+GOALS = metrics.counter(
+    "mcp_goals_total", "종료된 목표 (outcome: completed|end|abandoned)", ("outcome",))
+
+
+# ============================
+# 목표 단위 합계
+# ============================
+class GoalStats:
+    def __init__(self):
+        self.started = time.time()
+        self.finished = False
+        self.steps = 0
+        self.llm_calls = 0
+        self.llm_errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated_tokens = 0
+        self.llm_seconds = 0.0
+        self.queue_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.replays = 0
+        self.chunks = 0
+        self.chunk_calls = 0
+        self.escalations = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.phases: dict[str, float] = {}
+
+    def summary(self) -> dict:
+        return {
+            "duration_s": round(time.time() - self.started, 1),
+            "steps": self.steps,
+            "llm_calls": self.llm_calls,
+            "llm_errors": self.llm_errors,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "estimated_tokens": self.estimated_tokens,
+            "llm_s": round(self.llm_seconds, 2),
+            "queue_wait_s": round(self.queue_seconds, 2),
+            "backoff_s": round(self.backoff_seconds, 2),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "workflow_replays": self.replays,
+            "chunks": self.chunks,
+            "chunk_calls": self.chunk_calls,
+            "vision_escalations": self.escalations,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "phases_ms": {k: round(v * 1000, 1) for k, v in self.phases.items()},
+        }
+
+
+# 현재 요청의 GoalLogger (stats 속성) - websocket_endpoint 가 요청 작업마다 설정
+goal_scope: ContextVar[object | None] = ContextVar("goal_scope", default=None)
+
+
+def current_goal_stats() -> GoalStats | None:
+    return getattr(goal_scope.get(), "stats", None)
+
+
+# ============================
+# 기록 헬퍼
+# ============================
+@contextmanager
+def observe_phase(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.observe(elapsed, phase=phase)
+        stats = current_goal_stats()
+        if stats:
+            stats.phases[phase] = stats.phases.get(phase, 0.0) + elapsed
+
+
+def record_step(msg_type: str, seconds: float, message_bytes: int):
+    STEP_SECONDS.observe(seconds, type=msg_type)
+    PAYLOAD_BYTES.observe(message_bytes, direction="in", type=msg_type)
+    stats = current_goal_stats()
+    if stats:
+        stats.steps += 1
+        stats.bytes_in += message_bytes
+
+
+def record_sent(msg_type: str, size: int):
+    PAYLOAD_BYTES.observe(size, direction="out", type=msg_type)
+    stats = current_goal_stats()
+    if stats:
+        stats.bytes_out += size
+
+
+def record_llm_call(deployment: str, outcome: str, seconds: float | None = None, queue_seconds: float | None = None):
+    LLM_REQUESTS.inc(deployment=deployment, outcome=outcome)
+    if seconds is not None:
+        LLM_SECONDS.observe(seconds, deployment=deployment)
+    if queue_seconds is not None:
+        LLM_QUEUE_SECONDS.observe(queue_seconds, deployment=deployment)
+    stats = current_goal_stats()
+    if stats:
+        if outcome == "ok":
+            stats.llm_calls += 1
+        elif outcome != "rate_limited":
+            stats.llm_errors += 1
+        stats.llm_seconds += seconds or 0.0
+        stats.queue_seconds += queue_seconds or 0.0
+
+
+def record_tokens(deployment: str, prompt: int, completion: int, source: str = "usage"):
+    LLM_TOKENS.inc(prompt, deployment=deployment, kind="prompt", source=source)
+    LLM_TOKENS.inc(completion, deployment=deployment, kind="completion", source=source)
+    stats = current_goal_stats()
+    if stats:
+        if source == "usage":
+            stats.prompt_tokens += prompt
+            stats.completion_tokens += completion
+        else:
+            stats.estimated_tokens += prompt + completion
+
+
+def record_retry(deployment: str, wait: float):
+    LLM_RETRIES.inc(deployment=deployment)
+    LLM_BACKOFF_SECONDS.observe(wait, deployment=deployment)
+    stats = current_goal_stats()
+    if stats:
+        stats.retries += 1
+        stats.backoff_seconds += wait
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+    stats = current_goal_stats()
+    if stats:
+        if cache == "workflow":
+            stats.replays += int(hit)
+        elif hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def record_chunks(total: int, visited: int | None = None):
+    DOM_CHUNKS.observe(total)
+    DOM_CHUNKS_VISITED.observe(total if visited is None else visited)
+    stats = current_goal_stats()
+    if stats:
+        stats.chunks += total
+        stats.chunk_calls += total if visited is None else visited
+
+
+def record_chunk_call(result: str):
+    CHUNK_CALLS.inc(result=result)
+
+
+def record_text_only(kind: str, escalated: bool):
+    TEXT_ONLY_STEPS.inc(kind=kind, result="escalated" if escalated else "text")
+    stats = current_goal_stats()
+    if stats:
+        stats.escalations += int(escalated)
+
+
+# ============================
+# 워커 간 합산 (멀티 워커 배포)
+# ============================
+class SharedMetrics:
+    """
+    워커마다 자기 레지스트리 출력(스냅샷)을 공유 백엔드에 주기적으로 올리고,
+    /metrics 는 살아 있는 워커 스냅샷의 같은 시계열 값을 합산해 돌려준다.
+    기록 헬퍼(record_*)는 그대로 로컬 레지스트리에 쓰므로 호출부 변경이 없다.
+    종료된 워커의 스냅샷은 TTL 후 사라진다 (그 워커의 누적값도 합계에서 빠짐).
+    """
+    PREFIX = "metrics:worker:"
+
+    def __init__(self, backend, registry: MetricsRegistry, worker_id: str, interval: float = 5.0):
+        self.backend = backend
+        self.registry = registry
+        self.worker_id = worker_id
+        self.interval = interval
+
+    async def publish(self):
+        await self.backend.set(self.PREFIX + self.worker_id, self.registry.render(), ttl=self.interval * 3)
+
+    async def withdraw(self):
+        """종료하는 워커의 스냅샷을 바로 내림 (TTL 만료까지 합계에 남지 않도록)"""
+        await self.backend.delete(self.PREFIX + self.worker_id)
+
+    async def run(self):
+        """백그라운드 게시 루프 (startup 에서 create_task)"""
+        while True:
+            try:
+                await self.publish()
+            except Exception as e:
+                logging.getLogger("uvicorn.error").warning(f"⚠️ 메트릭 스냅샷 게시 실패: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def render(self) -> str:
+        await self.publish()
+        snapshots = await self.backend.scan(self.PREFIX)
+        return merge_expositions([snapshots[k] for k in sorted(snapshots)]) + \
+            f"# HELP mcp_workers 스냅샷을 올린 워커 수\n# TYPE mcp_workers gauge\nmcp_workers {len(snapshots)}\n"
+
+
+def merge_expositions(texts: list[str]) -> str:
+    """Prometheus 텍스트 여러 개를 시계열 단위로 합산 (메트릭 순서 유지)"""
+    merged: dict[str, dict] = {}
+    for text in texts:
+        current = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                current = merged.setdefault(line.split()[2], {"HELP": "", "TYPE": "", "series": {}})
+                current[line.split()[1]] = line
+                continue
+            if not line or current is None:
+                continue
+            series, _, value = line.rpartition(" ")
+            try:
+                current["series"][series] = current["series"].get(series, 0.0) + float(value)
+            except ValueError:
+                continue
+    lines = []
+    for entry in merged.values():
+        lines.append(entry["HELP"])
+        lines.append(entry["TYPE"])
+        lines.extend(f"{series} {_number(round(value, 6))}" for series, value in entry["series"].items())
+    return "\n".join(lines) + "\n"
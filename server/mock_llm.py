@@ -0,0 +1,182 @@
+"""
+로컬 mock Azure OpenAI 서버 (오프라인 벤치마크용)
+
+/openai/deployments/{deployment}/chat/completions 를 흉내 낸다.
+  - 응답 지연: 첫 토큰까지 latency 초 + 출력 토큰 / tokens_per_sec
+  - 스트리밍(stream=true) 이면 같은 속도로 SSE 조각 전송 (연결이 끊기면 생성 중단)
+  - rate_limit_ratio 비율로 429 + retry-after-ms 주입
+  - 이미지 없는 호출은 low_confidence_ratio 비율로 낮은 신뢰도 액션 (텍스트 전용 → 비전 전환 측정용)
+  - 프롬프트 종류에 따라 계획 배열 / 평가 결과 / 액션 JSON 을 돌려주고,
+    실제 모델처럼 JSON 뒤에 설명 문장(reason_tokens 분량)을 붙인다 (response_format 요청이면 JSON 만)
+  - usage 는 rate_limiter.estimate_prompt_tokens 와 이미지 detail 기준 추정치
+
+단독 실행:
+  python mock_llm.py --port 8090 --latency 0.4 --tps 60 --rate-limit 0.05
+  AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8090 AZURE_OPENAI_API_KEY=x uvicorn app:app
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from rate_limiter import estimate_prompt_tokens
+
+LOW_DETAIL_TOKENS = 85
+HIGH_DETAIL_TOKENS = 765
+_EID = re.compile(r"\b(e\d+)\b")
+
+
+class MockLLMConfig:
+    def __init__(self, latency: float = 0.3, tokens_per_sec: float = 80.0, rate_limit_ratio: float = 0.0,
+                 retry_after_ms: int = 500, reason_tokens: int = 40, seed: int = 0, low_confidence_ratio: float = 0.0):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after_ms = retry_after_ms
+        self.reason_tokens = reason_tokens
+        self.seed = seed
+        self.low_confidence_ratio = low_confidence_ratio
+
+
+class MockLLMStats:
+    def __init__(self):
+        self.requests = 0
+        self.completed = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.streamed_chunks = 0
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def _prompt_parts(messages: list) -> tuple[str, list[str]]:
+    texts, details = [], []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                texts.append(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                details.append((part.get("image_url") or {}).get("detail", "high"))
+    return "\n".join(texts), details
+
+
+def mock_reply(prompt: str) -> str:
+    """프롬프트 종류별 결정적인 JSON 응답"""
+    eids = _EID.findall(prompt)
+    target = eids[0] if eids else "body"
+    if "planner" in prompt:
+        return json.dumps([
+            {"step": 1, "action": "click", "selector": target, "reason": "목표와 관련된 링크"},
+            {"step": 2, "action": "waitUntil", "condition": "page_load", "timeout": 1000},
+        ], ensure_ascii=False)
+    if '"status":"completed"' in prompt:
+        return json.dumps({"status": "completed", "reason": "목표 화면 도달", "evidence": target}, ensure_ascii=False)
+    if "Convert the user's intent" in prompt:
+        return "검색창에 키워드 입력 후 검색 버튼 클릭"
+    return json.dumps({"action": "click", "selector": target, "confidence": 0.95, "reason": "가장 관련도 높은 요소"},
+                      ensure_ascii=False)
+
+
+def create_mock_app(config: MockLLMConfig | None = None) -> FastAPI:
+    config = config or MockLLMConfig()
+    stats = MockLLMStats()
+    rnd = random.Random(config.seed)
+    app = FastAPI()
+    app.state.config = config
+    app.state.stats = stats
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        body = await request.json()
+        stats.requests += 1
+        if config.rate_limit_ratio and rnd.random() < config.rate_limit_ratio:
+            stats.rate_limited += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after-ms": str(config.retry_after_ms), "x-ratelimit-remaining-requests": "0"},
+                content={"error": {"code": "429", "message": "Rate limit is exceeded (mock)"}},
+            )
+
+        prompt, details = _prompt_parts(body.get("messages", []))
+        prompt_tokens = estimate_prompt_tokens(prompt) + sum(
+            LOW_DETAIL_TOKENS if d == "low" else HIGH_DETAIL_TOKENS for d in details)
+        content = mock_reply(prompt)
+        if not details and config.low_confidence_ratio and rnd.random() < config.low_confidence_ratio:
+            content = content.replace('"confidence": 0.95', '"confidence": 0.4')
+        fmt = body.get("response_format") or {}
+        if (fmt.get("json_schema") or {}).get("name") == "mcp_plan":
+            # 구조화 출력 요청이면 루트 객체로 감싼 계획 ({"plan": [...]})
+            content = json.dumps({"plan": json.loads(content)}, ensure_ascii=False)
+        if config.reason_tokens and not fmt:
+            # 실제 모델처럼 JSON 뒤에 설명이 이어짐 (스트리밍 조기 종료 효과 측정용)
+            content += "\n\n이유: " + "화면의 요소를 확인했습니다 " * max(1, config.reason_tokens // 6)
+        completion_tokens = estimate_prompt_tokens(content)
+        stats.prompt_tokens += prompt_tokens
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.latency + completion_tokens / config.tokens_per_sec)
+            stats.completed += 1
+            stats.completion_tokens += completion_tokens
+            return {
+                "id": f"mock-{stats.requests}", "object": "chat.completion", "created": created, "model": deployment,
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+            }
+
+        async def events():
+            await asyncio.sleep(config.latency)
+            # 서버가 JSON 완성 시점에 연결을 끊으므로 생성 시작을 완료로 셈
+            stats.completed += 1
+            step = 8  # 조각당 문자 수
+            for i in range(0, len(content), step):
+                piece = content[i:i + step]
+                tokens = estimate_prompt_tokens(piece)
+                await asyncio.sleep(tokens / config.tokens_per_sec)
+                stats.completion_tokens += tokens
+                stats.streamed_chunks += 1
+                chunk = {"id": f"mock-{stats.requests}", "object": "chat.completion.chunk", "created": created,
+                         "model": deployment,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.as_dict()
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="로컬 mock Azure OpenAI 서버")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.3, help="첫 토큰까지 지연(초)")
+    parser.add_argument("--tps", type=float, default=80.0, help="출력 토큰/초")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="429 주입 비율 (0~1)")
+    parser.add_argument("--retry-after-ms", type=int, default=500)
+    parser.add_argument("--reason-tokens", type=int, default=40, help="JSON 뒤 설명 분량")
+    args = parser.parse_args()
+    config = MockLLMConfig(args.latency, args.tps, args.rate_limit, args.retry_after_ms, args.reason_tokens)
+    uvicorn.run(create_mock_app(config), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+모델 캐스케이드 (작은 배포 먼저, 필요할 때만 큰 배포)
+
+스키마가 있는 호출(계획/실행/청크/평가)은 단계(tier) 목록의 앞쪽 배포부터 호출하고,
+응답이 스키마 검증을 통과하고 confidence 가 기준 이상이면 그대로 채택한다.
+검증 실패 / 낮은 confidence / 호출 실패면 다음 단계 배포로 다시 호출, 마지막 단계 응답은 항상 채택.
+실행/평가/청크 응답은 모든 프롬프트가 confidence 를 요구하므로, 빠진 응답은 낮은 confidence 로 보고 올린다.
+계획은 confidence 를 묻지 않으므로 검증만 통과하면 채택한다.
+스키마 없는 자유 형식 호출은 판단 근거가 없으므로 마지막(가장 강한) 배포만 쓴다.
+
+환경 변수:
+  LLM_TEXT_TIERS            텍스트 호출 배포 목록, 쉼표 구분 (작은 것부터). 기본 = AZURE_OPENAI_DEPLOYMENT_NAME
+  LLM_VISION_TIERS          비전 호출 배포 목록. 기본 = AZURE_OPENAI_VISION_DEPLOYMENT_NAME
+  LLM_CASCADE_CONFIDENCE    하위 단계 응답 채택 최소 confidence (기본 0.75)
+추가 배포의 호출 예산은 같은 계열(텍스트/비전)의 AZURE_OPENAI_*RPM / *TPM 값을 따른다.
+"""
+import os
+import logging
+
+from llm_client import env_float, env_int
+from metrics import metrics
+from structured_output import parse_structured
+
+logger = logging.getLogger("uvicorn.error")
+
+# confidence 를 요구하는 응답 종류 (없으면 채택하지 않고 다음 단계로)
+CONFIDENCE_SCHEMAS = {"action", "evaluation", "chunk"}
+
+TIER_RESULTS = metrics.counter(
+    "mcp_llm_tier_total", "캐스케이드 단계별 결과 (result: accepted|escalated)", ("family", "deployment", "result"))
+
+
+def _tiers_from_env(name: str, default: str) -> list[str]:
+    tiers = [t.strip() for t in os.getenv(name, "").split(",") if t.strip()]
+    return list(dict.fromkeys(tiers)) or [default]
+
+
+class ModelCascade:
+    def __init__(self, text_tiers: list[str], vision_tiers: list[str], min_confidence: float = 0.75):
+        self.text_tiers = text_tiers
+        self.vision_tiers = vision_tiers
+        self.min_confidence = min_confidence
+        # (family, deployment) → [채택, 상위로 넘김]
+        self.counts: dict[tuple[str, str], list[int]] = {}
+
+    @classmethod
+    def from_env(cls) -> "ModelCascade":
+        text = _tiers_from_env("LLM_TEXT_TIERS", os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1-mini"))
+        vision = _tiers_from_env("LLM_VISION_TIERS", os.getenv("AZURE_OPENAI_VISION_DEPLOYMENT_NAME", "gpt-4.1-mini"))
+        return cls(text, vision, env_float("LLM_CASCADE_CONFIDENCE", 0.75))
+
+    def tiers(self, vision: bool, schema: str | None = None) -> list[str]:
+        tiers = self.vision_tiers if vision else self.text_tiers
+        return tiers if schema else tiers[-1:]
+
+    def configure_budgets(self, scheduler):
+        """rate_limiter 에 없는 단계 배포의 예산을 같은 계열 값으로 등록"""
+        for tiers, prefix in ((self.text_tiers, "AZURE_OPENAI"), (self.vision_tiers, "AZURE_OPENAI_VISION")):
+            for deployment in tiers:
+                if deployment not in scheduler.budgets:
+                    scheduler.configure(deployment, env_int(f"{prefix}_RPM", 120), env_int(f"{prefix}_TPM", 120_000))
+        if len(self.text_tiers) > 1 or len(self.vision_tiers) > 1:
+            logger.info(f"🪜 모델 캐스케이드: 텍스트 {self.text_tiers}, 비전 {self.vision_tiers} "
+                        f"(채택 confidence >= {self.min_confidence})")
+
+    def accept(self, schema: str, text: str | None) -> tuple[bool, str]:
+        """하위 단계 응답 채택 여부와 사유"""
+        if not text:
+            return False, "응답 없음"
+        parsed = parse_structured(text, schema, record=False)
+        if not parsed.ok:
+            return False, "스키마 불일치"
+        value = parsed.value
+        confidence = value.get("confidence") if isinstance(value, dict) else None
+        if not isinstance(confidence, (int, float)) or isinstance(confidence, bool):
+            if schema in CONFIDENCE_SCHEMAS:
+                return False, "confidence 없음"
+        elif confidence < self.min_confidence:
+            return False, f"confidence {confidence}"
+        return True, "ok"
+
+    def record(self, vision: bool, deployment: str, accepted: bool):
+        family = "vision" if vision else "text"
+        TIER_RESULTS.inc(family=family, deployment=deployment, result="accepted" if accepted else "escalated")
+        counts = self.counts.setdefault((family, deployment), [0, 0])
+        counts[0 if accepted else 1] += 1
+
+    def stats(self) -> list[dict]:
+        rows = []
+        for (family, deployment), (accepted, escalated) in self.counts.items():
+            total = accepted + escalated
+            rows.append({"family": family, "deployment": deployment, "accepted": accepted, "escalated": escalated,
+                         "hit_rate": round(accepted / total, 3) if total else 0.0})
+        return rows
+
+
+model_cascade = ModelCascade.from_env()
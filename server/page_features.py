@@ -0,0 +1,237 @@
+"""
+단일 패스 페이지 특징 추출
+
+로그인 감지 / 페이지 이해도 / 청크 누적 컨텍스트 / 청크 스케줄러가 각자 DOM 을 돌며
+text·class 를 매번 소문자로 바꾸고 키워드 목록을 이중 루프로 확인하던 것을
+요소당 한 번의 소문자 변환 + 미리 컴파일한 다중 키워드 정규식 한 번으로 모은다.
+
+  - 요소마다 특징 비트(mask): 로그인 성공/로그인 텍스트/메일 텍스트, 클래스(nav/menu/main/content/list/로그인),
+    비밀번호 필드, 조작 가능 태그, 랜드마크 태그
+  - 페이지 합계: 로그인 신호 수, 랜드마크 위치, 조작 가능 요소 수, 목표 키워드별 적중 요소 수
+  - 구간 요약(chunk_context): 청크 범위의 mask 만 훑어 update_accumulated_context 결과를 만듦
+"""
+import re
+import bisect
+from functools import lru_cache
+from collections import Counter
+
+from relevance import tokenize
+
+
+class KeywordMatcher:
+    """
+    여러 키워드 묶음을 정규식 하나로 찾는 매처 → 나타난 묶음들의 비트 OR.
+    매치 시작 위치마다 가장 긴 키워드를 잡고(다음 검색은 시작 위치 + 1 부터), 그 키워드에 포함된
+    짧은 키워드의 묶음도 함께 켜서 (메일함 ⊃ 메일, 이메일 ⊃ 메일) 겹치는 키워드까지 부분 문자열 검사와
+    같은 결과를 낸다. 키워드가 없는 구간은 정규식 엔진이 첫 글자 집합으로 건너뛴다.
+    """
+
+    def __init__(self, groups: dict[str, list[str]]):
+        self.bits = {name: 1 << i for i, name in enumerate(groups)}
+        masks: dict[str, int] = {}
+        for name, words in groups.items():
+            for word in words:
+                masks[word.lower()] = masks.get(word.lower(), 0) | self.bits[name]
+        self.masks = {word: 0 for word in masks}
+        for word in masks:
+            for other, mask in masks.items():
+                if other in word:
+                    self.masks[word] |= mask
+        pattern = "|".join(re.escape(w) for w in sorted(self.masks, key=len, reverse=True))
+        self._search = re.compile(pattern).search if self.masks else None
+
+    def match(self, text: str) -> int:
+        """소문자 text 에 나타난 묶음 비트"""
+        if not text or self._search is None:
+            return 0
+        mask = 0
+        m = self._search(text)
+        while m:
+            mask |= self.masks[m.group()]
+            m = self._search(text, m.start() + 1)
+        return mask
+
+    def names(self, mask: int) -> list[str]:
+        return [name for name, bit in self.bits.items() if mask & bit]
+
+
+# ============================
+# 키워드 묶음 (기존 휴리스틱과 같은 목록)
+# ============================
+TEXT_MATCHER = KeywordMatcher({
+    "login_success": ["메일함", "inbox", "받은편지함", "logout", "로그아웃", "내정보", "프로필"],
+    "login_text": ["로그인", "login", "sign in", "아이디", "비밀번호", "password", "이메일"],
+    "mail": ["메일", "mail", "inbox", "받은편지함"],
+})
+CLASS_MATCHER = KeywordMatcher({
+    "login": ["login", "signin", "auth", "credential"],
+    "nav": ["nav"],
+    "menu": ["menu"],
+    "main": ["main"],
+    "content": ["content"],
+    "list": ["list"],
+})
+
+# 랜드마크 위치는 청크 스케줄러의 영역 판단에도 쓰므로 article/form 까지 기록하고,
+# 누적 컨텍스트의 페이지 구조에는 기존 여섯 태그만 넣음
+LANDMARK_TAGS = {"nav", "header", "main", "section", "article", "aside", "footer", "form"}
+STRUCTURE_TAGS = {"nav", "header", "main", "section", "aside", "footer"}
+INTERACTIVE_TAGS = ("button", "input", "a", "select", "textarea")
+
+# 요소 특징 비트 - 텍스트 / 클래스 매처 비트를 자리만 옮겨 그대로 씀
+_TEXT_SHIFT = 0
+_CLASS_SHIFT = len(TEXT_MATCHER.bits)
+_OTHER_SHIFT = _CLASS_SHIFT + len(CLASS_MATCHER.bits)
+
+SUCCESS = TEXT_MATCHER.bits["login_success"] << _TEXT_SHIFT
+LOGIN_TEXT = TEXT_MATCHER.bits["login_text"] << _TEXT_SHIFT
+MAIL_TEXT = TEXT_MATCHER.bits["mail"] << _TEXT_SHIFT
+NAV_CLASS = CLASS_MATCHER.bits["nav"] << _CLASS_SHIFT
+MENU_CLASS = CLASS_MATCHER.bits["menu"] << _CLASS_SHIFT
+MAIN_CLASS = CLASS_MATCHER.bits["main"] << _CLASS_SHIFT
+CONTENT_CLASS = CLASS_MATCHER.bits["content"] << _CLASS_SHIFT
+LIST_CLASS = CLASS_MATCHER.bits["list"] << _CLASS_SHIFT
+LOGIN_ATTR = 1 << _OTHER_SHIFT        # class 또는 id 에 login/signin/auth/credential
+PASSWORD_FIELD = 1 << (_OTHER_SHIFT + 1)
+FORM_TAG = 1 << (_OTHER_SHIFT + 2)
+MAIN_TAG = 1 << (_OTHER_SHIFT + 3)
+NAV_TAG = 1 << (_OTHER_SHIFT + 4)     # 태그 이름에 nav 포함
+CLICKABLE = 1 << (_OTHER_SHIFT + 5)
+STRUCTURE_TAG = 1 << (_OTHER_SHIFT + 6)
+INTERACTIVE_BITS = {tag: 1 << (_OTHER_SHIFT + 7 + i) for i, tag in enumerate(INTERACTIVE_TAGS)}
+INTERACTIVE = 0
+for _bit in INTERACTIVE_BITS.values():
+    INTERACTIVE |= _bit
+# 페이지 합계로 세는 로그인 비트
+COUNTED_BITS = (SUCCESS, LOGIN_TEXT, PASSWORD_FIELD, LOGIN_ATTR)
+COUNTED = SUCCESS | LOGIN_TEXT | PASSWORD_FIELD | LOGIN_ATTR
+
+
+@lru_cache(maxsize=256)
+def goal_matcher(goal: str) -> KeywordMatcher:
+    """목표 문장의 검색어(relevance.tokenize, 두 글자 이상) 매처 - 같은 목표는 단계마다 재사용"""
+    terms = list(dict.fromkeys(t for t in tokenize(goal or "") if len(t) >= 2))
+    return KeywordMatcher({t: [t] for t in terms})
+
+
+class PageFeatures:
+    """DOM 한 번 순회 결과 - 요소별 특징 비트와 페이지 합계"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.masks: list[int] = []
+        self.landmark_at: dict[int, str] = {}         # 위치 → 랜드마크 태그 (문서 순서)
+        self.counts: Counter = Counter()              # 비트별 요소 수
+        self.interactive = Counter()                  # 태그별 조작 가능 요소 수
+        self.goal_hits: Counter = Counter()           # 목표 키워드별 적중 요소 수
+
+    # ---- 로그인 ----
+    @property
+    def login_signals(self) -> dict:
+        return {
+            "success_signals": self.counts[SUCCESS],
+            "password_fields": self.counts[PASSWORD_FIELD],
+            "text_matches": self.counts[LOGIN_TEXT],
+            "login_elements": self.counts[LOGIN_ATTR],
+        }
+
+    @property
+    def is_login_page(self) -> bool:
+        """로그인 성공 신호가 없고 비밀번호 필드 + 로그인 텍스트 + 로그인 클래스/ID 가 모두 있을 때만"""
+        if self.counts[SUCCESS]:
+            return False
+        return self.counts[PASSWORD_FIELD] > 0 and self.counts[LOGIN_TEXT] >= 1 and self.counts[LOGIN_ATTR] >= 1
+
+    # ---- 구간 ----
+    def landmark_tags(self, start: int = 0, end: int | None = None) -> list[str]:
+        end = self.size if end is None else end
+        positions = list(self.landmark_at)
+        lo, hi = bisect.bisect_left(positions, start), bisect.bisect_left(positions, end)
+        return [self.landmark_at[pos] for pos in positions[lo:hi]]
+
+    def chunk_context(self, start: int, end: int) -> dict:
+        """[start, end) 구간의 구조 / 주요 영역 / 조작 요소 / 내비 / 메인 영역 (순차 청크 누적 컨텍스트용)"""
+        structure = {tag for tag in self.landmark_tags(start, end) if tag in STRUCTURE_TAGS}
+        key_areas, interactive = set(), set()
+        navigation_found, main_area = False, None
+        for mask in self.masks[start:end]:
+            if not mask & STRUCTURE_TAG:
+                if mask & NAV_CLASS:
+                    structure.add("navigation")
+                elif mask & MENU_CLASS:
+                    structure.add("menu")
+            if mask & MAIL_TEXT:
+                key_areas.add("메일 영역")
+            elif mask & (CONTENT_CLASS | MAIN_CLASS | LIST_CLASS):
+                key_areas.add("콘텐츠 영역")
+            elif mask & FORM_TAG:
+                key_areas.add("폼 영역")
+            if mask & INTERACTIVE:
+                interactive.update(tag for tag, bit in INTERACTIVE_BITS.items() if mask & bit)
+            if mask & (NAV_TAG | NAV_CLASS):
+                navigation_found = True
+            if main_area is None:
+                if mask & (MAIN_TAG | MAIN_CLASS):
+                    main_area = "main"
+                elif mask & CONTENT_CLASS:
+                    main_area = "content"
+        return {
+            "page_structure": structure,
+            "key_areas": key_areas,
+            "interactive_elements": interactive,
+            "navigation_found": navigation_found,
+            "main_content_area": main_area,
+        }
+
+    def summary(self, top_terms: int = 5) -> dict:
+        """page_analysis 메시지용 요약"""
+        return {
+            "interactive_elements": sum(self.interactive.values()),
+            "landmarks": dict(Counter(self.landmark_at.values())),
+            "goal_keyword_hits": dict(self.goal_hits.most_common(top_terms)),
+        }
+
+
+def extract_page_features(dom: list, goal: str | None = None) -> PageFeatures:
+    """요소당 소문자 변환 한 번 + 다중 키워드 정규식 한 번으로 모든 휴리스틱의 재료를 만든다"""
+    features = PageFeatures(len(dom))
+    goals = goal_matcher(goal) if goal else None
+    masks, counts = features.masks, features.counts
+    for pos, el in enumerate(dom):
+        text = str(el.get("text") or "").lower()
+        tag = str(el.get("tag") or "").lower()
+        mask = TEXT_MATCHER.match(text) << _TEXT_SHIFT
+        cls = el.get("class")
+        if cls:
+            class_mask = CLASS_MATCHER.match(str(cls).lower())
+            mask |= class_mask << _CLASS_SHIFT
+            if class_mask & CLASS_MATCHER.bits["login"]:
+                mask |= LOGIN_ATTR
+        eid = el.get("id")
+        if eid and not mask & LOGIN_ATTR and CLASS_MATCHER.match(str(eid).lower()) & CLASS_MATCHER.bits["login"]:
+            mask |= LOGIN_ATTR
+        if el.get("type") == "password":
+            mask |= PASSWORD_FIELD
+        if tag in INTERACTIVE_BITS:
+            mask |= INTERACTIVE_BITS[tag]
+            features.interactive[tag] += 1
+        if el.get("clickable"):
+            mask |= CLICKABLE
+        if tag in LANDMARK_TAGS:
+            features.landmark_at[pos] = tag
+            if tag in STRUCTURE_TAGS:
+                mask |= STRUCTURE_TAG
+        if tag == "main":
+            mask |= MAIN_TAG
+        elif tag == "form":
+            mask |= FORM_TAG
+        if "nav" in tag:
+            mask |= NAV_TAG
+        if goals is not None and text:
+            hits = goals.match(text)
+            if hits:
+                features.goal_hits.update(goals.names(hits))
+        if mask & COUNTED:
+            counts.update(bit for bit in COUNTED_BITS if mask & bit)
+        masks.append(mask)
+    return features
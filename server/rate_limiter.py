@@ -0,0 +1,325 @@
+"""
+배포(deployment)별 토큰 버킷 스케줄러
+
+전역 Semaphore(1) 대신 배포마다 분당 요청 수(RPM)와 분당 토큰 수(TPM) 예산을
+토큰 버킷으로 관리한다. 예산이 허용하는 만큼 동시에 호출을 통과시키고,
+응답 헤더(retry-after, x-ratelimit-remaining-*)로 버킷을 서버 상태에 맞춘다.
+
+환경 변수:
+  AZURE_OPENAI_RPM / AZURE_OPENAI_TPM                 텍스트 배포 예산
+  AZURE_OPENAI_VISION_RPM / AZURE_OPENAI_VISION_TPM   비전 배포 예산
+  LLM_MAX_CONCURRENCY                                 배포당 최대 동시 호출 수
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+
+from llm_client import env_int
+
+logger = logging.getLogger("uvicorn.error")
+
+DEFAULT_RPM = 120
+DEFAULT_TPM = 120_000
+DEFAULT_MAX_CONCURRENCY = 8
+
+# 이미지 1장당 대략적인 입력 토큰 (high detail 기준)
+IMAGE_TOKEN_ESTIMATE = 765
+
+
+def estimate_prompt_tokens(text: str, image_count: int = 0) -> int:
+    """로컬 토큰 추정 - ASCII 약 4자당 1토큰, 한글 등 비ASCII 1자당 1토큰"""
+    if not text:
+        return image_count * IMAGE_TOKEN_ESTIMATE
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - ascii_chars
+    return int(ascii_chars / 4 + other_chars) + 1 + image_count * IMAGE_TOKEN_ESTIMATE
+
+
+def parse_retry_after(headers) -> float | None:
+    """retry-after-ms / retry-after 헤더를 초 단위로 변환"""
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    sec = headers.get("retry-after")
+    if sec:
+        try:
+            return float(sec)
+        except ValueError:
+            return None  # HTTP-date 형식은 무시
+    return None
+
+
+class TokenBucket:
+    """초당 일정량이 채워지는 버킷 (capacity = 분당 예산)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount 만큼 꺼내려면 기다려야 하는 시간(초)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def clamp(self, remaining: float):
+        """서버가 알려준 잔여량이 더 적으면 그 값으로 맞춤"""
+        self._refill()
+        self.tokens = min(self.tokens, float(remaining))
+
+
+class DeploymentBudget:
+    """한 배포의 RPM/TPM 버킷 + 동시 호출 상한 + 429 차단 시간"""
+
+    def __init__(self, name: str, rpm: int, tpm: int, max_concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = asyncio.Semaphore(max_concurrency)
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+        self.in_flight = 0
+
+    async def acquire(self, est_tokens: int):
+        await self.concurrency.acquire()
+        try:
+            # 락 안에서 대기해 먼저 온 요청이 먼저 예산을 받도록 함 (FIFO)
+            async with self.lock:
+                while True:
+                    wait = max(
+                        self.blocked_until - time.monotonic(),
+                        self.requests.wait_time(1),
+                        self.tokens.wait_time(est_tokens),
+                    )
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                self.requests.take(1)
+                self.tokens.take(est_tokens)
+                self.in_flight += 1
+        except BaseException:
+            self.concurrency.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self.concurrency.release()
+
+    def observe_headers(self, headers):
+        if not headers:
+            return
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        try:
+            if remaining_requests is not None:
+                self.requests.clamp(float(remaining_requests))
+            if remaining_tokens is not None:
+                self.tokens.clamp(float(remaining_tokens))
+        except ValueError:
+            pass
+
+    def block_for(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class LLMSlot:
+    """`async with scheduler.slot(...)` 로 얻는 호출 슬롯"""
+
+    def __init__(self, budget: DeploymentBudget, est_tokens: int):
+        self.budget = budget
+        self.est_tokens = est_tokens
+
+    async def __aenter__(self):
+        await self.budget.acquire(self.est_tokens)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.budget.release()
+        return False
+
+    def record(self, headers=None, usage=None):
+        """응답 헤더와 실제 사용량으로 버킷 보정"""
+        self.budget.observe_headers(headers)
+        total = getattr(usage, "total_tokens", None) if usage is not None else None
+        if total is not None:
+            diff = self.est_tokens - total
+            if diff > 0:
+                self.budget.tokens.give_back(diff)
+            elif diff < 0:
+                self.budget.tokens.take(-diff)
+
+
+class LLMScheduler:
+    """배포 이름별 DeploymentBudget 레지스트리"""
+
+    def __init__(self):
+        self.budgets: dict[str, DeploymentBudget] = {}
+
+    def configure(self, deployment: str, rpm: int, tpm: int, max_concurrency: int | None = None):
+        self.budgets[deployment] = DeploymentBudget(
+            deployment, rpm, tpm, max_concurrency or env_int("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+        )
+        logger.info(f"🪣 LLM 예산 설정: {deployment} (RPM {rpm}, TPM {tpm})")
+
+    def configure_from_env(self):
+        text = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1-mini")
+        vision = os.getenv("AZURE_OPENAI_VISION_DEPLOYMENT_NAME", "gpt-4.1-mini")
+        self.configure(text, env_int("AZURE_OPENAI_RPM", DEFAULT_RPM), env_int("AZURE_OPENAI_TPM", DEFAULT_TPM))
+        if vision != text:
+            self.configure(
+                vision,
+                env_int("AZURE_OPENAI_VISION_RPM", DEFAULT_RPM),
+                env_int("AZURE_OPENAI_VISION_TPM", DEFAULT_TPM),
+            )
+
+    def budget(self, deployment: str) -> DeploymentBudget:
+        if deployment not in self.budgets:
+            self.configure(deployment, DEFAULT_RPM, DEFAULT_TPM)
+        return self.budgets[deployment]
+
+    def slot(self, deployment: str, est_tokens: int) -> LLMSlot:
+        return LLMSlot(self.budget(deployment), est_tokens)
+
+    def on_rate_limited(self, deployment: str, headers, attempt: int) -> float:
+        """429 수신 - 서버가 준 retry-after 우선, 없으면 지수 백오프. 대기 시간 반환"""
+        wait = parse_retry_after(headers)
+        if wait is None:
+            wait = min(20, 2 ** attempt) + random.uniform(0, 0.5)
+        budget = self.budget(deployment)
+        budget.block_for(wait)
+        budget.observe_headers(headers)
+        return wait
+
+
+# 프로세스 단위 공유 스케줄러
+llm_scheduler = LLMScheduler()
+
+
+# ============================
+# 워커 간 공유 예산 (멀티 워커 배포)
+# ============================
+class SharedSlot:
+    """`async with shared_limiter.slot(...)` - LLMSlot 과 같은 record() 인터페이스"""
+
+    def __init__(self, limiter: "SharedRateLimiter", deployment: str, est_tokens: int):
+        self.limiter = limiter
+        self.deployment = deployment
+        self.est_tokens = est_tokens
+        self.window = 0
+
+    async def __aenter__(self):
+        await self.limiter.concurrency(self.deployment).acquire()
+        try:
+            self.window = await self.limiter.acquire(self.deployment, self.est_tokens)
+        except BaseException:
+            self.limiter.concurrency(self.deployment).release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.limiter.concurrency(self.deployment).release()
+        return False
+
+    async def record(self, headers=None, usage=None):
+        """실제 사용량과 추정치 차이를 같은 창의 토큰 카운터에 반영"""
+        total = getattr(usage, "total_tokens", None) if usage is not None else None
+        if total is not None and total != self.est_tokens:
+            await self.limiter.backend.incr(
+                self.limiter.key(self.deployment, "tok", self.window), total - self.est_tokens, ttl=120)
+
+
+class SharedRateLimiter:
+    """
+    공유 백엔드의 분 단위 고정 창(fixed window) 카운터로 RPM/TPM 을 워커 전체에 적용.
+    incr 로 먼저 예약하고 한도를 넘으면 되돌린 뒤 다음 창까지 기다린다.
+    429 차단 시간도 백엔드에 기록해 모든 워커가 같이 쉰다.
+    토큰 버킷보다 창 경계에서 몰릴 수 있지만 연산이 incr 하나라 어느 백엔드에서나 원자적이다.
+    """
+
+    def __init__(self, backend, max_concurrency: int | None = None):
+        self.backend = backend
+        self.limits: dict[str, tuple[int, int]] = {}
+        self.max_concurrency = max_concurrency or env_int("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)
+        self._concurrency: dict[str, asyncio.Semaphore] = {}
+
+    def configure(self, deployment: str, rpm: int, tpm: int):
+        self.limits[deployment] = (rpm, tpm)
+        logger.info(f"🪣 공유 LLM 예산 설정: {deployment} (RPM {rpm}, TPM {tpm}, 백엔드 {self.backend.name})")
+
+    def configure_from_env(self):
+        text = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4.1-mini")
+        vision = os.getenv("AZURE_OPENAI_VISION_DEPLOYMENT_NAME", "gpt-4.1-mini")
+        self.configure(text, env_int("AZURE_OPENAI_RPM", DEFAULT_RPM), env_int("AZURE_OPENAI_TPM", DEFAULT_TPM))
+        if vision != text:
+            self.configure(vision, env_int("AZURE_OPENAI_VISION_RPM", DEFAULT_RPM),
+                           env_int("AZURE_OPENAI_VISION_TPM", DEFAULT_TPM))
+
+    def concurrency(self, deployment: str) -> asyncio.Semaphore:
+        # 동시 호출 상한은 워커 단위 (연결 풀 크기와 맞춤)
+        if deployment not in self._concurrency:
+            self._concurrency[deployment] = asyncio.Semaphore(self.max_concurrency)
+        return self._concurrency[deployment]
+
+    @staticmethod
+    def key(deployment: str, kind: str, window: int | None = None) -> str:
+        return f"rl:{deployment}:{kind}" if window is None else f"rl:{deployment}:{kind}:{window}"
+
+    async def acquire(self, deployment: str, est_tokens: int) -> int:
+        """예산 예약 - 예약한 창 번호 반환"""
+        rpm, tpm = self.limits.get(deployment, (DEFAULT_RPM, DEFAULT_TPM))
+        est_tokens = min(est_tokens, tpm)
+        while True:
+            blocked = await self.backend.get(self.key(deployment, "blocked"))
+            if blocked and float(blocked) > time.time():
+                await asyncio.sleep(float(blocked) - time.time())
+                continue
+            now = time.time()
+            window = int(now // 60)
+            req_key, tok_key = self.key(deployment, "req", window), self.key(deployment, "tok", window)
+            requests = await self.backend.incr(req_key, 1, ttl=120)
+            if requests <= rpm:
+                tokens = await self.backend.incr(tok_key, est_tokens, ttl=120)
+                if tokens <= tpm:
+                    return window
+                await self.backend.incr(tok_key, -est_tokens, ttl=120)
+            await self.backend.incr(req_key, -1, ttl=120)
+            # 다음 창 시작까지 대기 (워커들이 동시에 몰리지 않도록 약간 흩뜨림)
+            await asyncio.sleep((window + 1) * 60 - now + random.uniform(0, 0.5))
+
+    def slot(self, deployment: str, est_tokens: int) -> SharedSlot:
+        return SharedSlot(self, deployment, est_tokens)
+
+    async def on_rate_limited(self, deployment: str, headers, attempt: int) -> float:
+        wait = parse_retry_after(headers)
+        if wait is None:
+            wait = min(20, 2 ** attempt) + random.uniform(0, 0.5)
+        key = self.key(deployment, "blocked")
+        until = time.time() + wait
+        current = await self.backend.get(key)
+        if not current or float(current) < until:
+            await self.backend.set(key, repr(until), ttl=wait + 1)
+        return wait
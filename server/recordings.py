@@ -0,0 +1,122 @@
+"""
+/ws 세션 녹화 (리플레이 벤치마크용)
+
+SESSION_RECORD_DIR 를 지정하면 서버가 받은 init / DOM 메시지를 목표 단위 JSONL 로 남긴다.
+  - 목표 로그(logs/*.log)와 같은 이름의 .jsonl - 재연결돼도 같은 목표면 같은 파일
+  - DOM 델타는 서버가 복원한 전체 DOM 으로 저장 (리플레이 시 기준 버전과 무관하게 재생 가능)
+  - 스크린샷은 data URL 그대로 (바이너리 프로토콜로 받은 원본 바이트는 base64 로 변환)
+쓰기는 산출물 기록기(artifacts.py)를 거치므로 핸들러를 막지 않는다. 기본은 꺼짐.
+
+bench_replay.py 가 이 파일들(또는 debug_images/ 스크린샷, 합성 세션)을 불러와 재생한다.
+
+줄 형식: {"t": 목표 시작 후 초, "payload": {...}}
+"""
+import os
+import re
+import json
+import time
+import base64
+from collections import defaultdict
+
+from artifacts import artifact_writer
+
+class SessionRecorder:
+    def __init__(self, directory: str | None = None):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self._started: dict[str, float] = {}
+        self.recorded = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionRecorder":
+        return cls(os.getenv("SESSION_RECORD_DIR") or None)
+
+    def _path(self, session) -> str:
+        log_path = session.goal_logger.log_file_path
+        name = os.path.splitext(os.path.basename(log_path))[0] if log_path else f"session-{session.id}"
+        return os.path.join(self.directory, f"{name}.jsonl")
+
+    def record(self, session, payload: dict, dom: list | None = None):
+        """수신 메시지 한 줄 기록 - dom 을 주면 델타 대신 복원된 전체 DOM 저장"""
+        if not self.enabled:
+            return
+        entry = {k: v for k, v in payload.items() if k not in ("dom_delta", "domVersion")}
+        if dom is not None:
+            entry["dom"] = dom
+        image = entry.get("image")
+        if isinstance(image, (bytes, bytearray)):
+            entry["image"] = "data:image/png;base64," + base64.b64encode(image).decode("ascii")
+        path = self._path(session)
+        if len(self._started) > 1000:
+            self._started.clear()
+        started = self._started.setdefault(path, time.time())
+        os.makedirs(self.directory, exist_ok=True)
+        line = json.dumps({"t": round(time.time() - started, 3), "payload": entry}, ensure_ascii=False)
+        if artifact_writer.write_line(path, line):
+            self.recorded += 1
+
+
+session_recorder = SessionRecorder.from_env()
+
+
+# ============================
+# 리플레이용 로더
+# ============================
+def load_recording(path: str) -> list[dict]:
+    """녹화 JSONL → payload 목록 (init 이 없으면 첫 DOM 메시지의 목표로 init 추가)"""
+    messages = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                messages.append(json.loads(line)["payload"])
+            except (ValueError, KeyError):
+                continue
+    if messages and messages[0].get("type") != "init":
+        goal = (messages[0].get("context") or {}).get("goal") or messages[0].get("message", "")
+        messages.insert(0, {"type": "init", "message": goal})
+    return messages
+
+
+_DEBUG_IMAGE = re.compile(r"^step_(\d+)_?(.*)_(\d{8}_\d{6})\.(png|webp|jpe?g)$")
+
+
+def recordings_from_debug_images(directory: str, dom_factory) -> list[list[dict]]:
+    """debug_images/ 의 단계별 스크린샷을 목표별 세션으로 묶어 재생 가능한 메시지 목록으로 변환
+
+    스크린샷에는 DOM 이 없으므로 dom_factory(step) 가 만든 DOM 을 함께 보낸다.
+    같은 목표의 step_0 이 새로 나오면 새 세션으로 본다. 마지막 단계는 평가 메시지.
+    """
+    by_goal: dict[str, list] = defaultdict(list)
+    for name in sorted(os.listdir(directory)):
+        m = _DEBUG_IMAGE.match(name)
+        if m:
+            by_goal[m.group(2)].append((m.group(3), int(m.group(1)), os.path.join(directory, name)))
+
+    sessions = []
+    for goal_key, shots in by_goal.items():
+        goal = goal_key.replace("_", " ").strip() or "기록된 목표"
+        runs: list[list] = []
+        for _, step, path in sorted(shots):
+            if step == 0 or not runs:
+                runs.append([])
+            runs[-1].append((step, path))
+        for run in runs:
+            messages = [{"type": "init", "message": goal}]
+            plan = [{"step": i + 1} for i in range(max(len(run) - 1, 1))]
+            for i, (step, path) in enumerate(run):
+                with open(path, "rb") as f:
+                    image = "data:image/png;base64," + base64.b64encode(f.read()).decode("ascii")
+                last = i == len(run) - 1 and len(run) > 1
+                messages.append({
+                    "type": "dom_with_image_evaluation" if last else "dom_with_image",
+                    "message": goal,
+                    "dom": dom_factory(step),
+                    "image": image,
+                    "context": {"goal": goal, "step": step, "plan": plan if step else []},
+                    "evaluationMode": last,
+                })
+            sessions.append(messages)
+    return sessions
@@ -0,0 +1,163 @@
+"""
+로컬 Redis 대역 서버 (RESP2, 개발/부하 테스트용)
+
+shared_state.RedisBackend 가 쓰는 명령만 구현한다:
+  PING, AUTH, SELECT, GET, SET (EX/PX), MGET, DEL, INCRBY, INCRBYFLOAT, EXPIRE, PEXPIRE, KEYS, SCAN, FLUSHALL
+단일 이벤트 루프에서 명령을 하나씩 처리하므로 INCRBYFLOAT 등은 원자적이다. 영속화 없음.
+
+단독 실행:
+  python redis_standin.py --port 6390
+  SHARED_BACKEND=redis://127.0.0.1:6390/0 python app_stateless.py --workers 4
+"""
+import time
+import fnmatch
+import asyncio
+import argparse
+
+
+class RedisStandin:
+    def __init__(self):
+        self.data: dict[str, tuple[str, float | None]] = {}
+        self.commands = 0
+
+    def _get(self, key: str) -> str | None:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            del self.data[key]
+            return None
+        return value
+
+    def _expires(self, key: str) -> float | None:
+        return self.data[key][1] if self._get(key) is not None else None
+
+    def execute(self, args: list[str]):
+        """명령 하나 실행 → 응답 값 (str=bulk, int, list, None, Exception=에러, ("OK",)=상태)"""
+        self.commands += 1
+        cmd, rest = args[0].upper(), args[1:]
+        if cmd == "PING":
+            return ("PONG",)
+        if cmd in ("AUTH", "SELECT"):
+            return ("OK",)
+        if cmd == "GET":
+            return self._get(rest[0])
+        if cmd == "MGET":
+            return [self._get(k) for k in rest]
+        if cmd == "SET":
+            key, value, ttl = rest[0], rest[1], None
+            opts = [o.upper() for o in rest[2:]]
+            if "EX" in opts:
+                ttl = float(rest[2 + opts.index("EX") + 1])
+            elif "PX" in opts:
+                ttl = float(rest[2 + opts.index("PX") + 1]) / 1000
+            self.data[key] = (value, time.time() + ttl if ttl else None)
+            return ("OK",)
+        if cmd == "DEL":
+            return sum(1 for k in rest if self.data.pop(k, None) is not None)
+        if cmd in ("INCRBY", "INCRBYFLOAT"):
+            key = rest[0]
+            current = self._get(key)
+            try:
+                value = (float(current) if current is not None else 0.0) + float(rest[1])
+            except ValueError:
+                return ValueError("ERR value is not a valid float")
+            if cmd == "INCRBY":
+                self.data[key] = (str(int(value)), self._expires(key))
+                return int(value)
+            text = repr(value).rstrip("0").rstrip(".") if "." in repr(value) else repr(value)
+            self.data[key] = (text, self._expires(key))
+            return text
+        if cmd in ("EXPIRE", "PEXPIRE"):
+            key = rest[0]
+            if self._get(key) is None:
+                return 0
+            seconds = float(rest[1]) / (1000 if cmd == "PEXPIRE" else 1)
+            self.data[key] = (self.data[key][0], time.time() + seconds)
+            return 1
+        if cmd == "KEYS":
+            return [k for k in list(self.data) if fnmatch.fnmatchcase(k, rest[0]) and self._get(k) is not None]
+        if cmd == "SCAN":
+            # 커서 = 키 목록 위치 (대역 서버라 순회 중 변경에 대한 보장은 느슨함)
+            start = int(rest[0])
+            opts = [o.upper() for o in rest[1:]]
+            pattern = rest[1 + opts.index("MATCH") + 1] if "MATCH" in opts else "*"
+            count = int(rest[1 + opts.index("COUNT") + 1]) if "COUNT" in opts else 10
+            keys = list(self.data)
+            batch = keys[start:start + count]
+            cursor = start + count if start + count < len(keys) else 0
+            return [str(cursor), [k for k in batch if fnmatch.fnmatchcase(k, pattern) and self._get(k) is not None]]
+        if cmd == "FLUSHALL":
+            self.data.clear()
+            return ("OK",)
+        return ValueError(f"ERR unknown command '{args[0]}'")
+
+
+def encode(value) -> bytes:
+    if isinstance(value, tuple):
+        return b"+%s\r\n" % value[0].encode()
+    if isinstance(value, Exception):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode(v) for v in value)
+    data = str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[str] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.decode().split()  # 인라인 명령 (redis-cli / telnet)
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(size + 2))[:-2].decode())
+    return args
+
+
+async def serve(host: str = "127.0.0.1", port: int = 6390, store: RedisStandin | None = None) -> asyncio.AbstractServer:
+    store = store or RedisStandin()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                args = await read_command(reader)
+                if not args:
+                    break
+                writer.write(encode(store.execute(args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 Redis 대역 서버 (RESP2)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    async def run():
+        server = await serve(args.host, args.port)
+        print(f"🧱 redis stand-in: redis://{args.host}:{args.port}/0")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+DOM 요소 사전 랭킹 (LLM 호출 전)
+
+목표와 현재 계획 단계를 질의로 삼아 각 요소를 BM25 로 점수화하고,
+상위 K개 + 구조 랜드마크만 프롬프트에 남긴다. 대부분의 페이지가
+청킹 없이 단일 호출로 처리되도록 하는 것이 목적.
+
+색인 필드: text, id, name, class, href, data-testid, aria-label, placeholder
+추가 가중치: 인터랙티브 태그, extension summarizeDom() 의 score, 계획 selector 일치
+"""
+import math
+import os
+import re
+import logging
+from collections import Counter
+
+logger = logging.getLogger("uvicorn.error")
+
+# 필드별 가중치 (term frequency 에 곱해짐)
+FIELD_WEIGHTS = {
+    "text": 1.0,
+    "aria-label": 1.2,
+    "placeholder": 1.2,
+    "id": 1.5,
+    "name": 1.5,
+    "data-testid": 1.5,
+    "class": 0.5,
+    "href": 0.7,
+    "type": 0.8,
+}
+
+# 태그별 가중치 - 조작 가능한 요소 우대
+TAG_WEIGHTS = {
+    "button": 1.6, "a": 1.4, "input": 1.6, "select": 1.5, "textarea": 1.5,
+    "label": 1.1, "h1": 1.2, "h2": 1.1, "h3": 1.05, "li": 0.9, "p": 0.8,
+}
+
+# 랭킹과 무관하게 항상 포함되는 구조 요소
+LANDMARK_TAGS = {"header", "nav", "main", "footer", "form", "h1"}
+MAX_LANDMARKS = 30
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+DEFAULT_TOP_K = int(os.getenv("DOM_TOP_K", "150"))
+
+_WORD_RE = re.compile(r"[0-9a-zA-Z]+|[가-힣]+")
+_HANGUL_RE = re.compile(r"[가-힣]")
+
+
+def tokenize(text: str) -> list[str]:
+    """영문/숫자 단어 + 한글은 단어와 음절 bigram (조사/복합어 대응: 메일함 ↔ 메일)"""
+    if not text:
+        return []
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        tokens.append(word)
+        if _HANGUL_RE.match(word) and len(word) > 2:
+            tokens.extend(word[i:i+2] for i in range(len(word) - 1))
+    return tokens
+
+
+def element_terms(el: dict) -> Counter:
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        value = el.get(field)
+        if not value:
+            continue
+        for tok in tokenize(str(value)):
+            terms[tok] += weight
+    return terms
+
+
+def plan_step_query(plan_step: dict | None) -> str:
+    if not plan_step:
+        return ""
+    return " ".join(str(plan_step.get(k, "")) for k in ("text", "value", "selector", "reason", "target"))
+
+
+class RelevanceIndex:
+    """요소 리스트에 대한 BM25 역색인"""
+
+    def __init__(self, elements: list):
+        self.elements = elements
+        self.doc_terms = [element_terms(el) for el in elements]
+        self.doc_len = [sum(t.values()) for t in self.doc_terms]
+        self.avgdl = (sum(self.doc_len) / len(self.doc_len)) if self.doc_len else 0.0
+        self.postings: dict[str, list[int]] = {}
+        for i, terms in enumerate(self.doc_terms):
+            for tok in terms:
+                self.postings.setdefault(tok, []).append(i)
+
+    def idf(self, tok: str) -> float:
+        n = len(self.elements)
+        df = len(self.postings.get(tok, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def bm25(self, query_tokens: list[str]) -> list[float]:
+        scores = [0.0] * len(self.elements)
+        if not self.avgdl:
+            return scores
+        for tok in set(query_tokens):
+            docs = self.postings.get(tok)
+            if not docs:
+                continue
+            idf = self.idf(tok)
+            for i in docs:
+                tf = self.doc_terms[i][tok]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[i] / self.avgdl)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+
+def score_elements(dom: list, goal: str, plan_step: dict | None = None, hints: list | None = None) -> list[float]:
+    """요소별 관련도 점수 (BM25 × 태그 가중치 + extension score + 계획 selector 보너스)"""
+    index = RelevanceIndex(dom)
+    query = tokenize(goal) + tokenize(plan_step_query(plan_step))
+    for hint in hints or []:
+        query += tokenize(hint)
+    lexical = index.bm25(query)
+
+    plan_selector = (plan_step or {}).get("selector")
+    scores = []
+    for el, lex in zip(dom, lexical):
+        tag = (el.get("tag") or "").lower()
+        score = lex * TAG_WEIGHTS.get(tag, 1.0)
+        # extension 이 계산한 의미/면적 점수 (대략 1~5) 는 동점 해소용으로 약하게 반영
+        try:
+            score += 0.1 * float(el.get("score") or 0)
+        except (TypeError, ValueError):
+            pass
+        if el.get("clickable") or tag in ("a", "button", "input", "select", "textarea"):
+            score += 0.05
+        if plan_selector and el.get("selector") == plan_selector:
+            score += 100.0
+        scores.append(score)
+    return scores
+
+
+def rank_dom(dom: list, goal: str, plan_step: dict | None = None, top_k: int | None = None,
+             hints: list | None = None) -> list:
+    """상위 K개 요소 + 구조 랜드마크를 문서 순서대로 반환"""
+    top_k = top_k or DEFAULT_TOP_K
+    if len(dom) <= top_k:
+        return dom
+
+    scores = score_elements(dom, goal, plan_step, hints)
+    ranked = sorted(range(len(dom)), key=lambda i: scores[i], reverse=True)
+    keep = set(ranked[:top_k])
+
+    landmarks = 0
+    for i, el in enumerate(dom):
+        if landmarks >= MAX_LANDMARKS:
+            break
+        if (el.get("tag") or "").lower() in LANDMARK_TAGS and i not in keep:
+            keep.add(i)
+            landmarks += 1
+
+    result = [dom[i] for i in sorted(keep)]
+    logger.info(f"🎯 DOM 사전 랭킹: {len(dom)}개 → {len(result)}개 (상위 {top_k} + 랜드마크 {landmarks})")
+    return result
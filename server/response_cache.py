@@ -0,0 +1,284 @@
+"""
+계획/액션 프롬프트 응답 캐시 (content-addressed)
+
+키 = 정규화된 (프롬프트 종류, 목표, DOM fingerprint, 이미지 perceptual hash, 배포, 부가정보) 의 해시.
+같은 목표를 같은 페이지에서 반복 실행하면 LLM 을 다시 부르지 않고 저장된 응답을 쓴다.
+
+계층:
+  1) 메모리 LRU (RESPONSE_CACHE_MAX_ENTRIES)
+  2) 디스크 (RESPONSE_CACHE_DIR 지정 시) - TTL + 전체 크기 상한(RESPONSE_CACHE_DISK_MAX_MB)
+     쓰기는 워커 스레드에서, 크기는 파일 목록을 들고 증분 계산 (디렉토리 전체 훑기는 DISK_SWEEP_INTERVAL 마다 한 번)
+
+RESPONSE_CACHE=0 이면 비활성화. 요청 단위로는 payload 의 "cache": false 로 우회.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from llm_client import env_int
+
+logger = logging.getLogger("uvicorn.error")
+
+_WS_RE = re.compile(r"\s+")
+
+# 디스크 캐시 만료 파일 정리 / 크기 재계산 주기(초)
+DISK_SWEEP_INTERVAL = 300.0
+
+
+def normalize_text(text: str | None) -> str:
+    return _WS_RE.sub(" ", (text or "").strip().lower())
+
+
+def dom_fingerprint(dom_summary: list, with_text: bool = True) -> str:
+    """요소 순서/태그/selector/앞부분 텍스트 기준 DOM 지문 (with_text=False 면 구조만)"""
+    h = hashlib.sha1()
+    for el in dom_summary:
+        text = normalize_text(el.get('text'))[:80] if with_text else ""
+        h.update(f"{el.get('tag', '')}\x1f{el.get('selector', '')}\x1f{text}\x1e".encode())
+    return h.hexdigest()
+
+
+def dom_state_fingerprint(dom_summary: list) -> str:
+    """요소 속성 전체(입력값, 전체 텍스트 포함) 기준 DOM 지문 - 화면의 작은 상태 변화까지 구분할 때"""
+    return hashlib.sha1(json.dumps(dom_summary, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+def image_fingerprint(image_data: str | bytes | None) -> str | None:
+    """스크린샷 바이트 지문 (data URL 접두어 제외) - 이미지 전처리 없이 캐시 키를 만드는 경로용"""
+    if not image_data:
+        return None
+    if isinstance(image_data, str):
+        image_data = image_data.split(",", 1)[1] if image_data.startswith("data:") else image_data
+        image_data = image_data.encode()
+    return hashlib.sha1(image_data).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512, ttl: float = 86400.0,
+                 disk_dir: str | None = None, disk_max_bytes: int = 100 * 1024 * 1024, enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # 디스크 파일 → 크기 (오래된 것부터), 첫 쓰기 때 디렉토리를 한 번 훑어 채움
+        self._disk_lock = threading.Lock()
+        self._disk_files: OrderedDict[str, int] | None = None
+        self._disk_bytes = 0
+        self._last_disk_sweep = 0.0
+        self._pending_writes: set[asyncio.Task] = set()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            max_entries=env_int("RESPONSE_CACHE_MAX_ENTRIES", 512),
+            ttl=env_int("RESPONSE_CACHE_TTL", 86400),
+            disk_dir=os.getenv("RESPONSE_CACHE_DIR") or None,
+            disk_max_bytes=env_int("RESPONSE_CACHE_DISK_MAX_MB", 100) * 1024 * 1024,
+            enabled=os.getenv("RESPONSE_CACHE", "1") != "0",
+        )
+
+    @staticmethod
+    def make_key(kind: str, goal: str, dom_fp: str, image_hash: str | None, deployment: str, extra=None) -> str:
+        parts = [kind, normalize_text(goal), dom_fp, image_hash or "", deployment,
+                 json.dumps(extra, ensure_ascii=False, sort_keys=True) if extra is not None else ""]
+        return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+    # ---------- 조회 ----------
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry:
+            created, value = entry
+            if now - created <= self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._memory[key]
+
+        value = self._disk_get(key, now)
+        if value is not None:
+            self.hits += 1
+            self.disk_hits += 1
+            self._memory_put(key, value, now)
+            return value
+
+        self.misses += 1
+        return None
+
+    # ---------- 저장 ----------
+    def put(self, key: str, value: str):
+        if not self.enabled:
+            return
+        now = time.time()
+        self._memory_put(key, value, now)
+        if self.disk_dir:
+            self._schedule_disk_put(key, value, now)
+
+    def _memory_put(self, key: str, value: str, created: float):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str, now: float) -> str | None:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - entry.get("created", 0) > self.ttl:
+            self._disk_remove(path)
+            with self._disk_lock:
+                if self._disk_files is not None and path in self._disk_files:
+                    self._disk_bytes -= self._disk_files.pop(path)
+            return None
+        return entry.get("value")
+
+    def _schedule_disk_put(self, key: str, value: str, created: float):
+        """이벤트 루프에서는 워커 스레드로 넘기고, 루프 밖(스크립트)에서는 바로 쓴다"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._disk_put(key, value, created)
+            return
+        task = loop.create_task(asyncio.to_thread(self._disk_put, key, value, created))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+
+    async def wait_writes(self):
+        """예약된 디스크 쓰기 마무리 (종료 시)"""
+        if self._pending_writes:
+            await asyncio.gather(*list(self._pending_writes), return_exceptions=True)
+
+    def _disk_put(self, key: str, value: str, created: float):
+        path = self._disk_path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"created": created, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.error(f"응답 캐시 디스크 저장 실패: {e}")
+            return
+        with self._disk_lock:
+            if self._disk_files is None or created - self._last_disk_sweep > DISK_SWEEP_INTERVAL:
+                self._disk_sweep(created)
+            else:
+                self._disk_bytes -= self._disk_files.pop(path, 0)
+                self._disk_files[path] = size
+                self._disk_bytes += size
+            while self._disk_bytes > self.disk_max_bytes and self._disk_files:
+                old, old_size = self._disk_files.popitem(last=False)
+                self._disk_bytes -= old_size
+                self._disk_remove(old)
+
+    def _disk_sweep(self, now: float):
+        """디렉토리를 훑어 만료 파일 삭제, 남은 파일 목록(오래된 것부터)과 전체 크기 다시 계산 (_disk_lock 안에서)"""
+        files = []
+        try:
+            names = os.listdir(self.disk_dir)
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if now - st.st_mtime > self.ttl:
+                self._disk_remove(path)
+                continue
+            files.append((st.st_mtime, path, st.st_size))
+        files.sort()
+        self._disk_files = OrderedDict((path, size) for _, path, size in files)
+        self._disk_bytes = sum(self._disk_files.values())
+        self._last_disk_sweep = now
+
+    def _disk_remove(self, path: str):
+        try:
+            os.remove(path)
+            self.evictions += 1
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._memory),
+            "evictions": self.evictions,
+        }
+
+
+class SharedResponseCache:
+    """
+    공유 백엔드(shared_state) 위의 응답 캐시 - 멀티 워커 배포에서 어느 워커가 받은 응답이든 같이 쓴다.
+    키는 ResponseCache.make_key 그대로, 만료는 백엔드 TTL 에 맡긴다 (LRU / 디스크 계층 없음).
+    """
+
+    def __init__(self, backend, ttl: float = 86400.0, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, backend) -> "SharedResponseCache":
+        return cls(backend, ttl=env_int("RESPONSE_CACHE_TTL", 86400), enabled=os.getenv("RESPONSE_CACHE", "1") != "0")
+
+    async def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        value = await self.backend.get("cache:" + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def put(self, key: str, value: str):
+        if self.enabled:
+            await self.backend.set("cache:" + key, value, ttl=self.ttl)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# 프로세스 단위 공유 캐시
+response_cache = ResponseCache.from_env()
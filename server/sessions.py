@@ -0,0 +1,312 @@
+"""
+/ws 연결별 세션
+
+연결마다 Session 하나: 목표별 로거, 마지막 DOM, 계획/단계, 로그인 스킵 플래그,
+직전 스크린샷 해시, 처리 시간 통계, 세션 단위 제한, 요청 디스패처(dispatcher.py).
+
+SessionManager 는 활성 세션 수를 관리하고
+  - 유휴 세션을 닫고 (SESSION_IDLE_TIMEOUT)
+  - 보관 중인 DOM 총량이 상한(SESSION_MEMORY_MB)을 넘으면 오래 쉰 세션의 DOM 부터 비운다
+    (비워진 세션은 다음 델타에서 dom_resync → 전체 DOM 재전송)
+  - 동시 세션 수 상한(SESSION_MAX_ACTIVE)을 넘는 연결은 받지 않는다
+
+extension 은 페이지 이동마다 WebSocket 을 다시 연결하므로 목표별 로그 파일은
+context.sessionId 기준으로 이어 쓴다 (bind_client).
+"""
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from fastapi import WebSocket
+
+from llm_client import env_int
+from artifacts import artifact_writer
+from dom_delta import DomState
+from metrics import GOALS, GoalStats
+
+logger = logging.getLogger("uvicorn.error")
+
+SWEEP_INTERVAL = 30.0
+MAX_CLIENT_LOG_LINKS = 2000
+
+
+# ============================
+# Goal-scoped logger
+# ============================
+class GoalLogger:
+    def __init__(self, session_id: str = ""):
+        self.session_id = session_id
+        self.current_goal = None
+        self.log_file_path = None
+        self.session_start_time = None
+        # 목표 단위 계측 합계 (metrics.py) - 목표가 끝나면 GOAL_SUMMARY 로 기록
+        self.stats = GoalStats()
+
+    def start_new_goal(self, goal: str):
+        if self.current_goal and not self.stats.finished:
+            self.finish_goal("abandoned")
+        self.stats = GoalStats()
+        self.current_goal = goal
+        self.session_start_time = datetime.now()
+        timestamp = self.session_start_time.strftime("%Y%m%d_%H%M%S")
+        safe_goal = re.sub(r'[^\w\s-]', '', goal)[:20]
+        safe_goal = re.sub(r'[-\s]+', '_', safe_goal)
+        # 동시 접속 시 같은 초에 같은 목표가 시작돼도 파일이 섞이지 않도록 세션 ID 포함
+        suffix = f"-{self.session_id}" if self.session_id else ""
+        filename = f"{timestamp}-{safe_goal}{suffix}.log"
+        self.log_file_path = os.path.join("logs", filename)
+        self.log("SERVER", "GOAL_START", f"새로운 목표 시작: {goal}")
+        logger.info(f"📝 목표별 로그 시작: {self.log_file_path}")
+
+    def resume(self, goal: str | None, log_file_path: str, stats: GoalStats):
+        """재연결된 extension 의 기존 목표 로그 / 계측 합계 이어쓰기"""
+        self.current_goal = goal
+        self.log_file_path = log_file_path
+        self.stats = stats
+
+    def finish_goal(self, outcome: str):
+        """목표 종료 - 목표 단위 합계를 한 번만 기록"""
+        if self.stats.finished:
+            return
+        self.stats.finished = True
+        GOALS.inc(outcome=outcome)
+        summary = self.stats.summary()
+        self.log("SERVER", "GOAL_SUMMARY", f"목표 종료 ({outcome})", summary)
+        logger.info(f"📈 목표 요약 ({outcome}): {summary}")
+
+    def log(self, source: str, event_type: str, message: str, extra_data: dict | None = None):
+        if not self.log_file_path:
+            return
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        entry = {
+            "timestamp": timestamp,
+            "source": source,
+            "event_type": event_type,
+            "message": message,
+            "extra_data": extra_data or {},
+        }
+        # 파일 쓰기는 백그라운드 기록기가 배치로 처리
+        artifact_writer.write_line(self.log_file_path, json.dumps(entry, ensure_ascii=False))
+
+    def log_server_event(self, event_type: str, message: str, extra_data: dict | None = None):
+        self.log("SERVER", event_type, message, extra_data)
+
+    def log_client_event(self, event_type: str, message: str, extra_data: dict | None = None):
+        self.log("CLIENT", event_type, message, extra_data)
+
+
+# ============================
+# Session
+# ============================
+class SessionLimitExceeded(Exception):
+    """세션 단위 제한(메시지 크기, 단계 수) 초과"""
+
+
+class Session:
+    def __init__(self, websocket: WebSocket, max_message_bytes: int, max_steps: int):
+        self.id = uuid.uuid4().hex[:8]
+        self.websocket = websocket
+        self.goal_logger = GoalLogger(self.id)
+        self.client_session_id: str | None = None
+        self.dom_state = DomState()
+        # 마지막 전체 DOM 메시지 크기 (메모리 상한 계산용 근사치)
+        self.dom_bytes = 0
+        self.goal: str | None = None
+        self.plan: list = []
+        self.step = 0
+        self.login_skip_detection = False
+        self.last_image_hash: str | None = None
+        self.last_image_dom_fp: str | None = None   # 그 스크린샷을 받을 때의 DOM 상태 지문 (중복 판단용)
+        # 텍스트 전용 단계에서 스크린샷을 요청한 (목표, 단계, 평가 여부) - 같은 단계 반복 요청 방지
+        self.vision_requested: tuple | None = None
+        # hello 협상 결과 (json | binary-v1)
+        self.protocol = "json"
+        self.max_message_bytes = max_message_bytes
+        self.max_steps = max_steps
+        # 무거운 요청 디스패처 (websocket_endpoint 에서 연결)
+        self.dispatcher = None
+        self.created = time.time()
+        self.last_active = self.created
+        self.messages = 0
+        # 이름 → [횟수, 총 ms, 최대 ms]
+        self.timings: dict[str, list] = {}
+
+    def touch(self, message_bytes: int = 0):
+        self.last_active = time.time()
+        self.messages += 1
+        if message_bytes > self.max_message_bytes:
+            raise SessionLimitExceeded(f"메시지 크기 제한 초과 ({message_bytes} > {self.max_message_bytes} bytes)")
+
+    def update_progress(self, goal: str, plan: list, step: int):
+        if step > self.max_steps:
+            raise SessionLimitExceeded(f"단계 수 제한 초과 ({step} > {self.max_steps})")
+        self.goal, self.plan, self.step = goal, plan, step
+
+    def drop_dom(self):
+        self.dom_state = DomState()
+        self.dom_bytes = 0
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            entry = self.timings.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+    def timing_summary(self) -> dict:
+        return {name: {"count": c, "avg_ms": round(total / c, 1), "max_ms": round(mx, 1)}
+                for name, (c, total, mx) in self.timings.items() if c}
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "goal": self.goal,
+            "step": self.step,
+            "protocol": self.protocol,
+            "messages": self.messages,
+            "idle_seconds": round(time.time() - self.last_active, 1),
+            "dom_elements": len(self.dom_state.keys),
+            "dom_bytes": self.dom_bytes,
+            "timings": self.timing_summary(),
+            "requests": self.dispatcher.stats() if self.dispatcher else None,
+        }
+
+
+class SessionManager:
+    def __init__(self, max_active: int = 1000, idle_timeout: float = 900.0, memory_budget: int = 512 * 1024 * 1024,
+                 max_message_bytes: int = 16 * 1024 * 1024, max_steps: int = 100, queue_size: int = 8):
+        self.max_active = max_active
+        self.idle_timeout = idle_timeout
+        self.memory_budget = memory_budget
+        self.max_message_bytes = max_message_bytes
+        self.max_steps = max_steps
+        self.queue_size = queue_size
+        self.sessions: dict[str, Session] = {}
+        # extension sessionId → 목표 로그 파일 (재연결 시 이어쓰기)
+        self._client_logs: OrderedDict[str, tuple[str | None, str, GoalStats]] = OrderedDict()
+        self._task: asyncio.Task | None = None
+        self.total_opened = 0
+        self.rejected = 0
+        self.evicted_idle = 0
+        self.dom_evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "SessionManager":
+        return cls(
+            max_active=env_int("SESSION_MAX_ACTIVE", 1000),
+            idle_timeout=env_int("SESSION_IDLE_TIMEOUT", 900),
+            memory_budget=env_int("SESSION_MEMORY_MB", 512) * 1024 * 1024,
+            max_message_bytes=env_int("SESSION_MAX_MESSAGE_MB", 16) * 1024 * 1024,
+            max_steps=env_int("SESSION_MAX_STEPS", 100),
+            queue_size=env_int("SESSION_QUEUE_SIZE", 8),
+        )
+
+    @property
+    def active_count(self) -> int:
+        return len(self.sessions)
+
+    # ---------- 수명 ----------
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def open(self, websocket: WebSocket) -> Session | None:
+        """새 세션 생성 (동시 세션 상한 초과 시 None)"""
+        if len(self.sessions) >= self.max_active:
+            self.rejected += 1
+            logger.error(f"🚫 동시 세션 상한({self.max_active}) 초과 - 연결 거절")
+            return None
+        session = Session(websocket, self.max_message_bytes, self.max_steps)
+        self.sessions[session.id] = session
+        self.total_opened += 1
+        logger.info(f"🧑‍💻 세션 시작 {session.id} (활성 {len(self.sessions)})")
+        return session
+
+    def close(self, session: Session):
+        if self.sessions.pop(session.id, None) is not None:
+            logger.info(f"🧑‍💻 세션 종료 {session.id} (활성 {len(self.sessions)}) {session.timing_summary()}")
+
+    # ---------- 재연결 시 목표 로그 이어쓰기 ----------
+    def bind_client(self, session: Session, client_session_id: str | None, goal: str | None):
+        if not client_session_id:
+            return
+        session.client_session_id = client_session_id
+        log = session.goal_logger
+        if log.log_file_path:
+            self._client_logs[client_session_id] = (log.current_goal, log.log_file_path, log.stats)
+            self._client_logs.move_to_end(client_session_id)
+            while len(self._client_logs) > MAX_CLIENT_LOG_LINKS:
+                self._client_logs.popitem(last=False)
+            return
+        linked = self._client_logs.get(client_session_id)
+        if linked and (goal is None or linked[0] == goal):
+            log.resume(*linked)
+
+    # ---------- DOM 메모리 상한 ----------
+    def note_dom(self, session: Session, message_bytes: int):
+        session.dom_bytes = message_bytes
+        total = sum(s.dom_bytes for s in self.sessions.values())
+        if total <= self.memory_budget:
+            return
+        for other in sorted(self.sessions.values(), key=lambda s: s.last_active):
+            if total <= self.memory_budget:
+                break
+            if other is session or not other.dom_bytes:
+                continue
+            total -= other.dom_bytes
+            other.drop_dom()
+            self.dom_evictions += 1
+            logger.info(f"🧹 세션 {other.id} DOM 비움 (메모리 상한 {self.memory_budget // (1024 * 1024)}MB)")
+
+    # ---------- 유휴 세션 정리 ----------
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            await self.evict_idle()
+
+    async def evict_idle(self):
+        now = time.time()
+        for session in [s for s in self.sessions.values() if now - s.last_active > self.idle_timeout]:
+            logger.info(f"💤 유휴 세션 종료 {session.id} ({now - session.last_active:.0f}s)")
+            self.evicted_idle += 1
+            self.close(session)
+            try:
+                await session.websocket.close(code=1001)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.sessions),
+            "max_active": self.max_active,
+            "total_opened": self.total_opened,
+            "rejected": self.rejected,
+            "evicted_idle": self.evicted_idle,
+            "dom_evictions": self.dom_evictions,
+            "dom_bytes": sum(s.dom_bytes for s in self.sessions.values()),
+            "memory_budget": self.memory_budget,
+        }
+
+
+session_manager = SessionManager.from_env()
@@ -0,0 +1,342 @@
+"""
+프로세스 간 공유 상태 백엔드 (멀티 워커 배포용)
+
+uvicorn 워커 N 개가 호출 예산(rate_limiter.SharedRateLimiter), 응답 캐시(response_cache.SharedResponseCache),
+메트릭(metrics.SharedMetrics)을 같이 쓰도록 아래의 작은 키-값 연산만 요구한다.
+  get / set(ttl)         문자열 값
+  incr(amount, ttl)      원자적 증가 후 새 값 반환 (카운터, 분 단위 예산 창)
+  delete                 키 삭제 (종료하는 워커의 메트릭 스냅샷)
+  scan(prefix)           접두사로 키-값 조회 (메트릭 출력)
+
+구현:
+  local    프로세스 내부 dict (워커 1개, 기본)
+  sqlite   한 호스트의 여러 워커 - WAL 모드 SQLite 파일 하나
+  redis    RESP 프로토콜 (Redis 또는 redis_standin.py) - 여러 호스트
+
+만료 정리: 분 단위 예산 창(rl:*)과 캐시(cache:*) 키는 계속 새로 생기므로
+  local    SHARED_PURGE_INTERVAL 마다 만료 키 정리 + TTL 키 수 상한(SHARED_LOCAL_MAX_KEYS, 오래 안 쓴 것부터)
+  sqlite   SHARED_PURGE_INTERVAL 마다 DELETE ... WHERE expires < now
+  redis    서버가 만료 처리, 조회는 KEYS 대신 SCAN (서버를 막지 않음)
+
+환경 변수:
+  SHARED_BACKEND          local | sqlite:///cache/shared.db | redis://127.0.0.1:6379/0
+  SHARED_PURGE_INTERVAL   만료 키 정리 주기(초) (기본 60)
+  SHARED_LOCAL_MAX_KEYS   local 백엔드의 TTL 키 수 상한 (기본 50000)
+"""
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from llm_client import env_int, env_float
+
+logger = logging.getLogger("uvicorn.error")
+
+PURGE_INTERVAL = env_float("SHARED_PURGE_INTERVAL", 60.0)
+SCAN_COUNT = 500
+
+
+class SharedBackend:
+    name = "base"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get(self, key: str) -> str | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: float | None = None):
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: float = 1.0, ttl: float | None = None) -> float:
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def scan(self, prefix: str) -> dict[str, str]:
+        raise NotImplementedError
+
+
+# ============================
+# local: 단일 프로세스
+# ============================
+class LocalBackend(SharedBackend):
+    name = "local"
+
+    def __init__(self, max_keys: int = 50000, purge_interval: float = PURGE_INTERVAL):
+        # 사용 순서 유지 (앞쪽이 가장 오래 안 쓴 키) - TTL 키 상한 초과 시 앞에서부터 제거
+        self._data: OrderedDict[str, tuple[str, float | None]] = OrderedDict()
+        self.max_keys = max_keys
+        self.purge_interval = purge_interval
+        self._ttl_keys = 0
+        self._last_purge = time.time()
+
+    def _live(self, key: str) -> str | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None and entry[1] is not None:
+            self._ttl_keys -= 1
+
+    def _put(self, key: str, value: str, expires: float | None):
+        self._remove(key)
+        self._data[key] = (value, expires)
+        if expires is not None:
+            self._ttl_keys += 1
+        self._maintain()
+
+    def _maintain(self):
+        """주기적으로 만료 키 정리, TTL 키가 상한을 넘으면 오래 안 쓴 TTL 키부터 상한의 90% 까지 제거
+        (한 번에 여유를 만들어 상한 근처에서 매번 훑지 않음, TTL 없는 메트릭 키는 유지)"""
+        now = time.time()
+        if now - self._last_purge >= self.purge_interval:
+            self._last_purge = now
+            for key in [k for k, (_, expires) in self._data.items() if expires is not None and expires < now]:
+                self._remove(key)
+        if self._ttl_keys > self.max_keys:
+            excess = self._ttl_keys - int(self.max_keys * 0.9)
+            victims = []
+            for key, (_, expires) in self._data.items():
+                if expires is not None:
+                    victims.append(key)
+                    if len(victims) >= excess:
+                        break
+            for key in victims:
+                self._remove(key)
+
+    async def get(self, key: str) -> str | None:
+        return self._live(key)
+
+    async def set(self, key: str, value: str, ttl: float | None = None):
+        self._put(key, value, time.time() + ttl if ttl else None)
+
+    async def incr(self, key: str, amount: float = 1.0, ttl: float | None = None) -> float:
+        current = self._live(key)
+        value = (float(current) if current is not None else 0.0) + amount
+        expires = self._data[key][1] if current is not None else (time.time() + ttl if ttl else None)
+        self._put(key, repr(value), expires)
+        return value
+
+    async def delete(self, key: str):
+        self._remove(key)
+
+    async def scan(self, prefix: str) -> dict[str, str]:
+        return {k: v for k in list(self._data) if k.startswith(prefix) and (v := self._live(k)) is not None}
+
+
+# ============================
+# sqlite: 한 호스트의 여러 프로세스
+# ============================
+class SQLiteBackend(SharedBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str, purge_interval: float = PURGE_INTERVAL):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._last_purge = time.time()
+
+    async def start(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires)")
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _run(self, sql: str, params: tuple):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def _execute(self, sql: str, params: tuple = ()):
+        if self._conn is None:
+            await self.start()
+        return await asyncio.to_thread(self._run, sql, params)
+
+    async def _maybe_purge(self):
+        """쓰기 경로에서 주기적으로 만료 행 삭제 (워커마다 돌아도 같은 행을 지울 뿐)"""
+        now = time.time()
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        await self._execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires < ?", (now,))
+
+    async def get(self, key: str) -> str | None:
+        rows = await self._execute("SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires >= ?)",
+                                   (key, time.time()))
+        return rows[0][0] if rows else None
+
+    async def set(self, key: str, value: str, ttl: float | None = None):
+        await self._execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                            (key, value, time.time() + ttl if ttl else None))
+        await self._maybe_purge()
+
+    async def incr(self, key: str, amount: float = 1.0, ttl: float | None = None) -> float:
+        # 한 문장 upsert 라 워커 사이에서도 원자적 (만료된 키는 새로 시작)
+        now = time.time()
+        rows = await self._execute(
+            "INSERT INTO kv (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "value = CASE WHEN expires IS NOT NULL AND expires < ? THEN excluded.value "
+            "             ELSE CAST(value AS REAL) + excluded.value END, "
+            "expires = CASE WHEN expires IS NOT NULL AND expires < ? THEN excluded.expires ELSE expires END "
+            "RETURNING value",
+            (key, amount, now + ttl if ttl else None, now, now),
+        )
+        await self._maybe_purge()
+        return float(rows[0][0])
+
+    async def delete(self, key: str):
+        await self._execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    async def scan(self, prefix: str) -> dict[str, str]:
+        rows = await self._execute(
+            "SELECT key, value FROM kv WHERE key >= ? AND key < ? AND (expires IS NULL OR expires >= ?)",
+            (prefix, prefix + "\uffff", time.time()))
+        return {k: str(v) for k, v in rows}
+
+
+# ============================
+# redis: RESP 프로토콜 (redis 패키지 없이)
+# ============================
+class RedisBackend(SharedBackend):
+    name = "redis"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0, password: str | None = None):
+        self.host, self.port, self.db, self.password = host, port, db, password
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "127.0.0.1", parsed.port or 6379, db, parsed.password)
+
+    async def start(self):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            if self.password:
+                await self._command_unlocked("AUTH", self.password)
+            if self.db:
+                await self._command_unlocked("SELECT", self.db)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = self._reader = None
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("redis 연결 종료")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RuntimeError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            size = int(body)
+            if size < 0:
+                return None
+            data = await self._reader.readexactly(size + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [await self._read_reply() for _ in range(count)]
+        raise RuntimeError(f"알 수 없는 RESP 응답: {line!r}")
+
+    async def _command_unlocked(self, *args):
+        parts = [str(a).encode() for a in args]
+        self._writer.write(b"*%d\r\n" % len(parts) + b"".join(b"$%d\r\n%s\r\n" % (len(p), p) for p in parts))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def command(self, *args):
+        # 연결 하나를 요청-응답 순서대로 사용 (파이프라이닝 없음)
+        async with self._lock:
+            if self._writer is None:
+                await self.start()
+            try:
+                return await self._command_unlocked(*args)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                await self.start()
+                return await self._command_unlocked(*args)
+
+    async def get(self, key: str) -> str | None:
+        return await self.command("GET", key)
+
+    async def set(self, key: str, value: str, ttl: float | None = None):
+        if ttl:
+            await self.command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            await self.command("SET", key, value)
+
+    async def incr(self, key: str, amount: float = 1.0, ttl: float | None = None) -> float:
+        value = float(await self.command("INCRBYFLOAT", key, amount))
+        if ttl and value == amount:
+            # 처음 만든 키에만 만료 설정 (창 키는 창마다 이름이 다름)
+            await self.command("PEXPIRE", key, int(ttl * 1000))
+        return value
+
+    async def delete(self, key: str):
+        await self.command("DEL", key)
+
+    async def scan(self, prefix: str) -> dict[str, str]:
+        # KEYS 는 키 전체를 한 번에 훑어 서버를 막으므로 SCAN 커서로 나눠 조회
+        result, cursor = {}, "0"
+        while True:
+            cursor, keys = await self.command("SCAN", cursor, "MATCH", prefix + "*", "COUNT", SCAN_COUNT)
+            keys = [k for k in dict.fromkeys(keys or []) if k not in result]
+            if keys:
+                values = await self.command("MGET", *keys)
+                result.update({k: v for k, v in zip(keys, values) if v is not None})
+            if str(cursor) == "0":
+                return result
+
+
+def backend_from_url(url: str | None) -> SharedBackend:
+    if not url or url == "local":
+        return LocalBackend(env_int("SHARED_LOCAL_MAX_KEYS", 50000))
+    if url.startswith("sqlite://"):
+        return SQLiteBackend(url[len("sqlite:///"):] if url.startswith("sqlite:///") else url[len("sqlite://"):])
+    if url.startswith("redis://"):
+        return RedisBackend.from_url(url)
+    raise ValueError(f"지원하지 않는 SHARED_BACKEND: {url}")
+
+
+def backend_from_env() -> SharedBackend:
+    backend = backend_from_url(os.getenv("SHARED_BACKEND"))
+    logger.info(f"🔗 공유 상태 백엔드: {backend.name}")
+    return backend
+
+
+shared_backend = backend_from_env()
@@ -0,0 +1,372 @@
+"""
+사이트 디렉토리 - 목표 문장에서 사이트 이름을 찾아 URL 로 바로 이동 (LLM / 구글 검색 생략)
+
+데이터 파일(TSV, 수만 건 가능)을 읽어 한 번 색인하고 조회는 색인만 본다.
+  - 정확 일치: 목표의 연속 단어 1~3개를 정규화(NFKC, 소문자, 공백/기호 제거)해 별칭 사전에서 찾음.
+    마지막 단어 끝의 조사(로/에서/을 ...)는 떼고도 찾음 - "네이버로 이동" → 네이버
+  - 유사 일치: 한글을 자모로 풀어(네이벌 → ㄴㅔㅇㅣㅂㅓㄹ) 자모 3-gram 색인으로 후보를 모으고
+    자모 편집 거리로 점수화 - 글자 하나의 모음/받침 오타(네이벌 → 네이버, 국세쳥 → 국세청)에 강함
+  - 부분 일치: 목표 단어가 긴 이름의 대부분이면(교통정보 → 국가교통정보센터) 덮는 비율만큼 점수
+  - 순위: (점수, 별칭 길이, 가중치) - 더 구체적인 이름(네이버 지도 > 네이버, 국세청 홈택스 > 국세청)과 인기 사이트 우선
+  - 핫 리로드: SITE_DIRECTORY_RELOAD 초마다 파일 수정 시각을 보고, 바뀌었으면 백그라운드 스레드에서
+    새 색인을 만든 뒤 통째로 교체 (교체 전까지 이전 색인으로 응답)
+
+데이터 형식 (# 주석, 탭 구분):
+  이름<TAB>별칭1,별칭2<TAB>URL<TAB>가중치(선택)
+  URL 호스트가 www.<이름>.<도메인> 형태면 그 이름(4자 이상)도 별칭으로 자동 추가
+
+환경 변수:
+  SITE_DIRECTORY_PATH     데이터 파일 (쉼표로 여러 개, 기본 data/sites.tsv)
+  SITE_MATCH_THRESHOLD    URL 로 바로 이동할 최소 점수 (기본 0.8)
+  SITE_DIRECTORY_RELOAD   파일 변경 확인 주기(초, 기본 10, 0 이면 리로드 안 함)
+"""
+import os
+import re
+import time
+import logging
+import threading
+import unicodedata
+from collections import Counter
+from urllib.parse import urlsplit
+
+from llm_client import env_float
+from metrics import metrics
+
+logger = logging.getLogger("uvicorn.error")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "sites.tsv")
+
+MAX_SPAN_WORDS = 3
+EXACT_SCORE = 1.0          # 조사를 떼고 일치해도 같은 점수 - 순위는 별칭 길이로
+FUZZY_WEIGHT = 0.95        # 유사 일치 점수 = 자모 유사도 × 이 값 (정확 일치보다 항상 낮게)
+MIN_FUZZY_JAMO = 5         # 이보다 짧은 구간은 유사 일치 안 함 (두 글자 단어 오탐 방지)
+MIN_FUZZY_SIMILARITY = 0.5  # 순위 목록(/sites)에 넣는 최저 자모 유사도
+MAX_FUZZY_CANDIDATES = 20  # 편집 거리를 계산할 후보 수 (드문 gram 공유 수 상위)
+STOP_GRAM_RATIO = 0.05     # 별칭의 5% 이상에 나오는 3-gram 은 후보 수집에서 제외
+
+# 단어 끝에서 떼어 보는 조사/어미 (긴 것부터)
+PARTICLES = sorted({
+    "으로", "로", "에서", "에", "을", "를", "이", "가", "은", "는", "의", "도", "와", "과", "랑", "이랑",
+    "에서는", "으로는", "로는", "까지", "부터", "에도", "이나", "나",
+}, key=len, reverse=True)
+# 사이트 이름 뒤에 붙어도 "그 사이트로 가라"는 뜻이 바뀌지 않는 단어 (검색어 전체 일치 판단용)
+FILLER_WORDS = {"홈페이지", "사이트", "웹사이트", "공식", "공식홈페이지", "공식사이트", "바로가기", "홈", "메인", "접속", "이동"}
+
+_WORD_SPLIT_RE = re.compile(r"\s+")
+_KEEP_RE = re.compile(r"[^0-9a-z가-힣ㄱ-ㅎㅏ-ㅣ]+")
+_DOMAIN_RE = re.compile(r"^(?:https?://)?(?:www\.)?([a-z0-9-]+)\.[a-z.]{2,}")
+_HOST_SUFFIXES = (".co.kr", ".go.kr", ".or.kr", ".ac.kr", ".ne.kr", ".re.kr", ".com", ".net", ".org",
+                  ".kr", ".io", ".im", ".wiki", ".tv", ".me")
+
+LOOKUPS = metrics.counter("mcp_site_lookup_total", "사이트 디렉토리 조회 결과 (result: exact|fuzzy|miss)", ("result",))
+
+
+# ============================
+# 정규화 / 자모 분해
+# ============================
+def normalize(text: str) -> str:
+    return _KEEP_RE.sub("", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def to_jamo(text: str) -> str:
+    """완성형 한글을 초성/중성/종성 코드로 분해 (그 밖의 글자는 그대로)"""
+    out = []
+    for ch in text:
+        code = ord(ch) - 0xAC00
+        if 0 <= code < 11172:
+            out.append(chr(0x1100 + code // 588))
+            out.append(chr(0x1161 + (code % 588) // 28))
+            if code % 28:
+                out.append(chr(0x11A7 + code % 28))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def jamo_grams(jamo: str) -> set[str]:
+    padded = f"^{jamo}$"
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int | None = None) -> int:
+    """편집 거리 - limit 을 넘으면 limit + 1 (대각선 띠만 계산하고 행 최솟값이 넘으면 중단)"""
+    limit = max(len(a), len(b)) if limit is None else limit
+    over = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return over
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        ca = a[i-1]
+        for j in range(lo, hi + 1):
+            current[j] = min(previous[j] + 1, current[j-1] + 1, previous[j-1] + (ca != b[j-1]), over)
+        if min(current[lo-1:hi+1]) > limit:
+            return over
+        previous = current
+    return previous[-1]
+
+
+def strip_particle(word: str) -> str | None:
+    """끝의 조사를 뗀 단어 (두 글자 이상 남을 때만)"""
+    for particle in PARTICLES:
+        if word.endswith(particle) and len(word) - len(particle) >= 2:
+            return word[:-len(particle)]
+    return None
+
+
+def query_words(query: str) -> list[str]:
+    """목표 문장 → 정규화된 단어들 (naver.com 같은 도메인은 이름만)"""
+    words = []
+    for raw in _WORD_SPLIT_RE.split((query or "").strip().lower()):
+        domain = _DOMAIN_RE.match(raw)
+        word = normalize(domain.group(1) if domain else raw)
+        if word:
+            words.append(word)
+    return words
+
+
+def host_alias(url: str) -> str | None:
+    """https://www.coupang.com → coupang (서브도메인이 www 뿐일 때만)"""
+    host = (urlsplit(url).hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    for suffix in _HOST_SUFFIXES:
+        if host.endswith(suffix):
+            host = host[:-len(suffix)]
+            break
+    return host if len(host) >= 4 and "." not in host else None
+
+
+# ============================
+# 색인
+# ============================
+class SiteMatch:
+    __slots__ = ("name", "url", "alias", "score", "kind", "weight", "span")
+
+    def __init__(self, name: str, url: str, alias: str, score: float, kind: str, weight: float, span: tuple[int, int]):
+        self.name, self.url, self.alias, self.score = name, url, alias, score
+        self.kind, self.weight, self.span = kind, weight, span
+
+    def rank_key(self) -> tuple:
+        return (round(self.score, 4), len(self.alias), self.weight)
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "url": self.url, "alias": self.alias, "score": round(self.score, 3), "kind": self.kind}
+
+
+class SiteIndex:
+    """(이름, 별칭, URL) 목록의 정확 일치 사전 + 자모 3-gram 역색인"""
+
+    def __init__(self, entries: list[tuple[str, list[str], str, float]]):
+        self.entries = entries
+        self.alias_keys: list[str] = []
+        self.alias_entry: list[int] = []
+        self.alias_jamo: list[str] = []
+        self.exact: dict[str, list[int]] = {}
+        postings: dict[str, list[int]] = {}
+        for entry_id, (name, aliases, url, _) in enumerate(entries):
+            keys = dict.fromkeys(k for k in (normalize(a) for a in [name, *aliases, host_alias(url) or ""]) if k)
+            for key in keys:
+                alias_id = len(self.alias_keys)
+                self.alias_keys.append(key)
+                self.alias_entry.append(entry_id)
+                self.exact.setdefault(key, []).append(alias_id)
+                jamo = to_jamo(key)
+                self.alias_jamo.append(jamo)
+                for gram in jamo_grams(jamo):
+                    postings.setdefault(gram, []).append(alias_id)
+        stop = max(50, int(len(self.alias_keys) * STOP_GRAM_RATIO))
+        self.grams = {gram: ids for gram, ids in postings.items() if len(ids) <= stop}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _match(self, alias_id: int, score: float, kind: str, span: tuple[int, int]) -> SiteMatch:
+        name, _, url, weight = self.entries[self.alias_entry[alias_id]]
+        return SiteMatch(name, url, self.alias_keys[alias_id], score, kind, weight, span)
+
+    def exact_matches(self, span_text: str, span: tuple[int, int]) -> list[SiteMatch]:
+        found = [self._match(a, EXACT_SCORE, "exact", span) for a in self.exact.get(span_text, ())]
+        stripped = strip_particle(span_text)
+        if stripped:
+            found += [self._match(a, EXACT_SCORE, "exact", span) for a in self.exact.get(stripped, ())]
+        return found
+
+    def fuzzy_matches(self, span_text: str, span: tuple[int, int], min_score: float = 0.0) -> list[SiteMatch]:
+        """
+        자모 3-gram 으로 후보 → 자모 편집 거리 유사도 / 부분 일치 점수 (min_score 미만은 버림).
+        유사도 s 이상이면 편집 거리 k ≤ (1-s)/s × 질의 길이이고, 편집 한 번은 질의 3-gram 을 최대 3개 깨뜨리므로
+        정답은 가장 드문 3k+1 개 gram 중 하나를 반드시 공유한다 - 흔한 gram(대학교, 센터...) 목록은 훑지 않음
+        """
+        jamo = to_jamo(strip_particle(span_text) or span_text)
+        if len(jamo) < MIN_FUZZY_JAMO:
+            return []
+        min_similarity = max(min_score / FUZZY_WEIGHT, MIN_FUZZY_SIMILARITY)
+        max_edits = int((1 - min_similarity) / min_similarity * len(jamo))
+        lists = sorted((self.grams[g] for g in jamo_grams(jamo) if g in self.grams), key=len)
+        shared = Counter()
+        # 부분 일치는 양 끝 gram 2개만 빠질 수 있으므로 최소 3개
+        for postings in lists[:max(3 * max_edits + 1, 3)]:
+            shared.update(postings)
+
+        found = []
+        for alias_id, _ in shared.most_common(MAX_FUZZY_CANDIDATES):
+            target = self.alias_jamo[alias_id]
+            longest = max(len(jamo), len(target))
+            if jamo in target:
+                # 긴 이름의 일부 (교통정보 ⊂ 국가교통정보센터) - 덮는 비율만큼, 짧은 일부(서울 ⊂ 서울시)는 기준 미만
+                similarity = 0.4 + 0.6 * len(jamo) / len(target)
+            else:
+                limit = int((1 - min_similarity) * longest)
+                similarity = 1 - edit_distance(jamo, target, limit) / longest
+            if similarity >= min_similarity:
+                found.append(self._match(alias_id, similarity * FUZZY_WEIGHT, "fuzzy", span))
+        return found
+
+
+def load_entries(paths: list[str]) -> list[tuple[str, list[str], str, float]]:
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip() or line.startswith("#"):
+                    continue
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) < 3 or not cols[2].strip():
+                    logger.warning(f"⚠️ 사이트 디렉토리 형식 오류 {path}:{line_no}")
+                    continue
+                try:
+                    weight = float(cols[3]) if len(cols) > 3 and cols[3].strip() else 1.0
+                except ValueError:
+                    weight = 1.0
+                aliases = [a.strip() for a in cols[1].split(",") if a.strip()]
+                entries.append((cols[0].strip(), aliases, cols[2].strip(), weight))
+    return entries
+
+
+# ============================
+# 디렉토리 (핫 리로드)
+# ============================
+class SiteDirectory:
+    def __init__(self, paths: list[str], threshold: float = 0.8, reload_interval: float = 10.0):
+        self.paths = paths
+        self.threshold = threshold
+        self.reload_interval = reload_interval
+        self.index: SiteIndex | None = None
+        self.loaded_mtime = 0.0
+        self.loaded_at = 0.0
+        self.build_seconds = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+        self._reloading = False
+
+    @classmethod
+    def from_env(cls) -> "SiteDirectory":
+        paths = [p.strip() for p in (os.getenv("SITE_DIRECTORY_PATH") or DEFAULT_PATH).split(",") if p.strip()]
+        return cls(paths, env_float("SITE_MATCH_THRESHOLD", 0.8), env_float("SITE_DIRECTORY_RELOAD", 10.0))
+
+    def _mtime(self) -> float:
+        try:
+            return max(os.path.getmtime(p) for p in self.paths)
+        except (OSError, ValueError):
+            return 0.0
+
+    def load(self) -> SiteIndex:
+        """파일을 읽어 새 색인을 만들고 교체 (실패하면 이전 색인 유지)"""
+        mtime = self._mtime()
+        started = time.perf_counter()
+        try:
+            index = SiteIndex(load_entries(self.paths))
+        except OSError as e:
+            logger.error(f"❌ 사이트 디렉토리 로드 실패: {e}")
+            index = self.index or SiteIndex([])
+        else:
+            self.build_seconds = time.perf_counter() - started
+            logger.info(f"🗂️ 사이트 디렉토리 로드: {len(index)}개 사이트, 별칭 {len(index.alias_keys)}개 "
+                        f"({self.build_seconds * 1000:.0f}ms)")
+        with self._lock:
+            self.index, self.loaded_mtime, self.loaded_at = index, mtime, time.time()
+        return index
+
+    def _reload_in_background(self):
+        try:
+            self.load()
+        finally:
+            self._reloading = False
+
+    def current(self) -> SiteIndex:
+        """현재 색인 - 첫 조회면 바로 로드, 이후에는 주기적으로 파일 변경을 확인해 백그라운드 리로드"""
+        if self.index is None:
+            with self._first_load:
+                if self.index is None:
+                    self.load()
+            return self.index
+        now = time.monotonic()
+        if self.reload_interval and now - self._checked_at >= self.reload_interval and not self._reloading:
+            self._checked_at = now
+            if self._mtime() > self.loaded_mtime:
+                self._reloading = True
+                logger.info("🔄 사이트 디렉토리 변경 감지 - 백그라운드 재색인")
+                threading.Thread(target=self._reload_in_background, daemon=True).start()
+        return self.index
+
+    def lookup(self, query: str, limit: int = 5, min_score: float = 0.0, exact_first: bool = False) -> list[SiteMatch]:
+        """
+        목표 문장 속 사이트 후보를 점수 순으로 (사이트당 최고 점수 하나).
+        exact_first=True 면 정확 일치가 있을 때 유사 일치를 건너뜀 (유사 일치는 항상 더 낮은 점수)
+        """
+        index = self.current()
+        words = query_words(query)
+        best: dict[str, SiteMatch] = {}
+
+        def offer(match: SiteMatch):
+            current = best.get(match.url)
+            if current is None or match.rank_key() > current.rank_key():
+                best[match.url] = match
+
+        spans = [(i, j) for i in range(len(words)) for j in range(i + 1, min(len(words), i + MAX_SPAN_WORDS) + 1)]
+        for i, j in spans:
+            for match in index.exact_matches("".join(words[i:j]), (i, j)):
+                offer(match)
+        if not (best and exact_first) and len(best) < limit:
+            for i, j in spans:
+                for match in index.fuzzy_matches("".join(words[i:j]), (i, j), min_score):
+                    offer(match)
+        ranked = sorted(best.values(), key=SiteMatch.rank_key, reverse=True)[:limit]
+        LOOKUPS.inc(result=ranked[0].kind if ranked and ranked[0].score >= self.threshold else "miss")
+        return ranked
+
+    def resolve(self, query: str, whole: bool = False) -> SiteMatch | None:
+        """
+        기준 점수 이상인 최고 후보. whole=True 면 일치 구간 밖의 단어가 "홈페이지/사이트" 같은
+        군더더기뿐일 때만 (검색어 "네이버 날씨" 를 네이버 이동으로 바꾸지 않도록)
+        """
+        for match in self.lookup(query, limit=3, min_score=self.threshold, exact_first=True):
+            if match.score < self.threshold:
+                break
+            if whole:
+                words = query_words(query)
+                rest = words[:match.span[0]] + words[match.span[1]:]
+                if any(w not in FILLER_WORDS and strip_particle(w) not in FILLER_WORDS for w in rest):
+                    continue
+            return match
+        return None
+
+    def stats(self) -> dict:
+        index = self.index
+        return {
+            "paths": self.paths,
+            "entries": len(index) if index else 0,
+            "aliases": len(index.alias_keys) if index else 0,
+            "build_ms": round(self.build_seconds * 1000, 1),
+            "loaded_at": self.loaded_at,
+            "threshold": self.threshold,
+        }
+
+
+site_directory = SiteDirectory.from_env()
+metrics.gauge("mcp_site_directory_entries", "사이트 디렉토리 항목 수",
+              lambda: len(site_directory.index) if site_directory.index else 0)
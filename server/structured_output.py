@@ -0,0 +1,385 @@
+"""
+스키마 기반 LLM 응답 파싱 (schema/mcp_schema.json)
+
+모델 호출 시 응답 종류별 JSON 스키마를 response_format 으로 요청하고,
+받은 텍스트는 시작 시 한 번 컴파일한 검증기로 확인한다.
+JSON 이 조금 깨졌으면(코드 펜스, 끝 쉼표, 작은따옴표, 따옴표 없는 키, 잘린 괄호) 로컬에서 고친 뒤
+스키마 기준으로 타입을 맞춰 다시 검증 → 파싱 실패로 한 단계(DOM 재캡처 + LLM 호출)를 버리는 일을 줄인다.
+
+응답 종류 (mcp_schema.json 의 액션 정의 + 프롬프트가 요구하는 필드):
+  plan        계획 배열 (response_format 은 루트가 객체여야 하므로 {"plan": [...]} 로 감싸 요청)
+  action      실행 액션 객체
+  chunk       청크 분석 액션 ("none" 허용)
+  evaluation  상황 평가 (status: completed | replan | continue)
+
+jsonschema 패키지 없이 이 저장소가 쓰는 키워드(type, enum, required, properties, items,
+minItems, minimum, maximum)만 지원한다.
+
+환경 변수:
+  LLM_STRUCTURED_OUTPUT   schema(기본) | json_object | off
+"""
+import os
+import re
+import json
+import logging
+from typing import Any, Callable
+
+from json_stream import scan_top_level_json
+from metrics import metrics
+
+logger = logging.getLogger("uvicorn.error")
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema", "mcp_schema.json")
+STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "schema").lower()
+
+PARSE_RESULTS = metrics.counter(
+    "mcp_llm_parse_total", "LLM 응답 파싱 결과 (result: ok|repaired|invalid)", ("kind", "result"))
+
+
+# ============================
+# 검증기 (시작 시 한 번 컴파일)
+# ============================
+_TYPE_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "null": lambda v: v is None,
+}
+
+Validator = Callable[[Any, str], list]
+
+
+def compile_schema(schema: dict) -> Validator:
+    """스키마 → validate(value, path) -> 오류 메시지 목록"""
+    checks: list[Callable[[Any, str, list], None]] = []
+
+    types = schema.get("type")
+    if types:
+        names = types if isinstance(types, list) else [types]
+        type_fns = [_TYPE_CHECKS[n] for n in names]
+
+        def check_type(value, path, errors):
+            if not any(fn(value) for fn in type_fns):
+                errors.append(f"{path}: {'|'.join(names)} 타입이어야 함")
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                errors.append(f"{path}: {value!r} 는 허용값 {allowed} 이 아님")
+        checks.append(check_enum)
+
+    for key, op in (("minimum", lambda v, b: v >= b), ("maximum", lambda v, b: v <= b)):
+        if key in schema:
+            bound = schema[key]
+
+            def check_bound(value, path, errors, key=key, op=op, bound=bound):
+                if _TYPE_CHECKS["number"](value) and not op(value, bound):
+                    errors.append(f"{path}: {key} {bound} 위반")
+            checks.append(check_bound)
+
+    properties = {k: compile_schema(v) for k, v in schema.get("properties", {}).items()}
+    required = list(schema.get("required", []))
+    if properties or required:
+        def check_object(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for key in required:
+                if key not in value:
+                    errors.append(f"{path}: 필수 필드 '{key}' 없음")
+            for key, validate in properties.items():
+                if key in value:
+                    errors.extend(validate(value[key], f"{path}.{key}"))
+        checks.append(check_object)
+
+    if "items" in schema or "minItems" in schema:
+        item_validator = compile_schema(schema["items"]) if "items" in schema else None
+        min_items = schema.get("minItems", 0)
+
+        def check_array(value, path, errors):
+            if not isinstance(value, list):
+                return
+            if len(value) < min_items:
+                errors.append(f"{path}: 최소 {min_items}개 필요")
+            if item_validator:
+                for i, item in enumerate(value):
+                    errors.extend(item_validator(item, f"{path}[{i}]"))
+        checks.append(check_array)
+
+    def validate(value, path: str = "$") -> list:
+        errors: list[str] = []
+        for check in checks:
+            check(value, path, errors)
+        return errors
+
+    return validate
+
+
+# ============================
+# 응답 스키마 (mcp_schema.json 에서 파생)
+# ============================
+def build_response_schemas(base: dict) -> dict[str, dict]:
+    step_props = dict(base["items"]["properties"])
+    message_action = base["message_types"]["action"]["properties"]["action"]["properties"]
+    for key, prop in message_action.items():
+        step_props.setdefault(key, {k: v for k, v in prop.items() if k != "description"})
+    actions = list(dict.fromkeys(base["items"]["properties"]["action"]["enum"] + message_action["action"]["enum"]))
+    step_props["action"] = {"type": "string", "enum": actions}
+    step_props["url"] = {"type": "string"}
+    step_props["reason"] = {"type": "string"}
+    step_props["confidence"] = {"type": "number", "minimum": 0, "maximum": 1}
+
+    # 액션 묶음: 첫 액션 뒤에 이어서 실행할 짧은 체인 - 각 액션은 실행 전 확인할 가드 조건을 가질 수 있음
+    guard = {"type": "object", "properties": {"selector": {"type": "string"}, "text": {"type": "string"},
+                                              "url": {"type": "string"}}}
+    next_actions = {"type": "array", "items": {"type": "object", "required": ["action"],
+                                               "properties": {**step_props, "guard": guard}}}
+    action = {"type": "object", "properties": {**step_props, "next_actions": next_actions}, "required": ["action"]}
+    chunk = {"type": "object", "required": ["action"],
+             "properties": {**step_props, "action": {"type": "string", "enum": actions + ["none", "no_action"]}}}
+    plan = {"type": "array", "minItems": 1,
+            "items": {"type": "object", "required": ["action"],
+                      "properties": {**step_props, "step": {"type": "integer"}}}}
+    evaluation = {
+        "type": "object",
+        "required": ["status"],
+        "properties": {
+            **step_props,
+            "status": {"type": "string", "enum": ["completed", "replan", "continue"]},
+            "evidence": {"type": "string"},
+            "new_plan_needed": {"type": "boolean"},
+            "next_actions": next_actions,
+        },
+    }
+    return {"plan": plan, "action": action, "chunk": chunk, "evaluation": evaluation}
+
+
+def _load_schemas() -> dict[str, dict]:
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        return build_response_schemas(json.load(f))
+
+
+RESPONSE_SCHEMAS = _load_schemas()
+VALIDATORS = {kind: compile_schema(schema) for kind, schema in RESPONSE_SCHEMAS.items()}
+
+# response_format 을 거절한 배포 (구버전 API / 미지원 모델) → 이후 호출은 형식 지정 없이
+_unsupported: set[str] = set()
+
+
+def response_format(kind: str | None, deployment: str) -> dict | None:
+    """chat.completions 의 response_format 인자 (끔 / 미지원 배포면 None)"""
+    if not kind or kind not in RESPONSE_SCHEMAS or STRUCTURED_OUTPUT == "off" or deployment in _unsupported:
+        return None
+    if STRUCTURED_OUTPUT == "json_object":
+        # json_object 는 루트가 객체여야 함 - 계획 배열은 지정하지 않음
+        return None if kind == "plan" else {"type": "json_object"}
+    schema = RESPONSE_SCHEMAS[kind]
+    if schema["type"] == "array":
+        schema = {"type": "object", "properties": {kind: schema}, "required": [kind]}
+    return {"type": "json_schema", "json_schema": {"name": f"mcp_{kind}", "schema": schema, "strict": False}}
+
+
+def mark_unsupported(deployment: str, error: Exception):
+    if deployment not in _unsupported:
+        _unsupported.add(deployment)
+        logger.error(f"🧾 {deployment}: response_format 미지원 - 스키마 없이 호출 ({error})")
+
+
+# ============================
+# 로컬 복구
+# ============================
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_UNQUOTED_KEY = re.compile(r'([{,]\s*)([A-Za-z_][\w-]*)\s*:')
+_PY_LITERALS = [(re.compile(r"\bTrue\b"), "true"), (re.compile(r"\bFalse\b"), "false"), (re.compile(r"\bNone\b"), "null")]
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+def _close_truncated(text: str) -> str:
+    """잘린 출력의 열린 문자열/괄호 닫기"""
+    stack, in_string, escape = [], False, False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append("]" if ch == "[" else "}")
+        elif ch in "]}" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",:")
+    return text + "".join(reversed(stack))
+
+
+def _candidate(text: str) -> str:
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    text = text.strip()
+    found = scan_top_level_json(text)
+    if found:
+        return found
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    return text[start:] if start >= 0 else text
+
+
+def _loads(text: str):
+    try:
+        return json.loads(text)
+    except (ValueError, TypeError):
+        return None
+
+
+def repair_json(text: str):
+    """근접한 JSON 텍스트를 단계적으로 고쳐 파싱 (실패 시 None)"""
+    candidate = _candidate(text)
+    fixes = [
+        lambda s: s.translate(_SMART_QUOTES),
+        lambda s: _TRAILING_COMMA.sub(r"\1", s),
+        lambda s: s.replace("'", '"') if '"' not in s else s,
+        lambda s: _UNQUOTED_KEY.sub(r'\1"\2":', s),
+        lambda s: _py_literals(s),
+        _close_truncated,
+        lambda s: _TRAILING_COMMA.sub(r"\1", s),
+    ]
+    for fix in fixes:
+        candidate = fix(candidate)
+        value = _loads(candidate)
+        if value is not None:
+            return value
+    return None
+
+
+def _py_literals(text: str) -> str:
+    for pattern, literal in _PY_LITERALS:
+        text = pattern.sub(literal, text)
+    return text
+
+
+# ============================
+# 스키마 기준 정규화
+# ============================
+def _coerce(value, schema: dict):
+    """타입이 어긋난 스칼라를 스키마 타입으로 (변환 불가면 그대로)"""
+    expected = schema.get("type")
+    try:
+        if expected == "integer" and isinstance(value, (str, float)) and not isinstance(value, bool):
+            return int(float(value))
+        if expected == "number" and isinstance(value, str):
+            return float(value)
+        if expected == "string" and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        if expected == "boolean" and isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+    except ValueError:
+        return value
+    if "enum" in schema and isinstance(value, str) and value not in schema["enum"]:
+        lowered = {str(e).lower(): e for e in schema["enum"]}
+        return lowered.get(value.strip().lower(), value)
+    return value
+
+
+def _object_schema(kind: str) -> dict:
+    schema = RESPONSE_SCHEMAS[kind]
+    return schema["items"] if schema["type"] == "array" else schema
+
+
+# 필드별 검증기도 시작 시 한 번만 컴파일
+_FIELD_VALIDATORS = {
+    kind: {key: compile_schema(prop) for key, prop in _object_schema(kind)["properties"].items()}
+    for kind in RESPONSE_SCHEMAS
+}
+
+
+def _normalize_object(obj: dict, kind: str) -> dict:
+    schema = _object_schema(kind)
+    props, fields = schema["properties"], _FIELD_VALIDATORS[kind]
+    required = set(schema.get("required", []))
+    result = {}
+    for key, value in obj.items():
+        if key not in props:
+            result[key] = value
+            continue
+        value = _coerce(value, props[key])
+        if fields[key](value) and key not in required:
+            continue  # 고칠 수 없는 선택 필드는 버림
+        result[key] = value
+    return result
+
+
+def unwrap(value, kind: str):
+    """응답 모양 맞추기 - {"plan": [...]} / {"steps": [...]} 해제, 단일 객체 ↔ 배열"""
+    if RESPONSE_SCHEMAS[kind]["type"] == "array":
+        if isinstance(value, dict):
+            inner = value.get(kind) or value.get("steps")
+            value = inner if isinstance(inner, list) else [value]
+        return value
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return value[0]
+    return value
+
+
+def normalize(value, kind: str):
+    """모양 맞춘 뒤 필드 타입 변환"""
+    value = unwrap(value, kind)
+    if isinstance(value, list):
+        return [_normalize_object(v, kind) if isinstance(v, dict) else v for v in value]
+    if isinstance(value, dict):
+        return _normalize_object(value, kind)
+    return value
+
+
+class ParseResult:
+    def __init__(self, value=None, repaired: bool = False, errors: list | None = None):
+        self.value = value
+        self.repaired = repaired
+        self.errors = errors or []
+
+    @property
+    def ok(self) -> bool:
+        return self.value is not None and not self.errors
+
+
+def parse_structured(text: str | None, kind: str, record: bool = True) -> ParseResult:
+    """LLM 응답 → 검증된 값. 그대로 파싱 → 로컬 복구 → 정규화 후 재검증 순서
+
+    record=False 면 메트릭/로그를 남기지 않음 (캐스케이드의 채택 판단처럼 같은 응답을 다시 파싱할 때)
+    """
+    if not text:
+        return ParseResult(errors=["응답 없음"])
+    validate = VALIDATORS[kind]
+    raw = scan_top_level_json(text)
+    value = unwrap(_loads(raw), kind) if raw else None
+    if value is not None and not validate(value):
+        if record:
+            PARSE_RESULTS.inc(kind=kind, result="ok")
+        return ParseResult(value)
+
+    if value is None:
+        value = repair_json(text)
+    if value is not None:
+        value = normalize(value, kind)
+        errors = validate(value)
+        if not errors:
+            if record:
+                PARSE_RESULTS.inc(kind=kind, result="repaired")
+                logger.info(f"🩹 {kind} 응답 로컬 복구 성공")
+            return ParseResult(value, repaired=True)
+    else:
+        errors = ["JSON 을 찾을 수 없음"]
+    if record:
+        PARSE_RESULTS.inc(kind=kind, result="invalid")
+        logger.error(f"❌ {kind} 응답 스키마 불일치: {errors[:3]}")
+    return ParseResult(None, errors=errors)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# server/ 모듈은 평면 구조라 server 디렉토리를 경로에 추가
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,25 @@
+import asyncio
+import importlib
+
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # app 은 import 시 작업 디렉토리에 logs/ debug_images/ 를 만듦
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module("app")
+
+
+@pytest.mark.parametrize("raw, expected", [('"0.9"', 0.9), ("null", 0.5), ('"high"', 0.5), ("0.7", 0.7)])
+def test_chunk_confidence_coerced(app, monkeypatch, raw, expected):
+    async def fake_llm(prompt, schema=None, **kwargs):
+        return '{"action":"click","selector":"#go","confidence":%s}' % raw
+
+    monkeypatch.setattr(app, "call_llm", fake_llm)
+    candidate, _ = asyncio.run(app.analyze_single_chunk([{"tag": "button"}], 0, "prompt", None))
+    assert candidate["confidence"] == expected
+    assert candidate["action"]["confidence"] == expected
+    # 조기 종료 비교 / 후보 정렬이 TypeError 없이 동작
+    assert app._best_confidence([candidate, dict(candidate, confidence=0.1)]) == expected
+    app.select_best_action([candidate, {"action": {"action": "click", "confidence": 0.2}}], "goal")
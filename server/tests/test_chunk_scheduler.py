@@ -0,0 +1,21 @@
+from chunk_scheduler import _viewport_score
+
+VIEWPORT = {"top": 2000, "height": 800}
+
+
+def test_page_position_is_converted_with_viewport():
+    # 화면 가운데(2000 + 400) 요소가 최고점, 화면 위/아래 끝은 0
+    assert _viewport_score({"py": 2400}, None, None, VIEWPORT) == 1.0
+    assert _viewport_score({"py": 2000}, None, None, VIEWPORT) == 0.0
+    assert _viewport_score({"py": 2800}, None, None, VIEWPORT) == 0.0
+
+
+def test_scroll_only_changes_viewport_not_element():
+    el = {"py": 2400}
+    assert _viewport_score(el, None, None, {"top": 2000, "height": 800}) > \
+        _viewport_score(el, None, None, {"top": 2300, "height": 800})
+
+
+def test_falls_back_to_region_without_viewport():
+    assert _viewport_score({"py": 2400}, None, "footer", None) == _viewport_score({}, None, "footer", None)
+    assert _viewport_score({"vy": 0.5}, None, "footer", None) == 1.0
@@ -0,0 +1,30 @@
+import io
+
+from PIL import Image
+
+import imaging
+from imaging import prepare_image
+
+
+def _png(color) -> bytes:
+    buf = io.BytesIO()
+    img = Image.new("RGB", (1200, 800), "white")
+    img.paste(color, (0, 0, 600, 400))
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_dedup_off_by_default():
+    assert imaging.IMAGE_DEDUP == "off"
+    first = prepare_image(_png("black"))
+    again = prepare_image(_png("black"), previous_hash=first.phash)
+    assert not again.reused
+
+
+def test_dedup_requires_unchanged_dom():
+    first = prepare_image(_png("black"), dedup="low")
+    # 같은 화면이라도 DOM 이 바뀐 단계(입력값 채움 등)는 원래 해상도 그대로
+    changed = prepare_image(_png("black"), previous_hash=first.phash, dedup="low", dom_unchanged=False)
+    assert not changed.reused and changed.detail != "low"
+    same = prepare_image(_png("black"), previous_hash=first.phash, dedup="low", dom_unchanged=True)
+    assert same.reused and same.detail == "low"
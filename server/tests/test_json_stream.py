@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from json_stream import JsonStreamScanner, scan_top_level_json
+
+PLAN = [{"step": 1, "action": "fill", "description": "검색어 입력"},
+        {"step": 2, "action": "click", "description": "검색 버튼 클릭"}]
+PLAN_TEXT = json.dumps(PLAN, ensure_ascii=False)
+ACTION_TEXT = '{"action": "click", "selector": "#go", "reason": "검색 [버튼] 클릭"}'
+
+
+def stream(text: str, size: int = 1) -> str | None:
+    scanner = JsonStreamScanner()
+    for i in range(0, len(text), size):
+        found = scanner.feed(text[i:i + size])
+        if found:
+            return found
+    return None
+
+
+@pytest.mark.parametrize("response", [
+    PLAN_TEXT,
+    f"```json\n{PLAN_TEXT}\n```",
+    f"Here is the plan:\n{PLAN_TEXT}",
+    f"계획입니다.\n```json\n{PLAN_TEXT}\n```\n이상입니다.",
+])
+def test_fenced_and_prefaced_arrays_keep_every_step(response):
+    assert json.loads(scan_top_level_json(response)) == PLAN
+    assert json.loads(stream(response)) == PLAN
+
+
+@pytest.mark.parametrize("response", [
+    ACTION_TEXT,
+    f"```json\n{ACTION_TEXT}\n```",
+    f"Based on element [e12] I will click: {ACTION_TEXT}",
+])
+def test_objects_after_prose_brackets(response):
+    assert json.loads(stream(response, size=3)) == json.loads(ACTION_TEXT)
+
+
+def test_bracket_split_across_chunks():
+    scanner = JsonStreamScanner()
+    assert scanner.feed("plan: [") is None
+    assert scanner.feed(" ") is None
+    assert scanner.feed(PLAN_TEXT[1:]) == "[ " + PLAN_TEXT[1:]
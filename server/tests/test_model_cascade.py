@@ -0,0 +1,19 @@
+import pytest
+
+from model_cascade import ModelCascade
+
+cascade = ModelCascade(["small", "large"], ["small-vision", "large-vision"], min_confidence=0.75)
+
+
+@pytest.mark.parametrize("schema, text, accepted", [
+    ("action", '{"action": "click", "selector": "#go", "confidence": 0.9}', True),
+    ("action", '{"action": "click", "selector": "#go", "confidence": 0.4}', False),
+    # 스크린샷 프롬프트 응답에 confidence 가 빠지면 낮은 것으로 보고 올림
+    ("action", '{"action": "click", "selector": "#go"}', False),
+    ("evaluation", '{"status": "completed", "reason": "ok", "evidence": "x"}', False),
+    ("evaluation", '{"status": "completed", "reason": "ok", "evidence": "x", "confidence": "0.8"}', True),
+    ("plan", '[{"step": 1, "action": "click", "selector": "#go"}]', True),
+    ("action", "not json", False),
+])
+def test_accept(schema, text, accepted):
+    assert cascade.accept(schema, text)[0] is accepted
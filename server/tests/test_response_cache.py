@@ -0,0 +1,38 @@
+import os
+import asyncio
+
+import response_cache
+from response_cache import ResponseCache
+
+
+def test_disk_writes_are_off_loop_and_incremental(tmp_path, monkeypatch):
+    listdir_calls = []
+    real_listdir = os.listdir
+    monkeypatch.setattr(response_cache.os, "listdir", lambda p: listdir_calls.append(p) or real_listdir(p))
+
+    async def main():
+        cache = ResponseCache(max_entries=2, disk_dir=str(tmp_path), disk_max_bytes=10_000)
+        for i in range(60):
+            cache.put(f"k{i}", "x" * 400)
+        await cache.wait_writes()
+        return cache
+
+    cache = asyncio.run(main())
+    files = [n for n in real_listdir(tmp_path) if n.endswith(".json")]
+    # 크기 상한 안으로 오래된 파일부터 정리, 디렉토리 훑기는 첫 쓰기 한 번뿐
+    assert sum(os.path.getsize(tmp_path / n) for n in files) <= 10_000
+    assert len(listdir_calls) == 1
+    assert not [n for n in real_listdir(tmp_path) if n.endswith(".tmp")]
+    # 메모리 LRU 에서 밀려난 최신 항목은 디스크에서 읽힘
+    assert cache.get("k59") == "x" * 400
+    assert cache.get("k0") is None
+
+
+def test_expired_file_removed_once(tmp_path):
+    cache = ResponseCache(max_entries=1, ttl=-1, disk_dir=str(tmp_path))
+    cache.put("a", "1")
+    cache._memory.clear()
+    assert cache.get("a") is None
+    assert not (tmp_path / "a.json").exists()
+    # 다른 워커가 먼저 지운 파일을 다시 지워도 예외 없음
+    cache._disk_remove(str(tmp_path / "a.json"))
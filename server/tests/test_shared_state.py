@@ -0,0 +1,51 @@
+import asyncio
+
+from shared_state import LocalBackend, SQLiteBackend, RedisBackend
+from redis_standin import RedisStandin, serve
+
+
+def test_local_purges_expired_and_caps_ttl_keys():
+    async def main():
+        backend = LocalBackend(max_keys=100, purge_interval=0)
+        await backend.set("metrics:w1", "1")            # TTL 없음 - 상한/정리 대상 아님
+        for i in range(50):
+            await backend.incr(f"rl:gpt:req:{i}", 1, ttl=0.01)
+        await asyncio.sleep(0.02)
+        await backend.set("cache:a", "x", ttl=60)
+        assert len(backend._data) == 2
+        for i in range(500):
+            await backend.set(f"cache:{i}", "x", ttl=60)
+        assert backend._ttl_keys <= 100
+        assert await backend.get("metrics:w1") == "1"
+        assert await backend.get("cache:499") == "x"
+    asyncio.run(main())
+
+
+def test_sqlite_purges_expired_rows(tmp_path):
+    async def main():
+        backend = SQLiteBackend(str(tmp_path / "shared.db"), purge_interval=0)
+        await backend.incr("rl:gpt:req:1", 1, ttl=0.01)
+        await backend.set("cache:a", "x", ttl=0.01)
+        await asyncio.sleep(0.02)
+        await backend.set("cache:b", "y", ttl=60)
+        rows = await backend._execute("SELECT key FROM kv")
+        await backend.close()
+        return [r[0] for r in rows]
+    assert asyncio.run(main()) == ["cache:b"]
+
+
+def test_redis_scan_pages_through_keys():
+    async def main():
+        standin = RedisStandin()
+        server = await serve("127.0.0.1", 0, standin)
+        port = server.sockets[0].getsockname()[1]
+        backend = RedisBackend("127.0.0.1", port)
+        for i in range(1200):
+            await backend.set(f"metrics:{i}", str(i))
+        await backend.set("cache:x", "1", ttl=60)
+        found = await backend.scan("metrics:")
+        await backend.close()
+        server.close()
+        return found
+    found = asyncio.run(main())
+    assert len(found) == 1200 and found["metrics:7"] == "7"
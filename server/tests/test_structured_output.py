@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from structured_output import parse_structured
+
+PLAN = [{"step": 1, "action": "fill", "description": "검색어 입력"},
+        {"step": 2, "action": "click", "description": "검색 버튼 클릭"}]
+PLAN_TEXT = json.dumps(PLAN, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("response", [
+    f"```json\n{PLAN_TEXT}\n```",
+    f"Here is the plan:\n{PLAN_TEXT}",
+    f"Here is the plan:\n```json\n{PLAN_TEXT}\n```",
+])
+def test_fenced_and_prefaced_plans_keep_every_step(response):
+    result = parse_structured(response, "plan", record=False)
+    assert result.ok
+    assert result.value == PLAN
+
+
+def test_fenced_plan_with_trailing_comma_is_repaired():
+    response = f"```json\n{PLAN_TEXT[:-1]},]\n```"
+    result = parse_structured(response, "plan", record=False)
+    assert result.ok and len(result.value) == 2
+
+
+def test_prefaced_action_object():
+    response = 'I will click [e3]:\n{"action": "click", "selector": "#go", "reason": "검색"}'
+    result = parse_structured(response, "action", record=False)
+    assert result.ok and result.value["selector"] == "#go"
@@ -0,0 +1,67 @@
+import json
+import asyncio
+
+from workflows import WorkflowRecorder, WorkflowStore
+
+DOM = [{"tag": "input", "selector": "#q", "text": ""}, {"tag": "button", "selector": "#go", "text": "검색"}]
+GOAL = "정부24 주민등록등본 발급"
+URL = "https://www.gov.kr/portal/main"
+
+
+def run(recorder, messages, allow_replay=True, session_id="s1"):
+    """(종류, 보낸 메시지) 순서대로 observe → sent"""
+    for kind, message in messages:
+        replay = recorder.observe(session_id, GOAL, kind, URL, DOM, allow_replay=allow_replay)
+        recorder.sent(session_id, replay or message, replayed=replay is not None)
+
+
+def make_recorder(tmp_path):
+    return WorkflowRecorder(WorkflowStore(str(tmp_path / "workflows.json")))
+
+
+def test_failed_chunk_run_is_not_saved(tmp_path):
+    recorder = make_recorder(tmp_path)
+    # 청크 분석이 후보를 못 찾으면 app.py 는 실행 단계에서 {"type": "end"} 를 보냄
+    run(recorder, [("plan", {"type": "plan", "plan": [{"step": 1, "action": "fill"}]}),
+                   ("execute", {"type": "end"})])
+    assert recorder.store.get(GOAL) is None
+    assert not (tmp_path / "workflows.json").exists()
+
+
+def test_completed_run_is_saved_and_replayed(tmp_path):
+    recorder = make_recorder(tmp_path)
+    messages = [("plan", {"type": "plan", "plan": [{"step": 1, "action": "click"}]}),
+                ("execute", {"type": "action", "step": 1, "action": {"action": "click", "selector": "#go"}}),
+                ("evaluate", {"type": "completed", "reason": "done", "evidence": ""})]
+    run(recorder, messages)
+    assert len(recorder.store.get(GOAL)["steps"]) == 3
+    run(recorder, messages, session_id="s2")
+    assert recorder.replayed_steps == 3
+    assert json.loads((tmp_path / "workflows.json").read_text(encoding="utf-8"))
+
+
+def test_replay_false_skips_recording(tmp_path):
+    recorder = make_recorder(tmp_path)
+    run(recorder, [("plan", {"type": "plan", "plan": []}),
+                   ("evaluate", {"type": "completed", "reason": "done", "evidence": ""})], allow_replay=False)
+    assert recorder.store.get(GOAL) is None
+
+
+def test_store_ignores_saved_end_runs(tmp_path):
+    path = tmp_path / "workflows.json"
+    step = {"kind": "execute", "url_pattern": "www.gov.kr/portal/main", "dom_fp": "x"}
+    path.write_text(json.dumps({
+        "a": {"goal": "a", "steps": [{**step, "message": {"type": "end"}}]},
+        "b": {"goal": "b", "steps": [{**step, "message": {"type": "completed"}}]},
+    }), encoding="utf-8")
+    assert list(WorkflowStore(str(path)).workflows) == ["b"]
+
+
+def test_flush_runs_off_loop(tmp_path):
+    async def main():
+        recorder = make_recorder(tmp_path)
+        run(recorder, [("plan", {"type": "plan", "plan": []}),
+                       ("evaluate", {"type": "completed", "reason": "done", "evidence": ""})])
+        await recorder.store.wait_flushed()
+        return json.loads((tmp_path / "workflows.json").read_text(encoding="utf-8"))
+    assert len(asyncio.run(main())) == 1
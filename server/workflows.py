@@ -0,0 +1,236 @@
+"""
+기록된 워크플로우 재생
+
+정부24, 국세청, 네이버 같은 사이트는 같은 목표를 같은 단계로 반복 수행한다.
+평가 단계가 completed 로 확인한 실행의 단계별 (종류, URL 패턴, DOM 구조 지문, 서버가 보낸 메시지)를
+저장해 두고, 같은 목표가 다시 들어오면 각 단계에서 URL 패턴과 DOM 지문이 일치할 때
+LLM 호출 없이 기록된 메시지를 그대로 보낸다. 일치하지 않는 단계만 LLM 으로 처리한다.
+
+세션 구분: extension 은 페이지 이동마다 WebSocket 을 다시 연결하므로 연결 단위가 아니라
+context.sessionId + 목표 기준으로 진행 중인 기록을 유지한다.
+
+실행 단계의 "end"(청크 분석 실패, 모델이 더 할 동작을 못 찾음 등)는 성공이 아니므로 저장하지 않는다.
+
+WORKFLOW_REPLAY=0 이면 비활성화, 요청 단위로는 payload 의 "replay": false 로 재생과 기록 모두 우회.
+저장은 워커 스레드에서 하고, 저장 중에 바뀐 내용은 끝난 뒤 한 번 더 저장한다.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from llm_client import env_int
+from response_cache import normalize_text, dom_fingerprint
+
+logger = logging.getLogger("uvicorn.error")
+
+# 재생 가능한 메시지 종류 / 기록을 저장하는 성공 종료 메시지 / 저장 없이 기록을 버리는 종료 메시지
+RECORDED_TYPES = {"plan", "action", "actions", "end", "completed", "replan"}
+SUCCESS_TYPES = {"completed"}
+DISCARD_TYPES = {"end", "replan"}
+
+_ID_SEGMENT_RE = re.compile(r"^(\d+|[0-9a-f]{8,}|[0-9a-f-]{32,})$", re.IGNORECASE)
+
+
+def url_pattern(url: str | None) -> str:
+    """host + 경로 (쿼리/해시 제거, 숫자·해시 형태 경로 조각은 *)"""
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    segments = ["*" if _ID_SEGMENT_RE.match(seg) else seg for seg in parts.path.split("/") if seg]
+    return f"{parts.netloc.lower()}/{'/'.join(segments)}"
+
+
+def step_fingerprint(dom_summary: list) -> str:
+    """페이지 텍스트(뉴스, 날짜 등)는 매번 바뀌므로 태그/selector 구조만 비교"""
+    return dom_fingerprint(dom_summary, with_text=False)
+
+
+class WorkflowStore:
+    """목표(정규화) → 기록된 단계 목록. JSON 파일 하나에 저장"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.workflows: dict[str, dict] = {}
+        self._dirty = False
+        self._flushing: asyncio.Task | None = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                workflows = json.load(f)
+            # 이전 버전이 실행 단계 "end" 로 끝난 실행도 저장했으므로 completed 로 끝난 기록만 사용
+            self.workflows = {key: wf for key, wf in workflows.items()
+                              if wf.get("steps") and wf["steps"][-1]["message"].get("type") in SUCCESS_TYPES}
+            logger.info(f"📼 워크플로우 {len(self.workflows)}개 로드: {self.path}")
+        except FileNotFoundError:
+            self.workflows = {}
+        except (OSError, ValueError) as e:
+            logger.error(f"워크플로우 파일 로드 실패: {e}")
+            self.workflows = {}
+
+    def _flush(self, workflows: dict):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(workflows, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.error(f"워크플로우 저장 실패: {e}")
+
+    def _schedule_flush(self):
+        """이벤트 루프에서는 워커 스레드 저장 예약 (진행 중이면 끝난 뒤 다시), 루프 밖(스크립트)에서는 바로 저장"""
+        self._dirty = True
+        if self._flushing is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._dirty = False
+            self._flush(dict(self.workflows))
+            return
+        self._flushing = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        try:
+            while self._dirty:
+                self._dirty = False
+                # 항목은 통째로 교체되고 replays 숫자만 제자리에서 바뀌므로 얕은 복사로 충분
+                await asyncio.to_thread(self._flush, dict(self.workflows))
+        finally:
+            self._flushing = None
+
+    async def wait_flushed(self):
+        """종료 시 예약된 저장 마무리"""
+        if self._flushing is not None:
+            await self._flushing
+
+    def get(self, goal: str) -> dict | None:
+        return self.workflows.get(normalize_text(goal))
+
+    def save(self, goal: str, steps: list):
+        key = normalize_text(goal)
+        previous = self.workflows.get(key, {})
+        self.workflows[key] = {
+            "goal": goal,
+            "steps": steps,
+            "recorded_at": time.time(),
+            "replays": previous.get("replays", 0),
+        }
+        self._schedule_flush()
+        logger.info(f"📼 워크플로우 저장: '{goal}' ({len(steps)} 단계)")
+
+    def mark_replayed(self, goal: str):
+        workflow = self.get(goal)
+        if workflow:
+            workflow["replays"] = workflow.get("replays", 0) + 1
+            self._schedule_flush()
+
+
+class WorkflowRecorder:
+    """세션별 진행 중인 기록 + 기록된 워크플로우와의 단계 대조"""
+
+    def __init__(self, store: WorkflowStore, enabled: bool = True, session_ttl: float = 3600.0):
+        self.store = store
+        self.enabled = enabled
+        self.session_ttl = session_ttl
+        self._sessions: dict[str, dict] = {}
+        self.replayed_steps = 0
+        self.llm_steps = 0
+
+    @classmethod
+    def from_env(cls) -> "WorkflowRecorder":
+        return cls(
+            WorkflowStore(os.getenv("WORKFLOW_STORE", os.path.join("workflows", "workflows.json"))),
+            enabled=os.getenv("WORKFLOW_REPLAY", "1") != "0",
+            session_ttl=env_int("WORKFLOW_SESSION_TTL", 3600),
+        )
+
+    def _session(self, session_id: str, goal: str, restart: bool) -> dict:
+        now = time.time()
+        for sid in [s for s, rec in self._sessions.items() if now - rec["updated"] > self.session_ttl]:
+            del self._sessions[sid]
+        rec = self._sessions.get(session_id)
+        if restart or rec is None or rec["goal"] != normalize_text(goal):
+            rec = {"goal": normalize_text(goal), "raw_goal": goal, "steps": [], "pending": None}
+            self._sessions[session_id] = rec
+        rec["updated"] = now
+        return rec
+
+    def observe(self, session_id: str | None, goal: str, kind: str, url: str | None, dom_summary: list,
+                allow_replay: bool = True) -> dict | None:
+        """DOM 수신 시 호출 - 이 단계가 기록과 일치하면 재생할 메시지 반환.
+        allow_replay=False("replay": false) 면 이 목표 실행은 재생도 기록도 하지 않음 (다음 plan 부터 다시 기록)"""
+        if not self.enabled or not session_id:
+            return None
+        rec = self._session(session_id, goal, restart=(kind == "plan"))
+        if not allow_replay:
+            rec["skip"] = True
+        if rec.get("skip"):
+            rec["pending"] = None
+            return None
+        pending = {"kind": kind, "url_pattern": url_pattern(url), "dom_fp": step_fingerprint(dom_summary)}
+        rec["pending"] = pending
+
+        workflow = self.store.get(goal)
+        cursor = len(rec["steps"])
+        if not workflow or cursor >= len(workflow["steps"]):
+            return None
+        recorded = workflow["steps"][cursor]
+        if (recorded["kind"], recorded["url_pattern"], recorded["dom_fp"]) != (kind, pending["url_pattern"], pending["dom_fp"]):
+            logger.info(f"📼 워크플로우 단계 {cursor} 불일치 - LLM 처리 ({recorded['url_pattern']} vs {pending['url_pattern']})")
+            return None
+        message = recorded["message"]
+        first = message.get("action") or (message.get("actions") or [{}])[0]
+        selector = first.get("selector")
+        if selector and not any(el.get("selector") == selector for el in dom_summary):
+            logger.info(f"📼 워크플로우 단계 {cursor} 대상 요소 없음 - LLM 처리 ({selector})")
+            return None
+        return json.loads(json.dumps(message))
+
+    def sent(self, session_id: str | None, message: dict, replayed: bool = False):
+        """단계 결과 메시지 전송 후 호출 - 기록에 추가하고 성공 종료면 저장"""
+        if not self.enabled or not session_id or message.get("type") not in RECORDED_TYPES:
+            return
+        rec = self._sessions.get(session_id)
+        if not rec or not rec.get("pending"):
+            return
+        if replayed:
+            self.replayed_steps += 1
+        else:
+            self.llm_steps += 1
+        rec["steps"].append({**rec["pending"], "message": message, "replayed": replayed})
+        rec["pending"] = None
+
+        if message["type"] in DISCARD_TYPES:
+            # 계획이 틀어졌거나(replan) 평가 확인 없이 실행 단계에서 끝난(end) 실행은 기록하지 않음
+            del self._sessions[session_id]
+        elif message["type"] in SUCCESS_TYPES:
+            if all(step.get("replayed") for step in rec["steps"]) and self.store.get(rec["raw_goal"]):
+                self.store.mark_replayed(rec["raw_goal"])
+            else:
+                self.store.save(rec["raw_goal"], [{k: v for k, v in step.items() if k != "replayed"} for step in rec["steps"]])
+            del self._sessions[session_id]
+
+    def stats(self) -> dict:
+        total = self.replayed_steps + self.llm_steps
+        return {
+            "workflows": len(self.store.workflows),
+            "replayed_steps": self.replayed_steps,
+            "llm_steps": self.llm_steps,
+            "replay_rate": round(self.replayed_steps / total, 3) if total else 0.0,
+            "active_recordings": len(self._sessions),
+        }
+
+
+workflow_recorder = WorkflowRecorder.from_env()
@@ -0,0 +1,105 @@
+"""
+/ws 바이너리 프레임 프로토콜 (선택, 협상)
+
+연결 직후 extension 이 {"type": "hello", "protocols": ["binary-v1"]} 를 보내고
+서버가 {"type": "hello_ack", "protocol": "binary-v1"} 로 답하면 DOM 메시지를 바이너리 프레임으로 보낸다.
+협상하지 않은 클라이언트는 기존 JSON 텍스트 프로토콜 그대로. 서버 → 클라이언트는 항상 JSON 텍스트.
+
+프레임 (big-endian):
+  "MB" | version(1B) | flags(1B) | header_len(u32) | header | [attachment_len(u32) | attachment]...
+
+  flags bit0  header 가 deflate(zlib) 압축됨
+  header      JSON (UTF-8). 요소 목록은 열 이름 + 행 배열의 컴팩트 형태:
+                {"dom_columns": ["tag", "selector", ...], "dom_rows": [["a", "a.link", ...], ...]}
+              "attachments": ["image"] 는 뒤따르는 첨부 순서 - 스크린샷은 base64 없이 원본 바이트
+
+WS_BINARY_PROTOCOL=0 이면 hello 에 "json" 으로 답해 모든 클라이언트가 JSON 텍스트를 쓴다.
+"""
+import os
+import json
+import zlib
+import struct
+
+BINARY_PROTOCOL = "binary-v1"
+WS_BINARY_PROTOCOL = os.getenv("WS_BINARY_PROTOCOL", "1") != "0"
+MAGIC = b"MB"
+VERSION = 1
+FLAG_DEFLATE = 0x01
+
+_HEADER = struct.Struct(">2sBBI")
+_LEN = struct.Struct(">I")
+
+
+class FrameError(ValueError):
+    """바이너리 프레임 형식 오류"""
+
+
+def compact_dom(dom: list) -> tuple[list, list]:
+    """요소 dict 목록 → (열 이름, 행 배열). 값이 없는 칸은 None"""
+    columns: list[str] = []
+    seen = set()
+    for el in dom:
+        for key in el:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    rows = [[el.get(c) for c in columns] for el in dom]
+    return columns, rows
+
+
+def expand_dom(columns: list, rows: list) -> list:
+    return [{c: v for c, v in zip(columns, row) if v is not None} for row in rows]
+
+
+def encode_frame(payload: dict, compress: bool = True) -> bytes:
+    """서버 쪽 인코더 (벤치마크 / 테스트 클라이언트용 - extension content.js 와 같은 형식)"""
+    header = {k: v for k, v in payload.items() if k not in ("dom", "image")}
+    attachments = []
+    if isinstance(payload.get("dom"), list):
+        header["dom_columns"], header["dom_rows"] = compact_dom(payload["dom"])
+    if isinstance(payload.get("image"), (bytes, bytearray)):
+        header["attachments"] = ["image"]
+        attachments.append(bytes(payload["image"]))
+    body = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_DEFLATE
+    parts = [_HEADER.pack(MAGIC, VERSION, flags, len(body)), body]
+    for data in attachments:
+        parts.append(_LEN.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def decode_frame(data: bytes) -> dict:
+    """바이너리 프레임 → JSON 프로토콜과 같은 payload dict (image 는 bytes)"""
+    if len(data) < _HEADER.size:
+        raise FrameError("프레임이 너무 짧음")
+    magic, version, flags, header_len = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise FrameError(f"알 수 없는 프레임 (magic={magic!r}, version={version})")
+    offset = _HEADER.size
+    body = data[offset:offset + header_len]
+    if len(body) != header_len:
+        raise FrameError("헤더 길이 불일치")
+    offset += header_len
+    try:
+        if flags & FLAG_DEFLATE:
+            body = zlib.decompress(body)
+        payload = json.loads(body)
+    except (zlib.error, ValueError) as e:
+        raise FrameError(f"헤더 해석 실패: {e}") from e
+
+    if "dom_columns" in payload:
+        payload["dom"] = expand_dom(payload.pop("dom_columns"), payload.pop("dom_rows", []))
+    for name in payload.pop("attachments", []):
+        if offset + _LEN.size > len(data):
+            raise FrameError(f"첨부 '{name}' 누락")
+        (size,) = _LEN.unpack_from(data, offset)
+        offset += _LEN.size
+        if offset + size > len(data):
+            raise FrameError(f"첨부 '{name}' 길이 불일치")
+        payload[name] = data[offset:offset + size]
+        offset += size
+    return payload